@@ -1,3 +1,5 @@
 from lilgym.envs.natural_language_visual_reasoning_env import (
     NaturalLanguageVisualReasoningEnv,
 )
+from lilgym.envs.vector_env import LilGymVectorEnv
+from lilgym.envs.structured_rep_compact import CompactImage
@@ -2,6 +2,7 @@ from typing import List
 import itertools
 import numpy as np
 
+from gymnasium.spaces import Discrete
 from gymnasium.spaces.space import Space
 
 from lilgym.envs.action_spaces import TOWER_DEFAULT_ACTIONS, SCATTER_DEFAULT_ACTIONS
@@ -31,6 +32,15 @@ SCATTER_MULTI_ITEM = [3, 3, 3]
 SCATTER_MULTI = [3] + SCATTER_MULTI_COORD + SCATTER_MULTI_ITEM
 
 
+# Flat action IDs: the i-th default action has the ID i, and its array representation is
+# the i-th row of the tables below, so that (batches of) IDs are decoded with a single
+# gather.
+TOWER_DEFAULT_ACTION_ARRAYS = np.stack([a.to_array() for a in TOWER_DEFAULT_ACTIONS])
+SCATTER_DEFAULT_ACTION_ARRAYS = np.stack(
+    [a.to_array() for a in SCATTER_DEFAULT_ACTIONS]
+)
+
+
 class TowerActionSpace(Space):
     def __init__(self, seed=None):
         self._action_space = TOWER_DEFAULT_ACTIONS
@@ -43,8 +53,14 @@ class TowerActionSpace(Space):
     def get_actions_dim(self):
         return self.actions_dim
 
-    def sample(self):
-        return self.np_random.choice(self._action_space)
+    def sample(self, mask=None):
+        """
+        Samples a default action, among the valid ones if a mask is given (cf.
+        `action_mask`).
+        """
+        if mask is None:
+            return self.np_random.choice(self._action_space)
+        return self._action_space[self.np_random.choice(np.flatnonzero(mask))]
 
 
 class ScatterActionSpace(Space):
@@ -59,5 +75,43 @@ class ScatterActionSpace(Space):
     def get_actions_dim(self):
         return self.actions_dim
 
-    def sample(self):
-        return self.np_random.choice(self._action_space)
+    def sample(self, mask=None):
+        """
+        Samples a default action, among the valid ones if a mask is given (cf.
+        `action_mask`).
+        """
+        if mask is None:
+            return self.np_random.choice(self._action_space)
+        return self._action_space[self.np_random.choice(np.flatnonzero(mask))]
+
+
+class FlatActionSpace(Discrete):
+    """
+    The default actions as flat action IDs (cf. `TOWER_DEFAULT_ACTIONS` and
+    `SCATTER_DEFAULT_ACTIONS`).
+    """
+
+    def __init__(self, default_actions, default_action_arrays, seed=None):
+        self.default_actions = default_actions
+        self.default_action_arrays = default_action_arrays
+        super().__init__(len(default_actions), seed=seed)
+
+    def get_action(self, action_id):
+        """
+        The (prebuilt) Type[Action] object of an action ID.
+        """
+        return self.default_actions[action_id]
+
+    def sample(self, mask=None):
+        """
+        Samples an action ID, among the valid ones if a (boolean) mask is given.
+        """
+        if mask is not None:
+            mask = np.asarray(mask).astype(np.int8)
+        return super().sample(mask)
+
+    def to_arrays(self, action_ids):
+        """
+        The array representations of a batch of action IDs.
+        """
+        return self.default_action_arrays[action_ids]
@@ -0,0 +1,292 @@
+"""
+Binary, pre-parsed format of the data, loaded with memory maps.
+
+`get_data` parses a JSON file, and the environment then builds the initial state of
+every sample. The binary format stores instead, in a directory of .npy files:
+- the example numbers, the sentences and the (deduplicated) logical forms as string
+  tables: the concatenated UTF-8 strings and their offsets
+- the index of the logical form of each sample
+- the structured representations as one (n, 5) int16 array of items (the rows of the
+  `CompactImage` item arrays), with the offsets of the items of each box
+- the labels (FlipIt) as bits
+
+Loading the data is a memory map of these files: the initial states are only built when
+they are drawn, and the processes using the same files share their pages. The data are
+converted with:
+
+    python -m lilgym.envs.binary_data --output lilgym_binary_data/
+
+and used with:
+
+    data = BinaryData("lilgym_binary_data/tower_flipit_train")
+    env = gym.make("TowerFlipIt-v0", ..., data=data)
+
+For worker pools, `share_data` publishes a split in shared memory (/dev/shm), and the
+BinaryData is sent to the workers by path: each worker maps the same pages instead of
+holding its own copy of the data.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Mapping
+from typing import List
+
+import numpy as np
+
+from lilgym.data.utils import get_data, data_files, data_path
+from lilgym.envs.utils_state import ContextState
+from lilgym.envs.structured_rep_compact import (
+    CompactImage,
+    NUM_BOXES,
+    NUM_FIELDS,
+    item_to_row,
+    to_box_array,
+)
+
+
+FORMAT_VERSION = 1
+
+# In-memory file system, shared by the processes
+SHARED_MEMORY_DIR = "/dev/shm"
+
+ARRAYS = [
+    "ids",
+    "id_offsets",
+    "sentences",
+    "sentence_offsets",
+    "lfs",
+    "lf_offsets",
+    "lf_index",
+    "items",
+    "item_offsets",
+    "labels",
+]
+
+
+def encode_strings(strings: List[str]):
+    """
+    Build a string table: the concatenated UTF-8 strings, and the offset of each string
+    (with the end of the last one).
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_string(table, offsets, index: int):
+    return table[offsets[index] : offsets[index + 1]].tobytes().decode("utf-8")
+
+
+def convert_data(data: dict, starting_condition: str, output: str):
+    """
+    Convert the data (cf. `lilgym.data.utils.get_data`) to the binary format.
+
+    Args:
+        data: Dictionary of the context and initial states
+        starting_condition: The starting condition: "scratch" or "flipit"
+        output: Directory of the converted data
+    """
+    ids = list(data.keys())
+    lfs = list(dict.fromkeys(data[k]["lf"] for k in ids))
+    lf_numbers = {lf: i for i, lf in enumerate(lfs)}
+
+    rows = []
+    item_offsets = [0]
+    for k in ids:
+        boxes = data[k].get("structured_rep", [[]] * NUM_BOXES)
+        for box in boxes:
+            rows.extend(item_to_row(obj) for obj in box)
+            item_offsets.append(len(rows))
+
+    arrays = {}
+    arrays["ids"], arrays["id_offsets"] = encode_strings(ids)
+    arrays["sentences"], arrays["sentence_offsets"] = encode_strings(
+        [data[k]["sentence"] for k in ids]
+    )
+    arrays["lfs"], arrays["lf_offsets"] = encode_strings(lfs)
+    arrays["lf_index"] = np.array(
+        [lf_numbers[data[k]["lf"]] for k in ids], dtype=np.int32
+    )
+    arrays["items"] = np.array(rows, dtype=np.int16).reshape(-1, NUM_FIELDS)
+    arrays["item_offsets"] = np.array(item_offsets, dtype=np.int64)
+    arrays["labels"] = np.packbits([data[k].get("label") == "true" for k in ids])
+
+    os.makedirs(output, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(output, name + ".npy"), arrays[name])
+    with open(os.path.join(output, "index.json"), "w") as f:
+        json.dump(
+            {
+                "version": FORMAT_VERSION,
+                "starting_condition": starting_condition,
+                "num_samples": len(ids),
+                "num_lfs": len(lfs),
+            },
+            f,
+        )
+
+
+def get_binary_path(root: str, appearance: str, starting_condition: str, split: str):
+    """
+    Directory of the converted data of a configuration and split, in root.
+    """
+    return os.path.join(root, f"{appearance}_{starting_condition}_{split}")
+
+
+class BinaryData(Mapping):
+    """
+    Data in the binary format, memory-mapped from the directory built by `convert_data`.
+
+    It is the mapping from the example numbers to the initial states (`ContextState`) of
+    the samples, which are built when accessed. It can be given as `data` to the
+    environments.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        with open(os.path.join(path, "index.json")) as f:
+            index = json.load(f)
+        assert (
+            index["version"] == FORMAT_VERSION
+        ), f"Unsupported version of the binary data: {index['version']}"
+        self.starting_condition = index["starting_condition"]
+
+        self._arrays = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+            for name in ARRAYS
+        }
+        self._num_samples = index["num_samples"]
+        # Number of each example number, built at the first lookup (opening the data
+        # does not decode the example numbers)
+        self._numbers = None
+        # Decoded logical forms (each one is decoded once, and shared by its samples)
+        self._lfs = [None] * index["num_lfs"]
+
+    def __len__(self):
+        return self._num_samples
+
+    def __iter__(self):
+        ids, id_offsets = self._arrays["ids"], self._arrays["id_offsets"]
+        for i in range(self._num_samples):
+            yield decode_string(ids, id_offsets, i)
+
+    def __contains__(self, key):
+        return key in self.get_numbers()
+
+    def __getitem__(self, key):
+        return self.get_state(self.get_numbers()[key])
+
+    def get_numbers(self):
+        """
+        Mapping from the example numbers to the numbers of the samples.
+        """
+        if self._numbers is None:
+            self._numbers = {k: i for i, k in enumerate(self)}
+        return self._numbers
+
+    def __reduce__(self):
+        # Sent to other processes by path: they map the same files
+        return BinaryData, (self._path,)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get_lf(self, lf_number: int):
+        if self._lfs[lf_number] is None:
+            self._lfs[lf_number] = decode_string(
+                self._arrays["lfs"], self._arrays["lf_offsets"], lf_number
+            )
+        return self._lfs[lf_number]
+
+    def get_state(self, number: int):
+        """
+        Initial state of the number-th sample.
+        """
+        arrays = self._arrays
+        offsets = arrays["item_offsets"][
+            number * NUM_BOXES : (number + 1) * NUM_BOXES + 1
+        ]
+        img_struct = CompactImage(
+            to_box_array(arrays["items"][offsets[box] : offsets[box + 1]])
+            for box in range(NUM_BOXES)
+        )
+        if self.starting_condition == "flipit":
+            # The target bool is the inverse of the label
+            label = (arrays["labels"][number >> 3] >> (7 - (number & 7))) & 1
+            target_bool = not label
+        else:
+            target_bool = True
+        return ContextState(
+            decode_string(arrays["sentences"], arrays["sentence_offsets"], number),
+            self.get_lf(int(arrays["lf_index"][number])),
+            img_struct,
+            target_bool,
+        )
+
+    def get_max_items(self):
+        """
+        Maximum number of items in a box of the initial states.
+        """
+        return int(np.diff(self._arrays["item_offsets"]).max(initial=0))
+
+
+def remove_shared_data(root: str, pid: int):
+    # Only the publishing process removes the data (not its forked children)
+    if os.getpid() == pid:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def share_data(appearance: str, starting_condition: str, split: str):
+    """
+    Publish a data split in the binary format in shared memory (in /dev/shm, or in the
+    temporary directory if it does not exist), for worker processes.
+
+    The returned BinaryData can be given to forked or spawned workers (e.g. as an
+    argument of a `multiprocessing.Pool` task): it is pickled as its path, and each
+    worker maps the same pages to build its environments (`gym.make(..., data=data)`),
+    without parsing nor copying the data. The data are removed when the publishing
+    process exits.
+    """
+    root = tempfile.mkdtemp(
+        prefix="lilgym-",
+        dir=SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None,
+    )
+    atexit.register(remove_shared_data, root, os.getpid())
+    path = get_binary_path(root, appearance, starting_condition, split)
+    convert_data(
+        get_data(appearance, starting_condition, split), starting_condition, path
+    )
+    return BinaryData(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the data to the binary format."
+    )
+    parser.add_argument(
+        "--output", required=True, help="Directory of the converted data"
+    )
+    parser.add_argument("--splits", nargs="+", default=["train", "dev", "test"])
+    args = parser.parse_args()
+
+    for env_name, files in data_files.items():
+        appearance, starting_condition = env_name.split("-")
+        for split in args.splits:
+            if not os.path.exists(os.path.join(data_path, files[split])):
+                continue
+            output = get_binary_path(args.output, appearance, starting_condition, split)
+            data = get_data(appearance, starting_condition, split)
+            convert_data(data, starting_condition, output)
+            print(f"{files[split]}: {len(data)} samples converted to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Sharded evaluation of a policy over a data split.
+
+The samples of the split are partitioned deterministically into K shards (`get_shard`),
+each one evaluated by a worker process (or a rank of a distributed job) with
+`evaluate_shard`. The per-sample results are then merged with `merge_results` into the
+exact metrics of the split (`accuracy` and `accuracy_nosf` over all the samples). Each
+episode is seeded from the seed of the evaluation and its example number, so the result
+of a sample does not depend on the number of shards nor on its worker. With stop
+forcing, `accuracy` counts the episodes stopped by the environment when the prediction
+is right, and `accuracy_nosf` does not.
+
+With a pool of processes:
+
+    python -m lilgym.envs.evaluation --appearance tower --starting-condition flipit \
+        --split dev --policy my_module:my_policy --workers 16 [--stop-forcing]
+
+or from Python, with `evaluate(policy, "tower", "flipit", "dev", workers=16)`. The
+policy is a picklable function `policy(env, observation, info) -> action`.
+"""
+
+import argparse
+import importlib
+import json
+import math
+import zlib
+from multiprocessing import Pool
+from typing import Callable, Dict, List, Tuple
+
+from lilgym.envs.natural_language_visual_reasoning_env import (
+    NaturalLanguageVisualReasoningEnv,
+)
+from lilgym.envs.sampler import get_shard
+
+
+def get_sample_seed(seed: int, example_number: str):
+    """
+    Seed of the episode of a sample, which only depends on the seed of the evaluation
+    and on the example number.
+    """
+    return zlib.crc32(f"{seed}-{example_number}".encode("utf-8"))
+
+
+def random_policy(env, observation, info):
+    """
+    Baseline policy: a random valid action.
+    """
+    return env.action_space.sample(mask=env.action_mask())
+
+
+def evaluate_shard(
+    policy: Callable,
+    appearance: str,
+    starting_condition: str,
+    split: str = None,
+    data: dict = None,
+    num_shards: int = 1,
+    shard: int = 0,
+    seed: int = 0,
+    stop_forcing: bool = False,
+    **env_kwargs,
+):
+    """
+    Run the policy over the samples of a shard, once per sample.
+
+    Args:
+        policy: Function `policy(env, observation, info) -> action`
+        appearance: Environment appearance option: "tower" or "scatter"
+        starting_condition: The starting condition: "scratch" or "flipit"
+        split, data: The data split, or the data (cf.
+        `NaturalLanguageVisualReasoningEnv`)
+        num_shards, shard: The number of shards, and the shard to evaluate
+        seed: Seed of the evaluation
+        stop_forcing: Whether the episodes are stopped when the prediction is right
+        env_kwargs: Other arguments of the environment (e.g. `truth_tables`)
+
+    Returns:
+        (Dict[str, dict]): the accuracy, accuracy_nosf, return and number of steps of
+        the episode of each sample of the shard, by example number
+    """
+    env = NaturalLanguageVisualReasoningEnv(
+        appearance,
+        starting_condition,
+        stop_forcing=stop_forcing,
+        split=split,
+        data=data,
+        flat_actions=True,
+        **env_kwargs,
+    )
+    # The samples of the shard are reset explicitly (instead of with the evaluation mode
+    # of the environment), so that each episode is seeded from its example number
+    results = {}
+    for example_number in get_shard(list(env.get_samples().keys()), num_shards, shard):
+        sample_seed = get_sample_seed(seed, example_number)
+        env.action_space.seed(sample_seed)
+        observation, info = env.reset(
+            seed=sample_seed, options={"example_number": example_number}
+        )
+        episode_return, steps = 0.0, 0
+        terminated = truncated = False
+        while not (terminated or truncated):
+            action = policy(env, observation, info)
+            observation, reward, terminated, truncated, info = env.step(action)
+            episode_return += reward
+            steps += 1
+        results[example_number] = {
+            "accuracy": info["accuracy"],
+            "accuracy_nosf": info["accuracy_nosf"],
+            "return": episode_return,
+            "steps": steps,
+        }
+    env.close()
+    return results
+
+
+def merge_results(shard_results: List[Dict[str, dict]]):
+    """
+    Merge the results of the shards into the metrics of the split: the accuracies are
+    the exact means over all the samples (not the means of the accuracies of the
+    shards), with exactly rounded sums, so that they do not depend on the sharding.
+    """
+    samples = {}
+    for results in shard_results:
+        assert not samples.keys() & results.keys(), "The shards should be disjoint"
+        samples.update(results)
+    num_samples = len(samples)
+    metrics = {"num_samples": num_samples}
+    for name in ["accuracy", "accuracy_nosf", "return", "steps"]:
+        total = math.fsum(result[name] for result in samples.values())
+        metrics[name] = total / num_samples if num_samples else 0.0
+    metrics["samples"] = samples
+    return metrics
+
+
+def _evaluate_task(args: Tuple[tuple, dict]):
+    args, kwargs = args
+    return evaluate_shard(*args, **kwargs)
+
+
+def evaluate(
+    policy: Callable,
+    appearance: str,
+    starting_condition: str,
+    split: str = None,
+    data: dict = None,
+    workers: int = 1,
+    seed: int = 0,
+    stop_forcing: bool = False,
+    **env_kwargs,
+):
+    """
+    Evaluate the policy over a data split, with one shard per worker process.
+
+    Returns:
+        (dict): the metrics of the split (cf. `merge_results`)
+    """
+    tasks = [
+        (
+            (policy, appearance, starting_condition),
+            dict(
+                split=split,
+                data=data,
+                num_shards=workers,
+                shard=shard,
+                seed=seed,
+                stop_forcing=stop_forcing,
+                **env_kwargs,
+            ),
+        )
+        for shard in range(workers)
+    ]
+    if workers == 1:
+        return merge_results([_evaluate_task(tasks[0])])
+    with Pool(workers) as pool:
+        return merge_results(pool.map(_evaluate_task, tasks))
+
+
+def import_policy(path: str):
+    """
+    Import a policy given as "module:function".
+    """
+    module, name = path.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a policy over a data split.")
+    parser.add_argument("--appearance", required=True, choices=["tower", "scatter"])
+    parser.add_argument(
+        "--starting-condition", required=True, choices=["scratch", "flipit"]
+    )
+    parser.add_argument("--split", default="dev")
+    parser.add_argument(
+        "--policy",
+        default="lilgym.envs.evaluation:random_policy",
+        help="Policy, as module:function",
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--stop-forcing",
+        action="store_true",
+        help="Stop the episodes when the prediction is right (cf. accuracy_nosf)",
+    )
+    parser.add_argument("--output", help="JSON file of the results of each sample")
+    args = parser.parse_args()
+
+    metrics = evaluate(
+        import_policy(args.policy),
+        args.appearance,
+        args.starting_condition,
+        args.split,
+        workers=args.workers,
+        seed=args.seed,
+        stop_forcing=args.stop_forcing,
+    )
+    samples = metrics.pop("samples")
+    print(json.dumps(metrics))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(samples, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
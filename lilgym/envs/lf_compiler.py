@@ -0,0 +1,878 @@
+"""
+Compiler of the logical forms to trees of specialized closures.
+
+A logical form is a Python expression over `all_boxes` and `all_items`, made of nested
+calls to the functions of `lilgym.envs.logical_forms` (e.g.
+`exist(filter_obj(all_items, lambda x: is_yellow(x) and is_square(x)))`). Instead of
+evaluating it with `eval`, `compile_lf` parses it with `ast` and builds one closure per
+node, which takes the environment of the variables (a list: `all_boxes`, `all_items`,
+then one slot per lambda argument) and returns the value of the node. The types of the
+nodes are inferred (bool, int, item, box, collections of distinct items or boxes), and
+the nodes whose types are known are specialized:
+- the enum constants (e.g. `Color.BLUE`, `Side.RIGHT`) are folded
+- the item predicates (`is_yellow`, `is_square`, `is_touching_wall(x, Side.RIGHT)`, ...)
+  and the lambdas of the filters are inlined
+- `exist(filter_obj(...))` is a loop which stops at the first match, and
+  `count(filter_obj(...))` a counting loop, without building the filtered list nor the
+  set of the ids of its items
+- `AND`, `OR`, `NOT` and the integer comparisons of bools and ints skip their type
+  checks
+
+The semantics of `eval` are kept, including the exceptions: a loop only stops early when
+its predicate can neither raise nor have a side effect, and the other nodes (or the
+unknown constructs) call the functions of `logical_forms` as `eval` does. The logical
+forms using unsupported syntax are compiled with `eval` (cf. `lilgym.envs.utils.
+compile_logical_form`).
+
+The compiled logical forms are checked against `eval` on every (logical form, structured
+representation) pair of the data by `tests/test_lf_compiler.py`.
+"""
+
+import ast
+import builtins
+import operator
+from operator import itemgetter, methodcaller
+from typing import Callable, NamedTuple
+
+from lilgym.envs import logical_forms
+from lilgym.envs.structured_rep_enums import (
+    Size,
+    Color,
+    Shape,
+    Location,
+    Relation,
+    Side,
+)
+
+
+# Namespace in which the logical forms are executed: the logical forms functions and the
+# enums. It is never modified: the boxes and items of the image are given as arguments
+# to the compiled logical forms, so that they can be executed concurrently (e.g. in
+# threads).
+LF_NAMESPACE = {
+    name: value
+    for name, value in vars(logical_forms).items()
+    if not name.startswith("_")
+}
+LF_NAMESPACE.update(
+    {
+        "Size": Size,
+        "Color": Color,
+        "Shape": Shape,
+        "Location": Location,
+        "Relation": Relation,
+        "Side": Side,
+    }
+)
+
+# Inferred types of the nodes
+ANY = "any"
+BOOL = "bool"
+INT = "int"
+ITEM = "item"
+BOX = "box"
+# Sized collections of distinct items or boxes (lists or sets)
+ITEMS = "items"
+BOXES = "boxes"
+# Sets of other values (e.g. of colors)
+SET = "set"
+COLLECTIONS = (ITEMS, BOXES, SET)
+ELEMENT_TYPES = {ITEMS: ITEM, BOXES: BOX}
+
+# Slots of the environment of the variables
+ALL_BOXES_SLOT = 0
+ALL_ITEMS_SLOT = 1
+
+COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Mod: operator.mod,
+}
+INT_COMPARISONS = {
+    logical_forms.le: operator.le,
+    logical_forms.ge: operator.ge,
+    logical_forms.lt: operator.lt,
+    logical_forms.gt: operator.gt,
+    logical_forms.equal_int: operator.eq,
+}
+
+# Item predicates on an attribute of the item
+ATTRIBUTE_PREDICATES = {
+    logical_forms.is_yellow: ("color", Color.YELLOW),
+    logical_forms.is_blue: ("color", Color.BLUE),
+    logical_forms.is_black: ("color", Color.BLACK),
+    logical_forms.is_circle: ("shape", Shape.CIRCLE),
+    logical_forms.is_square: ("shape", Shape.SQUARE),
+    logical_forms.is_triangle: ("shape", Shape.TRIANGLE),
+    logical_forms.is_big: ("size", Size.BIG),
+    logical_forms.is_medium: ("size", Size.MEDIUM),
+    logical_forms.is_small: ("size", Size.SMALL),
+}
+ATTRIBUTE_FILTERS = {
+    logical_forms.filter_color: ("color", Color),
+    logical_forms.filter_shape: ("shape", Shape),
+    logical_forms.filter_size: ("size", Size),
+}
+# Item predicates which are methods of the items
+METHOD_PREDICATES = {
+    logical_forms.is_top: "is_top",
+    logical_forms.is_bottom: "is_bottom",
+    logical_forms.is_second: "is_second",
+    logical_forms.is_third: "is_third",
+}
+# Item predicates with optional Side arguments, which return a bool for any side
+SIDE_PREDICATES = {
+    logical_forms.is_touching_wall,
+    logical_forms.is_closely_touching_wall,
+    logical_forms.is_close_to_wall,
+    logical_forms.is_touching_corner,
+    logical_forms.is_closely_touching_corner,
+    logical_forms.is_close_to_corner,
+    logical_forms.is_closely_touching_specific_corner,
+}
+# Relations: sets of the items in a relation with an item or a collection of items
+RELATIONS = {
+    logical_forms.get_above,
+    logical_forms.get_below,
+    logical_forms.get_touching,
+    logical_forms.get_closely_touching,
+    logical_forms.get_box_all_above,
+    logical_forms.get_box_all_below,
+    logical_forms.get_img_all_above,
+    logical_forms.get_img_all_below,
+}
+IMAGE_RELATIONS = {logical_forms.get_img_all_above, logical_forms.get_img_all_below}
+ATTRIBUTE_SETS = {
+    logical_forms.get_set_colors,
+    logical_forms.get_set_sizes,
+    logical_forms.get_set_shapes,
+}
+
+
+class Unsupported(Exception):
+    """
+    Syntax of a logical form that the compiler does not support.
+    """
+
+
+class Node(NamedTuple):
+    """
+    A compiled node of a logical form.
+
+    fn: The closure computing the value of the node, given the environment of the
+    variables
+    type: The inferred type of the value (ANY if unknown)
+    safe: Whether the evaluation of the node can neither raise nor have a side effect
+    constant: Whether the value is a constant (then given in value)
+    """
+
+    fn: Callable
+    type: str = ANY
+    safe: bool = False
+    constant: bool = False
+    value: object = None
+
+
+def constant(value):
+    if type(value) is bool:
+        value_type = BOOL
+    elif type(value) is int:
+        value_type = INT
+    else:
+        value_type = ANY
+    return Node(lambda env: value, value_type, True, True, value)
+
+
+def all_of(value_type, nodes):
+    return all(node.type == value_type for node in nodes)
+
+
+class LogicalFormCompiler:
+    """
+    Compiler of the nodes of a logical form (cf. the module docstring). `scope` maps the
+    names of the variables to their slot in the environment and their type.
+    """
+
+    def __init__(self):
+        self.num_slots = 2
+        self.handlers = {
+            logical_forms.exist: self.compile_exist,
+            logical_forms.count: self.compile_count,
+            logical_forms.filter_obj: self.compile_filter,
+            logical_forms.filter_color: self.compile_filter,
+            logical_forms.filter_shape: self.compile_filter,
+            logical_forms.filter_size: self.compile_filter,
+            logical_forms.AND: self.compile_and_or,
+            logical_forms.OR: self.compile_and_or,
+            logical_forms.NOT: self.compile_not,
+            logical_forms.All: self.compile_all,
+            logical_forms.Any: self.compile_any,
+            logical_forms.unique: self.compile_unique,
+        }
+        for function in INT_COMPARISONS:
+            self.handlers[function] = self.compile_int_comparison
+        for function in ATTRIBUTE_PREDICATES:
+            self.handlers[function] = self.compile_attribute_predicate
+        for function in METHOD_PREDICATES:
+            self.handlers[function] = self.compile_method_predicate
+        for function in SIDE_PREDICATES:
+            self.handlers[function] = self.compile_side_predicate
+        for function in RELATIONS:
+            self.handlers[function] = self.compile_relation
+        for function in ATTRIBUTE_SETS:
+            self.handlers[function] = self.compile_attribute_set
+
+    def new_slot(self):
+        self.num_slots += 1
+        return self.num_slots - 1
+
+    def compile(self, node: ast.AST, scope: dict) -> Node:
+        method = getattr(self, "compile_" + type(node).__name__, None)
+        if method is None:
+            raise Unsupported(type(node).__name__)
+        return method(node, scope)
+
+    # Names and constants
+
+    def compile_Constant(self, node, scope):
+        return constant(node.value)
+
+    def compile_Name(self, node, scope):
+        name = node.id
+        if name in scope:
+            slot, value_type = scope[name]
+            return Node(itemgetter(slot), value_type, True)
+        if name in LF_NAMESPACE:
+            return constant(LF_NAMESPACE[name])
+        if hasattr(builtins, name):
+            return constant(getattr(builtins, name))
+
+        def undefined(env):
+            raise NameError(f"name '{name}' is not defined")
+
+        return Node(undefined)
+
+    def compile_Attribute(self, node, scope):
+        value = self.compile(node.value, scope)
+        attr = node.attr
+        if value.constant:
+            try:
+                return constant(getattr(value.value, attr))
+            except AttributeError:
+                pass
+        fn = value.fn
+        if value.type == ITEM and attr == "box":
+            return Node(lambda env: fn(env).box, BOX, value.safe)
+        return Node(lambda env: getattr(fn(env), attr))
+
+    # Operators
+
+    def compile_BoolOp(self, node, scope):
+        values = [self.compile(value, scope) for value in node.values]
+        fns = [value.fn for value in values]
+        first, rest = fns[0], fns[1:]
+        if len(fns) == 2:
+            second = fns[1]
+            if isinstance(node.op, ast.And):
+                fn = lambda env: first(env) and second(env)
+            else:
+                fn = lambda env: first(env) or second(env)
+        elif isinstance(node.op, ast.And):
+
+            def fn(env):
+                result = first(env)
+                for f in rest:
+                    if not result:
+                        return result
+                    result = f(env)
+                return result
+
+        else:
+
+            def fn(env):
+                result = first(env)
+                for f in rest:
+                    if result:
+                        return result
+                    result = f(env)
+                return result
+
+        value_type = BOOL if all_of(BOOL, values) else ANY
+        return Node(fn, value_type, all(value.safe for value in values))
+
+    def compile_UnaryOp(self, node, scope):
+        operand = self.compile(node.operand, scope)
+        fn = operand.fn
+        if isinstance(node.op, ast.Not):
+            return Node(lambda env: not fn(env), BOOL, operand.safe)
+        if isinstance(node.op, ast.USub):
+            return Node(lambda env: -fn(env), INT if operand.type == INT else ANY)
+        raise Unsupported(type(node.op).__name__)
+
+    def compile_BinOp(self, node, scope):
+        if type(node.op) not in BINARY_OPERATORS:
+            raise Unsupported(type(node.op).__name__)
+        op = BINARY_OPERATORS[type(node.op)]
+        left, right = self.compile(node.left, scope), self.compile(node.right, scope)
+        left_fn, right_fn = left.fn, right.fn
+        value_type = INT if left.type == INT and right.type == INT else ANY
+        return Node(lambda env: op(left_fn(env), right_fn(env)), value_type)
+
+    def compile_Compare(self, node, scope):
+        if any(type(op) not in COMPARISONS for op in node.ops):
+            raise Unsupported("comparison")
+        operands = [
+            self.compile(operand, scope) for operand in [node.left] + node.comparators
+        ]
+        ops = [COMPARISONS[type(op)] for op in node.ops]
+        # The comparisons of ints (and the equality of bools) are bools, and never raise
+        exact = all(operand.type in (INT, BOOL) for operand in operands) and (
+            all_of(INT, operands)
+            or all(type(op) in (ast.Eq, ast.NotEq) for op in node.ops)
+        )
+        value_type = BOOL if exact else ANY
+        safe = exact and all(operand.safe for operand in operands)
+        if len(ops) == 1:
+            op, (left, right) = ops[0], [operand.fn for operand in operands]
+            return Node(lambda env: op(left(env), right(env)), value_type, safe)
+
+        fns = [operand.fn for operand in operands]
+
+        def fn(env):
+            # Chained comparison: each operand is evaluated at most once
+            left = fns[0](env)
+            for op, right_fn in zip(ops, fns[1:]):
+                right = right_fn(env)
+                result = op(left, right)
+                if not result:
+                    return result
+                left = right
+            return result
+
+        return Node(fn, value_type, safe)
+
+    def compile_Subscript(self, node, scope):
+        value, index = self.compile(node.value, scope), self.compile(node.slice, scope)
+        value_fn, index_fn = value.fn, index.fn
+        return Node(lambda env: value_fn(env)[index_fn(env)])
+
+    def compile_Slice(self, node, scope):
+        bounds = [
+            self.compile(bound, scope) if bound is not None else constant(None)
+            for bound in (node.lower, node.upper, node.step)
+        ]
+        fns = [bound.fn for bound in bounds]
+        return Node(lambda env: slice(*[f(env) for f in fns]))
+
+    def compile_List(self, node, scope):
+        fns = [self.compile(element, scope).fn for element in node.elts]
+        return Node(lambda env: [f(env) for f in fns])
+
+    def compile_Tuple(self, node, scope):
+        fns = [self.compile(element, scope).fn for element in node.elts]
+        return Node(lambda env: tuple([f(env) for f in fns]))
+
+    def compile_Set(self, node, scope):
+        fns = [self.compile(element, scope).fn for element in node.elts]
+        return Node(lambda env: {f(env) for f in fns})
+
+    # Lambdas
+
+    def get_arguments(self, node: ast.Lambda):
+        arguments = node.args
+        if (
+            arguments.posonlyargs
+            or arguments.vararg
+            or arguments.kwonlyargs
+            or arguments.kwarg
+            or arguments.defaults
+        ):
+            raise Unsupported("lambda arguments")
+        return [argument.arg for argument in arguments.args]
+
+    def compile_Lambda(self, node, scope, argument_types=None):
+        """
+        A lambda given as a value (e.g. to a function which is not specialized): its
+        value is a Python function, which sets its arguments in the environment and
+        evaluates its body.
+        """
+        names = self.get_arguments(node)
+        argument_types = argument_types or [ANY] * len(names)
+        slots = [self.new_slot() for _ in names]
+        scope = dict(scope)
+        for name, slot, argument_type in zip(names, slots, argument_types):
+            scope[name] = (slot, argument_type)
+        body = self.compile(node.body, scope).fn
+
+        if len(slots) == 1:
+            slot = slots[0]
+
+            def make_function(env):
+                def function(x):
+                    env[slot] = x
+                    return body(env)
+
+                return function
+
+        else:
+
+            def make_function(env):
+                def function(*args):
+                    if len(args) != len(slots):
+                        raise TypeError(
+                            "<lambda>() takes {} arguments".format(len(slots))
+                        )
+                    for slot, x in zip(slots, args):
+                        env[slot] = x
+                    return body(env)
+
+                return function
+
+        return Node(make_function)
+
+    def compile_predicate(self, node: ast.AST, scope: dict, element_type: str):
+        """
+        Inline a predicate (a lambda of one argument, or an item predicate given by
+        name) on the elements of a collection: returns the slot of the element in the
+        environment and the compiled body of the predicate, or None if it cannot be
+        inlined.
+        """
+        if isinstance(node, ast.Lambda):
+            names = self.get_arguments(node)
+            if len(names) != 1:
+                return None
+            slot = self.new_slot()
+            return slot, self.compile(
+                node.body, {**scope, names[0]: (slot, element_type)}
+            )
+        if isinstance(node, ast.Name) and node.id not in scope:
+            function = LF_NAMESPACE.get(node.id)
+            if (
+                function in self.handlers
+                and function not in self.get_collection_handlers()
+            ):
+                slot = self.new_slot()
+                element = Node(itemgetter(slot), element_type, True)
+                body = self.handlers[function](function, [element], scope)
+                if body is not None:
+                    return slot, body
+        return None
+
+    def get_collection_handlers(self):
+        return {
+            logical_forms.exist,
+            logical_forms.count,
+            logical_forms.filter_obj,
+            logical_forms.filter_color,
+            logical_forms.filter_shape,
+            logical_forms.filter_size,
+            logical_forms.All,
+            logical_forms.Any,
+        }
+
+    # Calls
+
+    def compile_Call(self, node, scope):
+        if node.keywords or any(isinstance(arg, ast.Starred) for arg in node.args):
+            return self.compile_generic_call(node, scope)
+        func = node.func
+        if isinstance(func, ast.Attribute) and not node.args:
+            owner = self.compile(func.value, scope)
+            owner_fn = owner.fn
+            # Methods of the boxes
+            if owner.type == BOX and func.attr == "all_items_in_box":
+                return Node(lambda env: owner_fn(env).items, ITEMS, owner.safe)
+            if owner.type == BOX and func.attr == "is_tower":
+                return Node(lambda env: owner_fn(env).is_tower(), BOOL, owner.safe)
+        elif isinstance(func, ast.Name) and func.id not in scope:
+            function = LF_NAMESPACE.get(func.id)
+            if function in self.handlers:
+                compiled = self.handlers[function](function, node.args, scope)
+                if compiled is not None:
+                    return compiled
+        return self.compile_generic_call(node, scope)
+
+    def compile_arguments(self, args, scope):
+        return [
+            arg if isinstance(arg, Node) else self.compile(arg, scope) for arg in args
+        ]
+
+    def compile_generic_call(self, node, scope):
+        func = self.compile(node.func, scope).fn
+        starred = [isinstance(arg, ast.Starred) for arg in node.args]
+        args = [
+            self.compile(arg.value if is_starred else arg, scope).fn
+            for arg, is_starred in zip(node.args, starred)
+        ]
+        keywords = [
+            (keyword.arg, self.compile(keyword.value, scope).fn)
+            for keyword in node.keywords
+        ]
+        if any(starred) or any(name is None for name, _ in keywords):
+            raise Unsupported("unpacking")
+        if keywords:
+
+            def fn(env):
+                f = func(env)
+                values = [arg(env) for arg in args]
+                return f(*values, **{name: value(env) for name, value in keywords})
+
+        elif len(args) == 1:
+            arg = args[0]
+            fn = lambda env: func(env)(arg(env))
+        elif len(args) == 2:
+            first, second = args
+            fn = lambda env: func(env)(first(env), second(env))
+        else:
+
+            def fn(env):
+                f = func(env)
+                return f(*[arg(env) for arg in args])
+
+        return Node(fn)
+
+    def call_function(self, function, args, value_type=ANY, safe=False):
+        fns = [arg.fn for arg in args]
+        if len(fns) == 1:
+            arg = fns[0]
+            return Node(lambda env: function(arg(env)), value_type, safe)
+        if len(fns) == 2:
+            first, second = fns
+            return Node(lambda env: function(first(env), second(env)), value_type, safe)
+        return Node(lambda env: function(*[f(env) for f in fns]), value_type, safe)
+
+    # Item predicates
+
+    def compile_attribute_predicate(self, function, args, scope):
+        if len(args) != 1:
+            return None
+        (item,) = self.compile_arguments(args, scope)
+        if item.type != ITEM:
+            return self.call_function(function, [item])
+        attr, value = ATTRIBUTE_PREDICATES[function]
+        fn = item.fn
+        if attr == "color":
+            return Node(lambda env: fn(env).color is value, BOOL, item.safe)
+        if attr == "shape":
+            return Node(lambda env: fn(env).shape is value, BOOL, item.safe)
+        return Node(lambda env: fn(env).size is value, BOOL, item.safe)
+
+    def compile_method_predicate(self, function, args, scope):
+        if len(args) != 1:
+            return None
+        (item,) = self.compile_arguments(args, scope)
+        if item.type != ITEM:
+            return self.call_function(function, [item])
+        method, fn = methodcaller(METHOD_PREDICATES[function]), item.fn
+        return Node(lambda env: method(fn(env)), BOOL, item.safe)
+
+    def compile_side_predicate(self, function, args, scope):
+        if not args:
+            return None
+        args = self.compile_arguments(args, scope)
+        item, sides = args[0], args[1:]
+        # Any side (or None) gives a bool
+        known_sides = len(sides) < function.__code__.co_argcount and all(
+            side.constant and (side.value is None or isinstance(side.value, Side))
+            for side in sides
+        )
+        if item.type != ITEM or not known_sides:
+            return self.call_function(function, args)
+        sides = tuple(side.value for side in sides)
+        if function is logical_forms.is_touching_wall:
+            side = sides[0] if sides else None
+            method = {
+                Side.TOP: "touching_top",
+                Side.BOTTOM: "touching_bottom",
+                Side.RIGHT: "touching_right",
+                Side.LEFT: "touching_left",
+            }.get(side, "touching_wall")
+            method, fn = methodcaller(method), item.fn
+            return Node(lambda env: method(fn(env)), BOOL, item.safe)
+        fn = item.fn
+        return Node(lambda env: function(fn(env), *sides), BOOL, item.safe)
+
+    # Sets of items
+
+    def compile_relation(self, function, args, scope):
+        if len(args) != 1:
+            return None
+        (items,) = self.compile_arguments(args, scope)
+        if items.type in (ITEM, ITEMS):
+            # The boxes of the items do not have the image of the relations of the image
+            safe = items.safe and function not in IMAGE_RELATIONS
+            return self.call_function(function, [items], ITEMS, safe)
+        return self.call_function(function, [items])
+
+    def compile_attribute_set(self, function, args, scope):
+        if len(args) != 1:
+            return None
+        (items,) = self.compile_arguments(args, scope)
+        if items.type == ITEMS:
+            return self.call_function(function, [items], SET, items.safe)
+        return self.call_function(function, [items])
+
+    def compile_unique(self, function, args, scope):
+        if len(args) != 1:
+            return None
+        (items,) = self.compile_arguments(args, scope)
+        return self.call_function(function, [items], ELEMENT_TYPES.get(items.type, ANY))
+
+    def compile_loop(self, function, args, scope):
+        """
+        The loop of a filter: returns the compiled collection, the slot of its elements
+        and the compiled predicate, or None if the filter is not specialized.
+        """
+        if len(args) != 2 or isinstance(args[0], Node):
+            return None
+        collection = self.compile(args[0], scope)
+        element_type = ELEMENT_TYPES.get(collection.type, ANY)
+        if function is logical_forms.filter_obj:
+            predicate = self.compile_predicate(args[1], scope, element_type)
+            if predicate is None:
+                return None
+            slot, body = predicate
+            return collection, slot, body
+
+        attr, enum = ATTRIBUTE_FILTERS[function]
+        value = self.compile(args[1], scope)
+        if collection.type != ITEMS or not (
+            value.constant and isinstance(value.value, enum)
+        ):
+            return None
+        slot, value = self.new_slot(), value.value
+        if attr == "color":
+            body = Node(lambda env: env[slot].color is value, BOOL, True)
+        elif attr == "shape":
+            body = Node(lambda env: env[slot].shape is value, BOOL, True)
+        else:
+            body = Node(lambda env: env[slot].size is value, BOOL, True)
+        return collection, slot, body
+
+    def get_loop(self, node, scope):
+        """
+        The loop of a filter given as argument (cf. `compile_loop`), or None.
+        """
+        if not (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id not in scope
+            and not node.keywords
+        ):
+            return None
+        function = LF_NAMESPACE.get(node.func.id)
+        if (
+            function is not logical_forms.filter_obj
+            and function not in ATTRIBUTE_FILTERS
+        ):
+            return None
+        return self.compile_loop(function, node.args, scope)
+
+    def compile_filter(self, function, args, scope):
+        loop = self.compile_loop(function, args, scope)
+        if loop is None:
+            return None
+        collection, slot, body = loop
+        source, predicate = collection.fn, body.fn
+
+        def fn(env):
+            result = []
+            for x in source(env):
+                env[slot] = x
+                if predicate(env):
+                    result.append(x)
+            return result
+
+        value_type = collection.type if collection.type in (ITEMS, BOXES) else ANY
+        return Node(fn, value_type, collection.safe and body.safe)
+
+    def compile_exist(self, function, args, scope):
+        if len(args) != 1:
+            return None
+        loop = self.get_loop(args[0], scope)
+        if loop is not None:
+            collection, slot, body = loop
+            source, predicate = collection.fn, body.fn
+            if body.safe:
+                # Stops at the first match
+                def fn(env):
+                    for x in source(env):
+                        env[slot] = x
+                        if predicate(env):
+                            return True
+                    return False
+
+            else:
+
+                def fn(env):
+                    found = False
+                    for x in source(env):
+                        env[slot] = x
+                        if predicate(env):
+                            found = True
+                    return found
+
+            return Node(fn, BOOL, collection.safe and body.safe)
+
+        (collection,) = self.compile_arguments(args, scope)
+        if collection.type in COLLECTIONS:
+            source = collection.fn
+            return Node(lambda env: len(source(env)) > 0, BOOL, collection.safe)
+        return self.call_function(function, [collection], BOOL)
+
+    def compile_count(self, function, args, scope):
+        if len(args) != 1:
+            return None
+        loop = self.get_loop(args[0], scope)
+        if loop is not None and loop[0].type in COLLECTIONS:
+            # The elements of the collection are distinct
+            collection, slot, body = loop
+            source, predicate = collection.fn, body.fn
+
+            def fn(env):
+                n = 0
+                for x in source(env):
+                    env[slot] = x
+                    if predicate(env):
+                        n += 1
+                return n
+
+            return Node(fn, INT, collection.safe and body.safe)
+
+        (collection,) = self.compile_arguments(args, scope)
+        if collection.type in COLLECTIONS:
+            source = collection.fn
+            return Node(lambda env: len(source(env)), INT, collection.safe)
+        return self.call_function(function, [collection], INT)
+
+    def compile_all(self, function, args, scope):
+        if len(args) != 2:
+            return None
+        collection = self.compile(args[0], scope)
+        predicate = self.compile_predicate(
+            args[1], scope, ELEMENT_TYPES.get(collection.type, ANY)
+        )
+        if (
+            collection.type not in COLLECTIONS
+            or predicate is None
+            or not predicate[1].safe
+        ):
+            return None
+        # True if all the predicates are True, on a non-empty collection
+        source, (slot, body) = collection.fn, predicate
+        predicate = body.fn
+
+        def fn(env):
+            elements = source(env)
+            if len(elements) == 0:
+                return False
+            for x in elements:
+                env[slot] = x
+                if predicate(env) is not True:
+                    return False
+            return True
+
+        return Node(fn, BOOL, collection.safe)
+
+    def compile_any(self, function, args, scope):
+        if len(args) != 2:
+            return None
+        collection = self.compile(args[0], scope)
+        predicate = self.compile_predicate(
+            args[1], scope, ELEMENT_TYPES.get(collection.type, ANY)
+        )
+        if predicate is None:
+            return None
+        # Stops at the first True, as `Any`
+        source, (slot, body) = collection.fn, predicate
+        predicate = body.fn
+
+        def fn(env):
+            for x in source(env):
+                env[slot] = x
+                if predicate(env) is True:
+                    return True
+            return False
+
+        return Node(fn, BOOL, collection.safe and body.safe)
+
+    # Logical operators and comparisons
+
+    def compile_and_or(self, function, args, scope):
+        if len(args) != 2:
+            return None
+        first, second = self.compile_arguments(args, scope)
+        if first.type != BOOL or second.type != BOOL:
+            return self.call_function(function, [first, second], BOOL)
+        a, b = first.fn, second.fn
+        if second.safe:
+            if function is logical_forms.AND:
+                fn = lambda env: a(env) and b(env)
+            else:
+                fn = lambda env: a(env) or b(env)
+        else:
+            # Both operands are evaluated, as `AND` and `OR`
+            if function is logical_forms.AND:
+
+                def fn(env):
+                    x, y = a(env), b(env)
+                    return x and y
+
+            else:
+
+                def fn(env):
+                    x, y = a(env), b(env)
+                    return x or y
+
+        return Node(fn, BOOL, first.safe and second.safe)
+
+    def compile_not(self, function, args, scope):
+        if len(args) != 1:
+            return None
+        (a,) = self.compile_arguments(args, scope)
+        if a.type != BOOL:
+            return self.call_function(function, [a], BOOL)
+        fn = a.fn
+        return Node(lambda env: not fn(env), BOOL, a.safe)
+
+    def compile_int_comparison(self, function, args, scope):
+        if len(args) != 2:
+            return None
+        a, b = self.compile_arguments(args, scope)
+        if a.type != INT or b.type != INT:
+            return self.call_function(function, [a, b], BOOL)
+        op, a_fn, b_fn = INT_COMPARISONS[function], a.fn, b.fn
+        return Node(lambda env: op(a_fn(env), b_fn(env)), BOOL, a.safe and b.safe)
+
+
+def compile_lf(expression: str):
+    """
+    Compile a logical form to a function of (all_boxes, all_items), as a tree of
+    specialized closures (cf. the module docstring).
+
+    Raises:
+        SyntaxError: if the logical form is not a Python expression
+        Unsupported: if the logical form uses a syntax that the compiler does not
+        support
+    """
+    tree = ast.parse("(\n" + expression + "\n)", mode="eval")
+    compiler = LogicalFormCompiler()
+    scope = {"all_boxes": (ALL_BOXES_SLOT, BOXES), "all_items": (ALL_ITEMS_SLOT, ITEMS)}
+    fn = compiler.compile(tree.body, scope).fn
+    num_variables = compiler.num_slots - 2
+
+    def run(all_boxes, all_items):
+        return fn([all_boxes, all_items] + [None] * num_variables)
+
+    return run
@@ -0,0 +1,571 @@
+"""
+Dependencies of the logical forms on the state, and incremental evaluation.
+
+Most logical forms only read the image through loops over the boxes or the items, whose
+predicates only read the box (or the item and its box) they are given, e.g.:
+
+    exist(filter_obj(all_boxes, lambda x: count(x.all_items_in_box()) == 2))
+    count(filter_obj(all_items, lambda x: is_yellow(x) and is_top(x))) >= 2
+
+Their result is then a combination of per-box sub-results. `analyze_lf` records what a
+logical form reads: whether it only reads the image through such per-box loops, and
+which attributes of the items it reads.
+
+The `IncrementalEvaluator` of a per-box logical form caches the sub-results of each loop
+by the content of the boxes. The actions change one box, and the states share the arrays
+of their other boxes (cf. `CompactImage`), so after an action only the sub-results of
+the changed box are computed: the structured representation of the other boxes is not
+even built. The logical forms which read the image as a whole are executed as usual (cf.
+`lilgym.envs.utils.compute_prediction`).
+"""
+
+import ast
+import inspect
+from typing import FrozenSet, NamedTuple, Tuple
+
+from lilgym.envs import logical_forms
+from lilgym.envs.lf_compiler import (
+    LF_NAMESPACE,
+    BOOL,
+    INT,
+    BOX,
+    ITEM,
+    ATTRIBUTE_FILTERS,
+    IMAGE_RELATIONS,
+    LogicalFormCompiler,
+    Node,
+    Unsupported,
+)
+from lilgym.envs.structured_rep_compact import CompactImage, to_nlvr_box
+
+
+# Names of the image in the logical forms
+IMAGE_NAMES = ("all_boxes", "all_items")
+
+# Attributes of the items read by the functions and methods of the logical forms
+COLOR, SHAPE, SIZE, POSITION = "color", "shape", "size", "position"
+ATTRIBUTES = frozenset([COLOR, SHAPE, SIZE, POSITION])
+FUNCTION_ATTRIBUTES = {
+    logical_forms.is_yellow: {COLOR},
+    logical_forms.is_blue: {COLOR},
+    logical_forms.is_black: {COLOR},
+    logical_forms.filter_color: {COLOR},
+    logical_forms.query_color: {COLOR},
+    logical_forms.get_set_colors: {COLOR},
+    logical_forms.all_same_color: {COLOR},
+    logical_forms.equal_color: {COLOR},
+    logical_forms.is_circle: {SHAPE},
+    logical_forms.is_square: {SHAPE},
+    logical_forms.is_triangle: {SHAPE},
+    logical_forms.filter_shape: {SHAPE},
+    logical_forms.query_shape: {SHAPE},
+    logical_forms.get_set_shapes: {SHAPE},
+    logical_forms.all_same_shape: {SHAPE},
+    logical_forms.equal_shape: {SHAPE},
+    logical_forms.is_big: {SIZE},
+    logical_forms.is_medium: {SIZE},
+    logical_forms.is_small: {SIZE},
+    logical_forms.filter_size: {SIZE},
+    logical_forms.query_size: {SIZE},
+    logical_forms.get_set_sizes: {SIZE},
+    logical_forms.all_same_size: {SIZE},
+    logical_forms.equal_size: {SIZE},
+    logical_forms.is_top: {POSITION},
+    logical_forms.is_bottom: {POSITION},
+    logical_forms.is_second: {POSITION, SHAPE, SIZE},
+    logical_forms.is_third: {POSITION, SHAPE, SIZE},
+    logical_forms.is_closely_touching: {POSITION, SIZE},
+    logical_forms.is_touching_wall: {POSITION, SIZE},
+    logical_forms.is_closely_touching_wall: {POSITION, SIZE},
+    logical_forms.is_close_to_wall: {POSITION, SIZE},
+    logical_forms.is_touching_corner: {POSITION, SIZE},
+    logical_forms.is_closely_touching_corner: {POSITION, SIZE},
+    logical_forms.is_closely_touching_specific_corner: {POSITION, SIZE},
+    logical_forms.is_close_to_corner: {POSITION, SIZE},
+    logical_forms.get_above: {POSITION, SHAPE, SIZE},
+    logical_forms.get_below: {POSITION, SHAPE, SIZE},
+    logical_forms.get_touching: {POSITION, SIZE},
+    logical_forms.get_closely_touching: {POSITION, SIZE},
+    logical_forms.get_box_all_above: {POSITION, SIZE},
+    logical_forms.get_box_all_below: {POSITION, SIZE},
+    logical_forms.get_img_all_above: {POSITION, SIZE},
+    logical_forms.get_img_all_below: {POSITION, SIZE},
+}
+# Functions which do not read the items themselves (they only combine values)
+NEUTRAL_FUNCTIONS = {
+    logical_forms.exist,
+    logical_forms.count,
+    logical_forms.unique,
+    logical_forms.filter_obj,
+    logical_forms.AND,
+    logical_forms.OR,
+    logical_forms.NOT,
+    logical_forms.All,
+    logical_forms.Any,
+    logical_forms.le,
+    logical_forms.ge,
+    logical_forms.lt,
+    logical_forms.gt,
+    logical_forms.equal_int,
+    logical_forms.member_of,
+    logical_forms.contained,
+    logical_forms.equal_set,
+    logical_forms.union,
+    logical_forms.union_all,
+    logical_forms.intersect,
+    logical_forms.intersect_all,
+    logical_forms.select,
+    logical_forms.combinations,
+    logical_forms.all_same,
+}
+METHOD_ATTRIBUTES = {
+    "color": {COLOR},
+    "shape": {SHAPE},
+    "size": {SIZE},
+    "is_tower": {SHAPE, SIZE, POSITION},
+    "all_items_in_box": set(),
+    "items": set(),
+    "box": set(),
+}
+# Loops whose result is a combination of per-box sub-results
+LOOPS = (logical_forms.exist, logical_forms.count, logical_forms.All, logical_forms.Any)
+
+# Maximum number of cached sub-results of a loop (the cache is cleared when it is full)
+MAX_CACHED_BOXES = 4096
+
+
+class LFDependencies(NamedTuple):
+    """
+    What a logical form reads from the state.
+
+    per_box: Whether the logical form only reads the image through loops over the boxes
+    or the items whose predicates only read their box (cf. the module docstring)
+    image_reads: The reads of the image as a whole (e.g. "all_items",
+    "get_img_all_above")
+    attributes: The attributes of the items which are read: "color", "shape", "size" and
+    "position"
+    num_loops: The number of per-box loops
+    """
+
+    per_box: bool
+    image_reads: Tuple[str, ...]
+    attributes: FrozenSet[str]
+    num_loops: int
+
+
+def resolve(node: ast.AST, bound: set):
+    """
+    The function or constant of the namespace that a name refers to (None for the other
+    names, and for the names of the variables in `bound`).
+    """
+    if isinstance(node, ast.Name) and node.id not in bound:
+        return LF_NAMESPACE.get(node.id)
+    return None
+
+
+def is_image(node: ast.AST, bound: set, name: str = None):
+    return (
+        isinstance(node, ast.Name)
+        and node.id in IMAGE_NAMES
+        and node.id not in bound
+        and (name is None or node.id == name)
+    )
+
+
+def get_loop(function, args, bound: set):
+    """
+    The (image name, predicate) of a per-box loop, given the function and the arguments
+    of a call, or None: `exist` or `count` of
+    `filter_obj(all_boxes|all_items, predicate)` or
+    `filter_color|shape|size(all_items, value)` (the predicate is None), and `All` or
+    `Any` of `(all_boxes|all_items, predicate)`.
+
+    The loops are only per-box outside of the lambdas (no variable is bound), so that
+    their predicates only read their box.
+    """
+    if bound:
+        return None
+    if function in (logical_forms.exist, logical_forms.count) and len(args) == 1:
+        inner = args[0]
+        if not (
+            isinstance(inner, ast.Call) and not inner.keywords and len(inner.args) == 2
+        ):
+            return None
+        filter_function = resolve(inner.func, bound)
+        collection, predicate = inner.args
+        if filter_function is logical_forms.filter_obj and is_image(collection, bound):
+            return collection.id, predicate
+        if filter_function in ATTRIBUTE_FILTERS and is_image(
+            collection, bound, "all_items"
+        ):
+            return collection.id, None
+    elif function in (logical_forms.All, logical_forms.Any) and len(args) == 2:
+        collection, predicate = args
+        if is_image(collection, bound):
+            return collection.id, predicate
+    return None
+
+
+class DependencyAnalyzer(ast.NodeVisitor):
+    """
+    Collects the reads of a logical form: `image_reads` outside of the per-box loops,
+    and the attributes of the items.
+    """
+
+    def __init__(self):
+        self.image_reads = []
+        self.attributes = set()
+        self.num_loops = 0
+        self.bound = set()
+
+    def visit_Name(self, node):
+        if is_image(node, self.bound):
+            self.image_reads.append(node.id)
+        function = resolve(node, self.bound)
+        if function is not None:
+            self.read_function(function)
+
+    def read_function(self, function):
+        if function in FUNCTION_ATTRIBUTES:
+            self.attributes.update(FUNCTION_ATTRIBUTES[function])
+            if function in IMAGE_RELATIONS:
+                self.image_reads.append(function.__name__)
+        elif function not in NEUTRAL_FUNCTIONS and inspect.isfunction(function):
+            # The other functions of the logical forms (e.g. all_same_attribute) may
+            # read anything (the builtins, e.g. min, only read through their lambdas)
+            self.attributes.update(ATTRIBUTES)
+
+    def visit_Attribute(self, node):
+        if (
+            not isinstance(node.value, ast.Name)
+            or resolve(node.value, self.bound) is None
+        ):
+            # Attribute of a value (not an enum constant)
+            self.attributes.update(METHOD_ATTRIBUTES.get(node.attr, ATTRIBUTES))
+            if node.attr == "image":
+                self.image_reads.append("image")
+        self.visit(node.value)
+
+    def visit_Lambda(self, node):
+        names = {argument.arg for argument in node.args.args}
+        bound = self.bound
+        self.bound = bound | names
+        self.visit(node.body)
+        self.bound = bound
+
+    def visit_Call(self, node):
+        function = resolve(node.func, self.bound)
+        loop = get_loop(function, node.args, self.bound) if not node.keywords else None
+        if loop is None:
+            self.generic_visit(node)
+            return
+        self.num_loops += 1
+        name, predicate = loop
+        if predicate is None:
+            # Filter on an attribute of the items
+            inner = node.args[0]
+            self.read_function(resolve(inner.func, self.bound))
+            self.visit(inner.args[1])
+        else:
+            self.visit(predicate)
+
+
+def analyze_lf(expression: str) -> LFDependencies:
+    """
+    Dependencies of a logical form on the state (cf. `LFDependencies`).
+    """
+    tree = ast.parse("(\n" + expression + "\n)", mode="eval")
+    analyzer = DependencyAnalyzer()
+    analyzer.visit(tree.body)
+    image_reads = tuple(dict.fromkeys(analyzer.image_reads))
+    return LFDependencies(
+        per_box=not image_reads and analyzer.num_loops > 0,
+        image_reads=image_reads,
+        attributes=frozenset(analyzer.attributes),
+        num_loops=analyzer.num_loops,
+    )
+
+
+class BoxRef:
+    """
+    A box of a CompactImage during an incremental evaluation: its content (the key of
+    the cached sub-results), and its structured representation (`structured_rep.Box`),
+    which is only built when a sub-result is not cached.
+    """
+
+    __slots__ = ("array", "key", "_box")
+
+    def __init__(self, array):
+        self.array = array
+        self.key = array.tobytes()
+        self._box = None
+
+    def get_box(self):
+        if self._box is None:
+            self._box = to_nlvr_box(self.array)
+        return self._box
+
+
+class IncrementalCompiler(LogicalFormCompiler):
+    """
+    Compiler of the per-box logical forms: the per-box loops are compiled to loops over
+    the `BoxRef`s of the boxes, with the sub-result of each box cached by its content.
+    The image is not available otherwise (the compilation raises `Unsupported`).
+    """
+
+    def __init__(self):
+        super().__init__()
+        for loop in LOOPS:
+            self.handlers[loop] = self.compile_box_loop
+
+    def compile_Name(self, node, scope):
+        if node.id in scope and scope[node.id][0] is None:
+            raise Unsupported("read of the image outside of a per-box loop")
+        return super().compile_Name(node, scope)
+
+    def compile_box_loop(self, function, args, scope):
+        bound = {name for name, (slot, _) in scope.items() if slot is not None}
+        loop = None
+        if not any(isinstance(arg, Node) for arg in args):
+            loop = get_loop(function, args, bound)
+        if loop is None:
+            return self.get_handler(function)(function, args, scope)
+        name, predicate = loop
+        if predicate is None:
+            inner = args[0]
+            filter_function = resolve(inner.func, bound)
+            slot, body = self.compile_attribute_filter(
+                filter_function, inner.args[1], scope
+            )
+        else:
+            element_type = BOX if name == "all_boxes" else ITEM
+            compiled = self.compile_predicate(predicate, scope, element_type)
+            if compiled is None:
+                raise Unsupported("predicate of a per-box loop")
+            slot, body = compiled
+        if name == "all_boxes":
+            return self.compile_boxes_loop(function, slot, body)
+        return self.compile_items_loop(function, slot, body)
+
+    def get_handler(self, function):
+        return {
+            logical_forms.exist: self.compile_exist,
+            logical_forms.count: self.compile_count,
+            logical_forms.All: self.compile_all,
+            logical_forms.Any: self.compile_any,
+        }[function]
+
+    def compile_attribute_filter(self, function, value_node, scope):
+        attr, enum = ATTRIBUTE_FILTERS[function]
+        value = self.compile(value_node, scope)
+        if not (value.constant and isinstance(value.value, enum)):
+            raise Unsupported("filter value")
+        slot, value = self.new_slot(), value.value
+        return slot, Node(lambda env: getattr(env[slot], attr) is value, BOOL, True)
+
+    def compile_boxes_loop(self, function, slot, body):
+        """
+        Loop over the boxes: the sub-result of a box is the value of the predicate.
+        """
+        cache = {}
+        predicate = body.fn
+
+        def get_value(env, ref):
+            value = cache.get(ref.key, cache)
+            if value is cache:
+                env[slot] = ref.get_box()
+                value = predicate(env)
+                if len(cache) >= MAX_CACHED_BOXES:
+                    cache.clear()
+                cache[ref.key] = value
+            return value
+
+        return self.combine(function, get_value, body.safe)
+
+    def compile_items_loop(self, function, slot, body):
+        """
+        Loop over the items: the sub-result of a box is the result of the loop over its
+        items.
+        """
+        cache = {}
+        predicate = body.fn
+        if function is logical_forms.count:
+            # Number of matches
+            def box_loop(env, items):
+                n = 0
+                for x in items:
+                    env[slot] = x
+                    if predicate(env):
+                        n += 1
+                return n
+
+        elif function is logical_forms.exist and body.safe:
+            # Stops at the first match
+            def box_loop(env, items):
+                for x in items:
+                    env[slot] = x
+                    if predicate(env):
+                        return True
+                return False
+
+        elif function is logical_forms.exist:
+
+            def box_loop(env, items):
+                found = False
+                for x in items:
+                    env[slot] = x
+                    if predicate(env):
+                        found = True
+                return found
+
+        elif function is logical_forms.All and body.safe:
+            # (Whether the box is empty, whether all the predicates are True)
+            def box_loop(env, items):
+                for x in items:
+                    env[slot] = x
+                    if predicate(env) is not True:
+                        return False, False
+                return len(items) == 0, True
+
+        elif function is logical_forms.All:
+
+            def box_loop(env, items):
+                values = []
+                for x in items:
+                    env[slot] = x
+                    values.append(predicate(env) is True)
+                return len(items) == 0, all(values)
+
+        else:
+
+            def box_loop(env, items):
+                for x in items:
+                    env[slot] = x
+                    if predicate(env) is True:
+                        return True
+                return False
+
+        def get_value(env, ref):
+            value = cache.get(ref.key, cache)
+            if value is cache:
+                value = box_loop(env, ref.get_box().items)
+                if len(cache) >= MAX_CACHED_BOXES:
+                    cache.clear()
+                cache[ref.key] = value
+            return value
+
+        if function is logical_forms.All and body.safe:
+            # True if all the predicates are True, on a non-empty image
+            def fn(env):
+                empty = True
+                for ref in env[0]:
+                    box_empty, value = get_value(env, ref)
+                    if not value:
+                        return False
+                    empty = empty and box_empty
+                return not empty
+
+            return Node(fn, BOOL, True)
+        if function is logical_forms.All:
+
+            def fn(env):
+                values = [get_value(env, ref) for ref in env[0]]
+                return not all(box_empty for box_empty, _ in values) and all(
+                    value for _, value in values
+                )
+
+            return Node(fn, BOOL, False)
+        if function is logical_forms.count:
+            return Node(
+                lambda env: sum([get_value(env, ref) for ref in env[0]]), INT, body.safe
+            )
+        if function is logical_forms.exist and not body.safe:
+            return Node(
+                lambda env: any([get_value(env, ref) for ref in env[0]]), BOOL, False
+            )
+
+        def fn(env):
+            for ref in env[0]:
+                if get_value(env, ref):
+                    return True
+            return False
+
+        return Node(fn, BOOL, body.safe)
+
+    def combine(self, function, get_value, safe):
+        """
+        Result of a loop over the boxes, from the values of the predicate on the boxes.
+        """
+        if function is logical_forms.count:
+            return Node(
+                lambda env: sum([1 for ref in env[0] if get_value(env, ref)]), INT, safe
+            )
+        if function is logical_forms.All:
+            # True if all the predicates are True, on a non-empty collection
+            if safe:
+
+                def fn(env):
+                    refs = env[0]
+                    if len(refs) == 0:
+                        return False
+                    for ref in refs:
+                        if get_value(env, ref) is not True:
+                            return False
+                    return True
+
+            else:
+
+                def fn(env):
+                    refs = env[0]
+                    if len(refs) == 0:
+                        return False
+                    return all([get_value(env, ref) is True for ref in refs])
+
+            return Node(fn, BOOL, safe)
+        if function is logical_forms.Any:
+
+            def fn(env):
+                for ref in env[0]:
+                    if get_value(env, ref) is True:
+                        return True
+                return False
+
+            return Node(fn, BOOL, safe)
+        if safe:
+
+            def fn(env):
+                for ref in env[0]:
+                    if get_value(env, ref):
+                        return True
+                return False
+
+            return Node(fn, BOOL, True)
+        return Node(
+            lambda env: any([get_value(env, ref) for ref in env[0]]), BOOL, False
+        )
+
+
+class IncrementalEvaluator:
+    """
+    Evaluation of a per-box logical form on CompactImages, with the sub-results of the
+    boxes cached by their content (cf. the module docstring).
+    """
+
+    def __init__(self, expression: str):
+        """
+        Raises:
+            Unsupported: if the logical form is not per-box
+        """
+        self.dependencies = analyze_lf(expression)
+        if not self.dependencies.per_box:
+            raise Unsupported("the logical form reads the image as a whole")
+        tree = ast.parse("(\n" + expression + "\n)", mode="eval")
+        compiler = IncrementalCompiler()
+        # Only the per-box loops read the image, as the BoxRefs in the first slot
+        scope = {name: (None, None) for name in IMAGE_NAMES}
+        self._fn = compiler.compile(tree.body, scope).fn
+        self._num_variables = compiler.num_slots - 1
+
+    def __call__(self, img_struct: CompactImage):
+        env = [[BoxRef(array) for array in img_struct]] + [None] * self._num_variables
+        return self._fn(env)
@@ -14,6 +14,7 @@ However, any such set of tokens must be a subset of the functions defined here.
 """
 
 from collections import namedtuple
+from collections.abc import Set
 from typing import Iterable
 import itertools
 
@@ -23,7 +24,126 @@ from lilgym.envs.structured_rep import Item, ALMOST_TOUCHING_MARGIN
 from lilgym.envs.structured_rep_enums import Size, Color, Shape, Relation, Side
 
 
+###################
+# sets of items
+####################
+
+
+class ItemSet(Set):
+    """
+    A set of items of a box, as a bitmask over the positions of the items in the box
+    (bit i is set if the i-th item of the box is in the set). The relation functions
+    return item sets, and the set functions (count, exist, union, intersect,
+    contained...) are integer operations on the masks of the item sets of a same box.
+    Otherwise, an item set behaves as a (frozen) Python set of items.
+    """
+
+    __slots__ = ("box", "mask")
+    # unhashable, as the sets
+    __hash__ = None
+
+    def __init__(self, box, mask: int = 0):
+        self.box = box
+        self.mask = mask
+
+    @classmethod
+    def _from_iterable(cls, it):
+        # results of the operators of `Set` with other collections
+        return set(it)
+
+    def __len__(self):
+        return bin(self.mask).count("1")
+
+    def __iter__(self):
+        items, mask = self.box.items, self.mask
+        while mask:
+            low = mask & -mask
+            yield items[low.bit_length() - 1]
+            mask ^= low
+
+    def __contains__(self, x):
+        if type(x) is Item:
+            return x.box is self.box and (self.mask >> x.index) & 1 == 1
+        # raises a TypeError for unhashable values, as the sets
+        hash(x)
+        return False
+
+    def __repr__(self):
+        return "ItemSet({})".format(list(self))
+
+    def same_box(self, other):
+        return type(other) is ItemSet and other.box is self.box
+
+    def __eq__(self, other):
+        if self.same_box(other):
+            return self.mask == other.mask
+        return Set.__eq__(self, other)
+
+    def __le__(self, other):
+        if self.same_box(other):
+            return self.mask & ~other.mask == 0
+        return Set.__le__(self, other)
+
+    def __ge__(self, other):
+        if self.same_box(other):
+            return other.mask & ~self.mask == 0
+        return Set.__ge__(self, other)
+
+    def __and__(self, other):
+        if self.same_box(other):
+            return ItemSet(self.box, self.mask & other.mask)
+        return Set.__and__(self, other)
+
+    def __or__(self, other):
+        if self.same_box(other):
+            return ItemSet(self.box, self.mask | other.mask)
+        return Set.__or__(self, other)
+
+    def __sub__(self, other):
+        if self.same_box(other):
+            return ItemSet(self.box, self.mask & ~other.mask)
+        return Set.__sub__(self, other)
+
+    # methods of the sets
+
+    def union(self, *others):
+        mask, box = self.mask, self.box
+        for other in others:
+            if type(other) is not ItemSet or other.box is not box:
+                return set(self).union(*others)
+            mask |= other.mask
+        return ItemSet(box, mask)
+
+    def intersection(self, *others):
+        mask, box = self.mask, self.box
+        for other in others:
+            if type(other) is not ItemSet or other.box is not box:
+                return set(self).intersection(*others)
+            mask &= other.mask
+        return ItemSet(box, mask)
+
+    def difference(self, *others):
+        mask, box = self.mask, self.box
+        for other in others:
+            if type(other) is not ItemSet or other.box is not box:
+                return set(self).difference(*others)
+            mask &= ~other.mask
+        return ItemSet(box, mask)
+
+    def issubset(self, other):
+        if self.same_box(other):
+            return self <= other
+        return set(self).issubset(other)
+
+    def issuperset(self, other):
+        if self.same_box(other):
+            return self >= other
+        return set(self).issuperset(other)
+
+
 def exist(_set: set):
+    if type(_set) is ItemSet:
+        return _set.mask != 0
     return count(_set) > 0
 
 
@@ -34,6 +154,9 @@ def unique(_set: set):
 
 
 def count(_set):
+    if type(_set) is ItemSet:
+        # the items of an item set are distinct
+        return len(_set)
     return len(set([id(x) for x in _set]))
 
 
@@ -290,6 +413,9 @@ def equal_int(a, b):
 
 
 def equal(a, b):
+    # the item sets are compared as the sets
+    a = set(a) if type(a) is ItemSet else a
+    b = set(b) if type(b) is ItemSet else b
     if type(a) == type(b):
         return a == b
     a = a if isinstance(a, list) else [a]
@@ -368,13 +494,29 @@ def get_img_all_below(s):
 
 
 def __relate(rel: Relation, item):
-    return set([x for x in get_box_exclusive(item) if __check_relation(x, item, rel)])
+    relations = item.box.get_relations()
+    if rel == Relation.ABOVE:
+        masks = relations.above
+    elif rel == Relation.BELOW:
+        masks = relations.below
+    elif rel == Relation.TOUCH:
+        masks = relations.touching
+    elif rel == Relation.CLOSELY_TOUCH:
+        masks = relations.closely_touching
+    else:
+        raise TypeError("{} is not a relation".format(rel))
+    return ItemSet(item.box, masks[item.index])
 
 
 def __relate_all(rel: Relation, item):
-    return set(
-        [x for x in get_box_exclusive(item) if __check_relation_all(x, item, rel)]
-    )
+    relations = item.box.get_relations()
+    if rel == Relation.ABOVE:
+        masks = relations.all_above
+    elif rel == Relation.BELOW:
+        masks = relations.all_below
+    else:
+        raise TypeError("{} is not a valid relation".format(rel))
+    return ItemSet(item.box, masks[item.index])
 
 
 def __relate_all_img(rel: Relation, item):
@@ -383,21 +525,6 @@ def __relate_all_img(rel: Relation, item):
     )
 
 
-def __check_relation(x, item, rel):
-    if rel == Relation.ABOVE:
-        return item.top <= x.bottom and (
-            item.is_touching(x) if item.box.is_tower() else True
-        )
-    if rel == Relation.BELOW:
-        return __check_relation(item, x, Relation.ABOVE)
-    if rel == Relation.TOUCH:
-        return item.is_touching(x)
-    if rel == Relation.CLOSELY_TOUCH:
-        return item.is_touching(x, use_margin=True)
-    else:
-        raise TypeError("{} is not a relation".format(rel))
-
-
 def __check_relation_all(x, item, rel):  # x is above item
     if rel == Relation.ABOVE:
         return item.top <= x.bottom
@@ -473,6 +600,8 @@ def member_of(item: Item, _set):
 
 
 def contained(set1, set2):
+    if type(set1) is ItemSet and type(set2) is ItemSet and set1.box is set2.box:
+        return set1.mask & ~set2.mask == 0
     for item in set1:
         if item not in set2:
             return False
@@ -506,6 +635,9 @@ def all_same_size(_set):
 
 
 def union_all(sets):
+    sets = list(sets)
+    if sets and type(sets[0]) is ItemSet:
+        return sets[0].union(*sets[1:])
     return set([item for subset in sets for item in subset])
 
 
@@ -521,6 +653,10 @@ def intersect_all(sets):
     l = list(sets)
     if count(l) == 0:
         return set()
+    if isinstance(sets, (list, tuple)) and type(l[0]) is ItemSet:
+        result = l[0].intersection(*l[1:])
+        if type(result) is ItemSet:
+            return list(result)
     return [x for x in l[0] if all([x in s for s in sets])]
 
 
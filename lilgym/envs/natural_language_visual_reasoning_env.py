@@ -1,26 +1,30 @@
-import time, copy
+import time
 from typing import Optional
 
 import numpy as np
-import skimage.measure
 
 import gymnasium as gym
 from gymnasium import spaces
 from gymnasium.utils import seeding
 
-from lilgym.data.utils import get_data
 from lilgym.envs.reward import Reward
 from lilgym.envs.utils import (
     is_action_valid,
     get_action_space,
+    get_flat_action_space,
     is_terminal,
     is_truncated,
     compute_prediction,
-    bool_from_string,
+    build_samples,
+    load_samples,
     can_force_stop,
 )
 from lilgym.envs.utils_image import get_base_image, draw_on_img
+from lilgym.envs.utils_raster import rasterize
 from lilgym.envs.vars import MAX_TIME_STEPS
+from lilgym.envs.truth_tables import TruthTables
+from lilgym.envs.sampler import Sampler, get_shard
+from lilgym.envs.utils_mask import get_action_mask
 from lilgym.envs.utils_state import ContextState
 from lilgym.envs.utils_action import (
     to_tower_action,
@@ -46,19 +50,47 @@ class NaturalLanguageVisualReasoningEnv(gym.Env):
         split: str = None,
         data: dict = None,
         evaluate: bool = False,
+        num_shards: int = 1,
+        shard: int = 0,
         horizon: int = MAX_TIME_STEPS,
+        keep_image: bool = False,
+        truth_tables: str = None,
+        sampling: str = "uniform",
+        sample_weights: dict = None,
+        flat_actions: bool = False,
+        return_action_mask: bool = False,
     ):
         """
         Args:
             appearance: Environment appearance option: "tower" or "scatter"
             starting_condition: The starting condition: "scratch" or "flipit"
 
-            data: Dictionary of the context and initial states
+            data: Dictionary of the context and initial states, or the data in the
+            binary format (cf. `lilgym.envs.binary_data.BinaryData`)
             split: The data split ("train", "dev", or "test").
             Note: split and data are mutually exclusive, and split is considered in priority.
 
             stop_forcing: Whether stop forcing (SF) is used or not
             evaluate: Whether evaluation mode is on
+            num_shards, shard: In evaluation mode, the samples are partitioned into
+            num_shards shards (cf. `lilgym.envs.sampler.get_shard`), and only the given
+            shard is evaluated (e.g. one shard per worker, cf. `lilgym.envs.evaluation`)
+            keep_image: Whether the full-resolution PIL image is kept up to date in the
+            states (e.g. for visualization). Otherwise, it is drawn from the structured
+            representation when the state is queried (cf. `get_state`). The observations
+            are computed from the structured representation in both cases.
+            truth_tables: Directory of the truth tables of the logical forms (Tower
+            only, cf. `lilgym.envs.truth_tables`). The logical forms are looked up in
+            the tables when available, and executed otherwise.
+            sampling: How the initial states are drawn at reset: "uniform", "epoch"
+            (shuffled epochs) or "weighted" (cf. `lilgym.envs.sampler.Sampler`). The
+            draws use the random generator of the environment, set with `seed`.
+            sample_weights: Weight of each example number, for the weighted sampling
+            flat_actions: Whether the action space is the Discrete space of the flat
+            action IDs (indices of the default actions). The IDs are accepted by `step`
+            in both cases.
+            return_action_mask: Whether the mask of the valid actions of the new state
+            (cf. `action_mask`) is returned in the info of `reset` and `step`
         """
         print(
             f"{appearance}-{starting_condition}-StopForcing-{stop_forcing} Environment initialized"
@@ -68,8 +100,19 @@ class NaturalLanguageVisualReasoningEnv(gym.Env):
         self._starting_condition = starting_condition
         self._stop_forcing = stop_forcing
         self._horizon = horizon
+        self._keep_image = keep_image
+        self._return_action_mask = return_action_mask
 
-        self.action_space = get_action_space(self._appearance)
+        assert (
+            truth_tables is None or appearance == "tower"
+        ), "The truth tables are only available for the Tower environments"
+        self._truth_tables = TruthTables(truth_tables) if truth_tables else None
+
+        self._flat_action_space = get_flat_action_space(self._appearance)
+        if flat_actions:
+            self.action_space = self._flat_action_space
+        else:
+            self.action_space = get_action_space(self._appearance)
 
         self._resize_width = 190
         self._resize_height = 50
@@ -87,31 +130,22 @@ class NaturalLanguageVisualReasoningEnv(gym.Env):
             }
         )
 
-        self._samples = {}
         assert (
             data or split
         ), "No data error: Either the split of the data needs to be specified, or the data needs to be given"
 
         if split:
-            data = get_data(self._appearance, self._starting_condition, split)
-        assert data is not None, "Must provide environment initial states."
-
-        for k in data.keys():
-            if self._starting_condition == "scratch":
-                self._samples[k] = ContextState(
-                    data[k]["sentence"], data[k]["lf"], [[], [], []], True
-                )
-            elif self._starting_condition == "flipit":
-                # The target bool will be converted to the inverse
-                self._samples[k] = ContextState(
-                    data[k]["sentence"],
-                    data[k]["lf"],
-                    data[k]["structured_rep"],
-                    not bool_from_string(data[k]["label"]),
-                )
+            # Loaded once per process, and shared by all the environments of the split
+            self._samples = load_samples(
+                self._appearance, self._starting_condition, split
+            )
+        else:
+            assert data is not None, "Must provide environment initial states."
+            self._samples = build_samples(self._starting_condition, data)
+        self._sampler = Sampler(list(self._samples.keys()), sampling, sample_weights)
 
         self._evaluate = evaluate
-        self._evaluate_list = list(self._samples.keys())
+        self._evaluate_list = get_shard(list(self._samples.keys()), num_shards, shard)
 
         self._time_step = 0
 
@@ -121,8 +155,16 @@ class NaturalLanguageVisualReasoningEnv(gym.Env):
         """
         Takes a step with the given action and returns next observation.
         """
+        # If action is a flat action ID, get the corresponding (prebuilt) Type[Action]
+        # object
+        if isinstance(action, (int, np.integer)):
+            action = self._flat_action_space.get_action(action)
+        # A 0-d np.array or torch.Tensor (ex. the argmax of a policy) is a flat action
+        # ID as well
+        elif getattr(action, "ndim", None) == 0:
+            action = self._flat_action_space.get_action(action.item())
         # If action is an iterable (ex. np.array or torch.Tensor), convert to an Type[Action] object
-        if not isinstance(action, Action):
+        elif not isinstance(action, Action):
             action = pad_action(action, self._appearance)
             action = to_action_class(action)
 
@@ -131,7 +173,7 @@ class NaturalLanguageVisualReasoningEnv(gym.Env):
         # Compute reward
         prediction = False
         if self._state.img_struct:  # if the image is not empty
-            prediction = compute_prediction(self._state.img_struct, self._state.lf)
+            prediction = self._predict(self._state)
         step_reward = self._reward_function(action, prediction)
 
         # Stop forcing
@@ -172,62 +214,100 @@ class NaturalLanguageVisualReasoningEnv(gym.Env):
 
         if self._evaluate:
             info["nb_to_evaluate"] = len(self._evaluate_list)
+        if self._return_action_mask:
+            info["action_mask"] = self.action_mask()
 
         return (
-            self._get_dict_obs(copy.deepcopy(self._state)),
+            self._get_dict_obs(self._state),
             step_reward,
             terminated,
             truncated,
             info,
         )
 
-    def _get_dict_obs(self, _state: ContextState):
-        img = np.array(_state.img, dtype=np.uint8)
-
-        image = np.zeros((self._resize_height, self._resize_width, 3), dtype=np.uint8)
-        image[:, :, :] = skimage.measure.block_reduce(img, (2, 2, 1), np.mean)
+    def _predict(self, _state: ContextState):
+        """
+        Result of the logical form on the current state, looked up in the truth tables
+        if possible.
+        """
+        if self._truth_tables is not None:
+            prediction = self._truth_tables.predict(_state.img_struct, _state.lf)
+            if prediction is not None:
+                return prediction
+        return compute_prediction(_state.img_struct, _state.lf)
 
+    def _get_dict_obs(self, _state: ContextState):
         return {
             "sentence": _state.sentence,
-            "image": image,
+            "image": rasterize(_state.img_struct),
             "target": 1 if self._starting_condition == "scratch" else int(_state.target_bool),
         }
 
-    def reset(self, options: Optional[dict] = None):
+    def reset(self, seed: Optional[int] = None, options: Optional[dict] = None):
+        if seed is not None:
+            self.seed(seed)
+
         if options:
             example_number = options["example_number"]
-            return self._get_dict_obs(self.reset_example(example_number)), {}
+            return (
+                self._get_dict_obs(self.reset_example(example_number)),
+                self._get_reset_info(),
+            )
 
         if self._evaluate:
             item = self._evaluate_list.pop()
             self._state = self.reset_example(item)
         else:
-            self._state = self.reset_example(
-                list(self._samples.keys())[np.random.choice(len(self._samples))]
-            )
-        return self._get_dict_obs(self._state), {}
+            self._state = self.reset_example(self._sampler.sample(self.np_random))
+        return self._get_dict_obs(self._state), self._get_reset_info()
+
+    def _get_reset_info(self):
+        if self._return_action_mask:
+            return {"action_mask": self.action_mask()}
+        return {}
 
     def reset_example(self, example_number):
         """
         Resets the environment and starts a new episode.
         """
         self._time_step = 0
-        self._state = copy.deepcopy(self._samples[str(example_number)])
+        sample = self._samples[str(example_number)]
 
-        self._reward_function = Reward(
-            self._state.lf, target_bool=self._state.target_bool
-        )
-
-        img, draw = get_base_image()
+        self._reward_function = Reward(sample.lf, target_bool=sample.target_bool)
 
-        if self._starting_condition == "flipit":
-            img = draw_on_img(img, self._state.img_struct)
+        img = None
+        if self._keep_image:
+            img, draw = get_base_image()
+            if self._starting_condition == "flipit":
+                img = draw_on_img(img, sample.img_struct)
 
-        self._state.img = img
+        # The samples are never modified: actions return new (copy-on-write) states
+        self._state = sample.replace(img=img)
         return self._state
 
+    def action_mask(self):
+        """
+        Mask of the valid actions in the current state (cf. `is_action_valid`), as a
+        boolean vector over the default actions (indexed by the flat action IDs).
+        """
+        return get_action_mask(self._appearance, self._state.img_struct)
+
+    def render(self):
+        """
+        Returns the full-resolution RGB image of the current state (for visualization).
+        """
+        return np.array(self._get_image(), dtype=np.uint8)
+
+    def _get_image(self):
+        img = self._state.img
+        if img is None:
+            img, draw = get_base_image()
+            img = draw_on_img(img, self._state.img_struct)
+        return img
+
     def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
+        self._sampler.reset()
         return seed
 
     def close(self):
@@ -237,4 +317,10 @@ class NaturalLanguageVisualReasoningEnv(gym.Env):
         return self._samples
 
     def get_state(self):
+        """
+        Returns the current state. Without `keep_image`, its full-resolution image is
+        drawn from the structured representation, as in `render`.
+        """
+        if self._state.img is None:
+            return self._state.replace(img=self._get_image())
         return self._state
@@ -0,0 +1,105 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+SAMPLING_MODES = ("uniform", "epoch", "weighted")
+
+
+def get_shard(sample_ids: List[str], num_shards: int, shard: int):
+    """
+    Example numbers of a shard of the samples: the samples are dealt round-robin to the
+    shards, so that the shards have the same size (up to one sample), and each shard
+    keeps their order (with one shard, all the samples in their order).
+    """
+    assert (
+        0 <= shard < num_shards
+    ), f"Invalid shard: {shard}, should be in [0, {num_shards})"
+    return list(sample_ids)[shard::num_shards]
+
+
+class Sampler:
+    """
+    Sampling of the initial states (example numbers) of an environment.
+
+    The example numbers are indexed once, when the environment is built, so that drawing
+    one is O(1) (O(log n) for the weighted sampling). The random generator is given at
+    each draw (the `np_random` of the environment), so that each environment has its own
+    reproducible stream of samples.
+
+    Sampling modes:
+    - "uniform": independent draws, uniformly over the samples
+    - "epoch": shuffled epochs, i.e. each sample is drawn once per epoch, in a random
+      order
+    - "weighted": independent draws, with probabilities proportional to the given
+      weights
+    """
+
+    def __init__(
+        self,
+        sample_ids: List[str],
+        mode: str = "uniform",
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Args:
+            sample_ids: The example numbers of the samples
+            mode: The sampling mode: "uniform", "epoch" or "weighted"
+            weights: Weight of each example number, for the weighted sampling
+            (the missing example numbers have a weight of 0)
+        """
+        if mode not in SAMPLING_MODES:
+            raise ValueError(
+                f"Invalid sampling mode: {mode}, should be one of {SAMPLING_MODES}"
+            )
+        assert len(sample_ids) > 0, "No sample to draw from"
+
+        self._sample_ids = list(sample_ids)
+        self._mode = mode
+
+        self._cumulative_weights = None
+        if mode == "weighted":
+            assert (
+                weights is not None
+            ), "The weighted sampling requires the weights of the samples"
+            weights = {str(k): v for k, v in weights.items()}
+            w = np.array(
+                [weights.get(k, 0.0) for k in self._sample_ids], dtype=np.float64
+            )
+            assert (
+                w >= 0
+            ).all() and w.sum() > 0, "The weights should be non-negative, and not all 0"
+            self._cumulative_weights = np.cumsum(w)
+
+        # Current epoch, for the shuffled-epoch sampling
+        self._order = None
+        self._position = 0
+
+    def __len__(self):
+        return len(self._sample_ids)
+
+    def reset(self):
+        """
+        Restarts the epoch (for the shuffled-epoch sampling), e.g. when the environment
+        is seeded.
+        """
+        self._order = None
+        self._position = 0
+
+    def sample(self, np_random: np.random.Generator):
+        """
+        Draws an example number with the given random generator.
+        """
+        if self._mode == "uniform":
+            index = np_random.integers(len(self._sample_ids))
+        elif self._mode == "weighted":
+            u = np_random.random() * self._cumulative_weights[-1]
+            index = np.searchsorted(self._cumulative_weights, u, side="right")
+            index = min(index, len(self._sample_ids) - 1)
+        else:
+            if self._order is None or self._position == len(self._order):
+                self._order = np_random.permutation(len(self._sample_ids))
+                self._position = 0
+            index = self._order[self._position]
+            self._position += 1
+        return self._sample_ids[index]
@@ -10,6 +10,7 @@ as dictionaries and list containing strings, and provide an interface through wh
 can be run on structured representations of images. 
 """
 
+import operator
 import typing
 
 from lilgym.envs.structured_rep_enums import Size, Color, Shape
@@ -18,22 +19,106 @@ from lilgym.envs.structured_rep_enums import Size, Color, Shape
 # constants:
 ALMOST_TOUCHING_MARGIN = 4
 
+# bits of the walls of a box touched by an item
+RIGHT_WALL, LEFT_WALL, BOTTOM_WALL, TOP_WALL = 1, 2, 4, 8
+# whether the walls touched by an item make a corner (two walls), by bits of the walls
+CORNERS = tuple(bin(walls).count("1") == 2 for walls in range(16))
+# the width of the items of each size (`Size.value` is a slow property of the enum)
+SIZE_WIDTHS = {size: size.value for size in Size}
 
-class Item:
+
+class _ItemSlots:
+    """
+    The attributes of an item: its color, size and shape, its coordinates (left, right,
+    top and bottom), the walls of its box it touches, and its box and position in the
+    box.
+    """
+
+    __slots__ = (
+        "color",
+        "size",
+        "shape",
+        "left",
+        "right",
+        "top",
+        "bottom",
+        "_walls",
+        "_close_walls",
+        "box",
+        "index",
+    )
+
+
+class _ItemBuilder(_ItemSlots):
+    """
+    A mutable item, which becomes an `Item` once its attributes are set.
+    """
+
+    __slots__ = ()
+
+
+class Item(_ItemSlots):
     """
     represents the basic building blocks of the structured representations - objects that have shape, color and 
     spatial location, each  belongs to a certain 'box'. 
+
+    The items are immutable: their coordinates and the walls they touch are computed
+    once, when they are built.
     """
 
-    def __init__(self, dic):
+    __slots__ = ()
+
+    def __new__(cls, dic):
         assert isinstance(dic, dict)
-        self.__y_loc = dic["y_loc"]
-        self.__x_loc = dic["x_loc"]
-        self.color = Color(dic["color"])
-        self.size = Size(dic["size"])
-        self.shape = Shape(dic["type"])
-        # a pointer to the containing box (List of Items). Added when the box constructor is done.
-        self.box = None
+        return cls.from_values(
+            dic["x_loc"],
+            dic["y_loc"],
+            Color(dic["color"]),
+            Size(dic["size"]),
+            Shape(dic["type"]),
+        )
+
+    @classmethod
+    def from_values(cls, x_loc, y_loc, color, size, shape, box=None, index=None):
+        """
+        builds an item from its coordinates and its (already resolved) color, size and
+        shape enums. The box and the position of the item in the box are set by the box
+        constructors.
+        """
+        item = object.__new__(_ItemBuilder)
+        item.color = color
+        item.size = size
+        item.shape = shape
+        # note: in the original representation the value of y_loc is bigger when the
+        # item is closer to the bottom. here it is switched in order to be more
+        # intuitive and match the regular notion of x,y axes.
+        width = SIZE_WIDTHS[size]
+        item.left = x_loc
+        item.right = right = x_loc + width
+        item.top = top = 100 - y_loc
+        item.bottom = bottom = top - width
+        # the walls touched by the item, without and with a margin
+        item._walls = (
+            (right >= 100) * RIGHT_WALL
+            | (x_loc <= 0) * LEFT_WALL
+            | (bottom <= 0) * BOTTOM_WALL
+            | (top >= 100) * TOP_WALL
+        )
+        item._close_walls = (
+            (right >= 100 - ALMOST_TOUCHING_MARGIN) * RIGHT_WALL
+            | (x_loc <= ALMOST_TOUCHING_MARGIN) * LEFT_WALL
+            | (bottom <= ALMOST_TOUCHING_MARGIN) * BOTTOM_WALL
+            | (top >= 100 - ALMOST_TOUCHING_MARGIN) * TOP_WALL
+        )
+        # a pointer to the containing box (List of Items), and the position of the item
+        # in the box.
+        item.box = box
+        item.index = index
+        item.__class__ = cls
+        return item
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'{}' object is immutable".format(type(self).__name__))
 
     def __repr__(self):
         return "{0} {1} {2} at x: ({3}-{4}) y: ({5},{6})".format(
@@ -47,74 +132,43 @@ class Item:
         ).lower()
 
     def __copy__(self):
-        return Item(
-            {
-                "y_loc": self.__y_loc,
-                "x_loc": self.__x_loc,
-                "color": self.color.name,
-                "size": self.size.name,
-                "type": self.shape.name,
-            }
+        return Item.from_values(
+            self.left, 100 - self.top, self.color, self.size, self.shape
         )
 
-    @property
-    def right(self):
-        return self.__x_loc + self.size.value
-
-    @property
-    def top(self):
-        return 100 - self.__y_loc
-
-    @property
-    def bottom(self):
-        return 100 - (self.__y_loc + self.size.value)
-
-    # note: in the original representation the value of y_loc is bigger when the item is closer to the bottom.
-    # here it is switched in order to be more intuitive and match the regular notion of x,y axes.
-
-    @property
-    def left(self):
-        return self.__x_loc
+    def __reduce__(self):
+        # the item of a box is pickled as its position in the box, which is rebuilt with
+        # its items
+        if self.box is not None:
+            return operator.getitem, (self.box, self.index)
+        return Item.from_values, (
+            self.left,
+            100 - self.top,
+            self.color,
+            self.size,
+            self.shape,
+        )
 
     # information concerning the spatial location of an item is provided to outside modules
     # through these methods alone. Logical forms cannot relate directly to an item's (x,y) coordinates
 
     def touching_right(self, use_margin=False):
-        margin = ALMOST_TOUCHING_MARGIN if use_margin else 0
-        return self.right >= 100 - margin
+        return (self._close_walls if use_margin else self._walls) & RIGHT_WALL != 0
 
     def touching_left(self, use_margin=False):
-        margin = ALMOST_TOUCHING_MARGIN if use_margin else 0
-        return self.left <= margin
+        return (self._close_walls if use_margin else self._walls) & LEFT_WALL != 0
 
     def touching_bottom(self, use_margin=False):
-        margin = ALMOST_TOUCHING_MARGIN if use_margin else 0
-        return self.bottom <= margin
+        return (self._close_walls if use_margin else self._walls) & BOTTOM_WALL != 0
 
     def touching_top(self, use_margin=False):
-        margin = ALMOST_TOUCHING_MARGIN if use_margin else 0
-        return self.top >= 100 - margin
+        return (self._close_walls if use_margin else self._walls) & TOP_WALL != 0
 
     def touching_wall(self, use_margin=False):
-        return (
-            self.touching_right(use_margin)
-            or self.touching_left(use_margin)
-            or self.touching_bottom(use_margin)
-            or self.touching_top(use_margin)
-        )
+        return (self._close_walls if use_margin else self._walls) != 0
 
     def touching_corner(self, use_margin=False):
-        return (
-            sum(
-                [
-                    self.touching_right(use_margin),
-                    self.touching_left(use_margin),
-                    self.touching_bottom(use_margin),
-                    self.touching_top(use_margin),
-                ]
-            )
-            == 2
-        )
+        return CORNERS[self._close_walls if use_margin else self._walls]
 
     def __distance(self, other):
         # in test assert that always >= 0 as items never overlap
@@ -130,18 +184,20 @@ class Item:
         )
 
     def is_touching(self, other, use_margin=False):
-        margin = ALMOST_TOUCHING_MARGIN if use_margin else 1
-        return (
-            self is not other
-            and self.box is other.box
-            and self.__distance(other) <= margin
-        )
+        if self is other or self.box is not other.box:
+            return False
+        if self.box is None:
+            margin = ALMOST_TOUCHING_MARGIN if use_margin else 1
+            return self.__distance(other) <= margin
+        relations = self.box.get_relations()
+        touching = relations.closely_touching if use_margin else relations.touching
+        return (touching[self.index] >> other.index) & 1 == 1
 
     def is_top(self):
-        return self.top == max(item.top for item in self.box)
+        return (self.box.get_top_bottom()[0] >> self.index) & 1 == 1
 
     def is_bottom(self):
-        return self.top == min(item.top for item in self.box)
+        return (self.box.get_top_bottom()[1] >> self.index) & 1 == 1
 
     def is_second(self):
         result = self.box.is_tower() and self.bottom == 21
@@ -151,11 +207,140 @@ class Item:
         return self.box.is_tower() and self.bottom == 42
 
 
-class Box:
-    def __init__(self, items_as_dicts: typing.List[dict]):
-        self.items = [Item(d) for d in items_as_dicts]
-        for item in self.items:
-            item.box = self
+class BoxRelations:
+    """
+    The spatial relations between the items of a box, computed at once on the first
+    query. Each relation is a list of bitmasks over the positions of the items in the
+    box: bit j of relation[i] is set if the j-th item is in the relation with the i-th
+    item (e.g. above[i] are the items above the i-th item, cf. the relation functions of
+    `logical_forms`).
+    """
+
+    __slots__ = (
+        "touching",
+        "closely_touching",
+        "above",
+        "below",
+        "all_above",
+        "all_below",
+    )
+
+    def __init__(self, box):
+        items = box.items
+        n = len(items)
+        bounds = [(item.left, item.right, item.bottom, item.top) for item in items]
+        touching, closely_touching, all_above, all_below = (
+            [0] * n,
+            [0] * n,
+            [0] * n,
+            [0] * n,
+        )
+        for i, (left, right, bottom, top) in enumerate(bounds):
+            for j in range(i + 1, n):
+                other_left, other_right, other_bottom, other_top = bounds[j]
+                distance = max(
+                    left - other_right,
+                    other_left - right,
+                    bottom - other_top,
+                    other_bottom - top,
+                )
+                if distance <= ALMOST_TOUCHING_MARGIN:
+                    closely_touching[i] |= 1 << j
+                    closely_touching[j] |= 1 << i
+                    if distance <= 1:
+                        touching[i] |= 1 << j
+                        touching[j] |= 1 << i
+                if top <= other_bottom:
+                    all_above[i] |= 1 << j
+                    all_below[j] |= 1 << i
+                if other_top <= bottom:
+                    all_above[j] |= 1 << i
+                    all_below[i] |= 1 << j
+        self.touching = touching
+        self.closely_touching = closely_touching
+        self.all_above = all_above
+        self.all_below = all_below
+        if box.is_tower():
+            # in the towers, the items above (or below) an item are the one touching it
+            self.above = [mask & touching[i] for i, mask in enumerate(all_above)]
+            self.below = [mask & touching[i] for i, mask in enumerate(all_below)]
+        else:
+            self.above = all_above
+            self.below = all_below
+
+
+class _BoxSlots:
+    """
+    The attributes of a box: its items, whether it is a tower, and the caches of the
+    relations between its items.
+    """
+
+    __slots__ = ("items", "_is_tower", "_relations", "_top_bottom")
+
+
+class _BoxBuilder(_BoxSlots):
+    """
+    A mutable box, which becomes a `Box` once its attributes are set.
+    """
+
+    __slots__ = ()
+
+    def build(self, cls, items):
+        self.items = items
+        is_tower = len(items) > 0
+        for item in items:
+            if item.shape != Shape.SQUARE or item.right != items[0].right:
+                is_tower = False
+                break
+        self._is_tower = is_tower
+        self._relations = None
+        self._top_bottom = None
+        self.__class__ = cls
+        return self
+
+
+class Box(_BoxSlots):
+    """
+    A box of the image: a list of items. The boxes are immutable: whether the box is a
+    tower is computed when it is built, and the relations between its items at the first
+    query.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, items_as_dicts: typing.List[dict]):
+        return cls.from_items([Item(d) for d in items_as_dicts])
+
+    @classmethod
+    def from_items(cls, items: typing.List[Item]):
+        """
+        builds a box from items which do not belong to a box yet (e.g. copies of the
+        items of another box): an item cannot be moved, since the relations of its box
+        are cached.
+        """
+        assert all(
+            item.box is None for item in items
+        ), "An item already belongs to a box"
+        box = object.__new__(_BoxBuilder)
+        for index, item in enumerate(items):
+            object.__setattr__(item, "box", box)
+            object.__setattr__(item, "index", index)
+        return box.build(cls, items)
+
+    @classmethod
+    def from_values(cls, values: typing.Iterable[tuple]):
+        """
+        builds a box from the (x_loc, y_loc, color, size, shape) of its items (cf.
+        `Item.from_values`).
+        """
+        box = object.__new__(_BoxBuilder)
+        items = []
+        for index, (x_loc, y_loc, color, size, shape) in enumerate(values):
+            items.append(Item.from_values(x_loc, y_loc, color, size, shape, box, index))
+        return box.build(cls, items)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'{}' object is immutable".format(type(self).__name__))
 
     def __repr__(self):
         return "Box({})".format(self.items)
@@ -174,18 +359,46 @@ class Box:
         return item in self.items
 
     def __copy__(self):
-        return Box([item.__copy__() for item in self.items])
+        return Box.from_items([item.__copy__() for item in self.items])
+
+    def __reduce__(self):
+        return Box.from_values, (
+            [
+                (item.left, 100 - item.top, item.color, item.size, item.shape)
+                for item in self.items
+            ],
+        )
 
     def is_tower(self):
-        return (
-            len(self.items) > 0
-            and all(s.shape == Shape.SQUARE for s in self.items)
-            and all(s.right == self.items[0].right for s in self.items)
-        )
+        return self._is_tower
 
     def all_items_in_box(self):
         return self.items
 
+    def get_relations(self):
+        """
+        The spatial relations between the items of the box (`BoxRelations`), computed
+        once.
+        """
+        if self._relations is None:
+            object.__setattr__(self, "_relations", BoxRelations(self))
+        return self._relations
+
+    def get_top_bottom(self):
+        """
+        The bitmasks of the items at the top of the box, and of the items whose top is
+        the lowest.
+        """
+        if self._top_bottom is None:
+            tops = [item.top for item in self.items]
+            highest, lowest = max(tops), min(tops)
+            top_bottom = (
+                sum(1 << i for i, top in enumerate(tops) if top == highest),
+                sum(1 << i for i, top in enumerate(tops) if top == lowest),
+            )
+            object.__setattr__(self, "_top_bottom", top_bottom)
+        return self._top_bottom
+
 
 class Image:
     """
@@ -195,6 +408,12 @@ class Image:
     def __init__(self, structured_rep: typing.List[typing.List[dict]]):
         self.boxes = [Box(items_as_dicts) for items_as_dicts in structured_rep]
 
+    @classmethod
+    def from_boxes(cls, boxes: typing.List[Box]):
+        image = cls.__new__(cls)
+        image.boxes = boxes
+        return image
+
     def __len__(self):
         return len(self.boxes)
 
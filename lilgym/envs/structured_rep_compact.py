@@ -0,0 +1,167 @@
+"""
+Compact structured representation of the images, used for the states of the
+environments.
+
+In the data, the structured representation of an image (`img_struct`) is a list of 3
+boxes, each box being a list of items given as dicts, e.g.
+{"x_loc": 40, "y_loc": 80, "type": "square", "color": "#0099ff", "size": 20}.
+
+A `CompactImage` holds instead one (n, 5) int16 array per box, with one row (x_loc,
+y_loc, type, color, size) per item: the type and the color are the integers of the
+`as_int` methods of the enums, and the size is the size in pixels. The arrays are
+read-only: adding or removing an item returns a new CompactImage, which shares its other
+boxes with the previous one. The same representation is used to render the observations,
+check the validity of the actions, and execute the logical forms (the
+`structured_rep.Image` is built from it with the enums already resolved).
+"""
+
+import numpy as np
+
+from lilgym.envs.structured_rep import Image as NLVRImage, Box
+from lilgym.envs.structured_rep_enums import Shape, Color, Size
+
+
+NUM_BOXES = 3
+
+# Columns of the item arrays
+X_LOC, Y_LOC, TYPE, COLOR, SIZE = range(5)
+NUM_FIELDS = 5
+
+SHAPES = [Shape.int_to_shape(i) for i in range(len(Shape))]
+COLORS = [Color.int_to_color(i) for i in range(len(Color) - 1)]  # Without GRAY
+
+# The enums of the integers of the item arrays, for the execution of the logical forms
+SHAPE_ENUMS = [Shape(shape) for shape in SHAPES]
+COLOR_ENUMS = [Color(color) for color in COLORS]
+SIZE_ENUMS = {size.value: size for size in Size}
+
+
+def item_to_row(obj):
+    """
+    Convert an item of the structured representation (dict) to a row of an item array.
+    """
+    return (
+        obj["x_loc"],
+        obj["y_loc"],
+        Shape(obj["type"]).as_int(),
+        Color(obj["color"]).as_int(),
+        obj["size"],
+    )
+
+
+def row_to_item(row):
+    """
+    Convert a row of an item array (as a list) to an item of the structured
+    representation (dict).
+    """
+    return {
+        "x_loc": row[X_LOC],
+        "y_loc": row[Y_LOC],
+        "type": SHAPES[row[TYPE]],
+        "color": COLORS[row[COLOR]],
+        "size": row[SIZE],
+    }
+
+
+def to_box_array(rows):
+    """
+    Build a (read-only) item array from a sequence of rows.
+    """
+    box = np.array(rows, dtype=np.int16).reshape(-1, NUM_FIELDS)
+    box.flags.writeable = False
+    return box
+
+
+def to_nlvr_box(box):
+    """
+    Build the `structured_rep.Box` of an item array.
+    """
+    return Box.from_values(
+        [
+            (x_loc, y_loc, COLOR_ENUMS[color], SIZE_ENUMS[size], SHAPE_ENUMS[shape])
+            for x_loc, y_loc, shape, color, size in box.tolist()
+        ]
+    )
+
+
+class CompactImage:
+    """
+    Structured representation of an image, as one read-only item array per box. Indexing
+    a CompactImage gives the item array of a box (its length is the number of items).
+    """
+
+    __slots__ = ("boxes",)
+
+    def __init__(self, boxes):
+        self.boxes = tuple(boxes)
+
+    @classmethod
+    def empty(cls):
+        return cls(to_box_array([]) for _ in range(NUM_BOXES))
+
+    @classmethod
+    def from_dicts(cls, img_struct):
+        """
+        Convert a structured representation in the JSON format (list of lists of dicts).
+        """
+        return cls(
+            to_box_array([item_to_row(obj) for obj in items]) for items in img_struct
+        )
+
+    def to_dicts(self):
+        """
+        Convert to a structured representation in the JSON format (list of lists of
+        dicts).
+        """
+        return [self.get_items(box) for box in range(len(self.boxes))]
+
+    def get_items(self, box: int):
+        """
+        The items of a box, as dicts.
+        """
+        return [row_to_item(row) for row in self.boxes[box].tolist()]
+
+    def add_item(self, box: int, obj):
+        """
+        Returns a new CompactImage with the item (dict) added at the end of the box.
+        """
+        rows = np.concatenate([self.boxes[box], to_box_array([item_to_row(obj)])])
+        return self.replace_box(box, rows)
+
+    def remove_item(self, box: int, index: int):
+        """
+        Returns a new CompactImage with the index-th item of the box removed.
+        """
+        return self.replace_box(box, np.delete(self.boxes[box], index, axis=0))
+
+    def replace_box(self, box: int, rows):
+        boxes = list(self.boxes)
+        boxes[box] = to_box_array(rows)
+        return CompactImage(boxes)
+
+    def to_nlvr_image(self):
+        """
+        Build the `structured_rep.Image` on which the logical forms are executed.
+        """
+        return NLVRImage.from_boxes([to_nlvr_box(box) for box in self.boxes])
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, box):
+        return self.boxes[box]
+
+    def __iter__(self):
+        return iter(self.boxes)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactImage):
+            return NotImplemented
+        return len(self.boxes) == len(other.boxes) and all(
+            np.array_equal(a, b) for a, b in zip(self.boxes, other.boxes)
+        )
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "CompactImage({})".format(self.to_dicts())
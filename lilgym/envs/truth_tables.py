@@ -0,0 +1,275 @@
+"""
+Exhaustive truth tables of the Tower logical forms.
+
+The Tower state space is small and closed: each of the 3 boxes holds a tower of 0 to 4
+squares of 3 colors, i.e. 1 + 3 + 9 + 27 + 81 = 121 configurations per box, and 121^3
+states in total. Each logical form can therefore be evaluated once over every state, and
+stored as a packed bitset (one bit per state) on disk. The environment then replaces the
+execution of the logical form by a lookup of the bit of the current state.
+
+The tables are built with:
+
+    python -m lilgym.envs.truth_tables --output tower_truth_tables/ --workers 16
+
+and used with `gym.make("TowerScratch-v0", ..., truth_tables="tower_truth_tables/")`.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from multiprocessing import Pool
+from typing import List, Optional
+
+import numpy as np
+
+from lilgym.data.utils import get_data, data_files, data_path
+from lilgym.envs.utils import compile_logical_form
+from lilgym.envs.structured_rep_enums import Shape
+from lilgym.envs.structured_rep_compact import CompactImage, to_box_array
+
+
+NUM_BOXES = 3
+NUM_COLORS = 3
+TOWER_MAX_ITEMS = 4
+# y-coordinates of the blocks of a tower, from the bottom to the top
+TOWER_Y_LOCS = [80, 59, 38, 17]
+TOWER_X_LOC = 40
+TOWER_SIZE = 20
+
+# Number of configurations of a box, and first index of the configurations with k blocks
+BOX_STATES = sum(NUM_COLORS**k for k in range(TOWER_MAX_ITEMS + 1))
+BOX_OFFSETS = [
+    sum(NUM_COLORS**j for j in range(k)) for k in range(TOWER_MAX_ITEMS + 1)
+]
+NUM_STATES = BOX_STATES**NUM_BOXES
+
+
+def get_box_index(colors: List[int]):
+    """
+    Index of a box configuration, given the colors of its blocks from the bottom to the
+    top.
+    """
+    index = BOX_OFFSETS[len(colors)]
+    for j, color in enumerate(colors):
+        index += color * NUM_COLORS**j
+    return index
+
+
+def get_box_configurations():
+    """
+    The colors of the blocks of each box configuration, in the order of their index.
+    """
+    configurations = [[]]
+    for k in range(1, TOWER_MAX_ITEMS + 1):
+        for index in range(NUM_COLORS**k):
+            configurations.append(
+                [(index // NUM_COLORS**j) % NUM_COLORS for j in range(k)]
+            )
+    return configurations
+
+
+def get_state_index(img_struct) -> Optional[int]:
+    """
+    Index of a Tower state in the truth tables, or None if the structured representation
+    (CompactImage) is not made of towers of blocks at the standard positions.
+    """
+    index = 0
+    for box in img_struct:
+        if len(box) > TOWER_MAX_ITEMS:
+            return None
+        colors = []
+        for j, (x_loc, y_loc, shape, color, size) in enumerate(box.tolist()):
+            if (
+                x_loc != TOWER_X_LOC
+                or y_loc != TOWER_Y_LOCS[j]
+                or size != TOWER_SIZE
+                or shape != Shape.SQUARE.as_int()
+            ):
+                return None
+            colors.append(color)
+        index = index * BOX_STATES + get_box_index(colors)
+    return index
+
+
+def get_box(colors: List[int]):
+    """
+    Item array of a tower, given the colors of its blocks from the bottom to the top.
+    """
+    return to_box_array(
+        [
+            (TOWER_X_LOC, TOWER_Y_LOCS[j], Shape.SQUARE.as_int(), color, TOWER_SIZE)
+            for j, color in enumerate(colors)
+        ]
+    )
+
+
+def get_img_struct(index: int):
+    """
+    Structured representation (CompactImage) of the Tower state of the given index.
+    """
+    configurations = get_box_configurations()
+    boxes = []
+    for _ in range(NUM_BOXES):
+        boxes.append(get_box(configurations[index % BOX_STATES]))
+        index //= BOX_STATES
+    return CompactImage(reversed(boxes))
+
+
+def get_digest(lf: str):
+    """
+    Name of the truth table of a logical form.
+    """
+    return hashlib.sha1(lf.encode("utf-8")).hexdigest()
+
+
+def evaluate_logical_forms(lfs: List[str]):
+    """
+    Evaluate the logical forms over every Tower state.
+
+    Returns:
+        List of packed bitsets (np.packbits of the NUM_STATES results), with None for
+        the logical forms that cannot be tabulated (i.e. raising an error or returning a
+        non-boolean value on some state)
+    """
+    programs = [compile_logical_form(lf) for lf in lfs]
+    results = np.zeros((len(lfs), NUM_STATES), dtype=bool)
+    failed = [False] * len(lfs)
+
+    # Each box configuration is built once per box position, and shared by the states
+    configurations = get_box_configurations()
+    boxes = [
+        CompactImage([get_box(colors)] * NUM_BOXES).to_nlvr_image().get_all_boxes()
+        for colors in configurations
+    ]
+
+    for index in range(NUM_STATES):
+        image = [
+            boxes[(index // BOX_STATES ** (NUM_BOXES - 1 - i)) % BOX_STATES][i]
+            for i in range(NUM_BOXES)
+        ]
+        all_items = [item for box in image for item in box]
+        for k, program in enumerate(programs):
+            if failed[k]:
+                continue
+            try:
+                result = program(image, all_items)
+            except Exception:
+                result = None
+            if type(result) is not bool:
+                failed[k] = True
+                continue
+            results[k, index] = result
+
+    return [None if failed[k] else np.packbits(results[k]) for k in range(len(lfs))]
+
+
+def get_tower_logical_forms(splits=("train", "dev", "test")):
+    """
+    The distinct logical forms of the Tower data files.
+    """
+    lfs = set()
+    for starting_condition in ["scratch", "flipit"]:
+        for split in splits:
+            filename = data_files[f"tower-{starting_condition}"][split]
+            if not os.path.exists(os.path.join(data_path, filename)):
+                continue
+            data = get_data("tower", starting_condition, split)
+            lfs.update(sample["lf"] for sample in data.values())
+    return sorted(lfs)
+
+
+def build_truth_tables(
+    lfs: List[str], output: str, workers: int = 1, batch_size: int = 32
+):
+    """
+    Build the truth tables of the logical forms with several processes, and save them
+    in the `output` directory (one `<digest>.npy` file per logical form, and an
+    `index.json` file listing the logical forms).
+    """
+    os.makedirs(output, exist_ok=True)
+    lfs = [
+        lf
+        for lf in lfs
+        if not os.path.exists(os.path.join(output, get_digest(lf) + ".npy"))
+    ]
+    batches = [lfs[i : i + batch_size] for i in range(0, len(lfs), batch_size)]
+
+    index_path = os.path.join(output, "index.json")
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            index = json.load(f)
+
+    with Pool(workers) as pool:
+        for batch, tables in zip(batches, pool.imap(evaluate_logical_forms, batches)):
+            for lf, table in zip(batch, tables):
+                if table is not None:
+                    np.save(os.path.join(output, get_digest(lf) + ".npy"), table)
+                index[get_digest(lf)] = {"lf": lf, "tabulated": table is not None}
+            with open(index_path, "w") as f:
+                json.dump(index, f, indent=1)
+    return index
+
+
+class TruthTables:
+    """
+    Truth tables of the Tower logical forms, loaded lazily (and memory-mapped) from the
+    directory built by `build_truth_tables`.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._tables = {}
+
+    def get_table(self, lf: str):
+        if lf not in self._tables:
+            filename = os.path.join(self._path, get_digest(lf) + ".npy")
+            self._tables[lf] = (
+                np.load(filename, mmap_mode="r") if os.path.exists(filename) else None
+            )
+        return self._tables[lf]
+
+    def lookup(self, lf: str, index: Optional[int]):
+        """
+        Result of the logical form on the state of the given index, or None if the
+        logical form (or the state) is not tabulated.
+        """
+        table = self.get_table(lf)
+        if table is None or index is None:
+            return None
+        return bool((table[index >> 3] >> (7 - (index & 7))) & 1)
+
+    def predict(self, img_struct, lf: str):
+        """
+        Result of the logical form on a structured representation, or None if it is not
+        tabulated.
+        """
+        if self.get_table(lf) is None:
+            return None
+        return self.lookup(lf, get_state_index(img_struct))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the truth tables of the Tower logical forms."
+    )
+    parser.add_argument("--output", required=True, help="Directory of the truth tables")
+    parser.add_argument("--splits", nargs="+", default=["train", "dev", "test"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--batch-size", type=int, default=32, help="Number of logical forms per task"
+    )
+    args = parser.parse_args()
+
+    lfs = get_tower_logical_forms(args.splits)
+    print(
+        f"Building the truth tables of {len(lfs)} logical forms "
+        f"over {NUM_STATES} states"
+    )
+    index = build_truth_tables(lfs, args.output, args.workers, args.batch_size)
+    print(f"{sum(v['tabulated'] for v in index.values())} logical forms tabulated")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
-from typing import List
+from collections.abc import Mapping
+from functools import lru_cache
 import random
 import numpy as np
-import torch
 
 from lilgym.envs.utils_image import SEP_WIDTH, BOX_SIZE
 from lilgym.envs.utils_image import (
@@ -11,54 +11,208 @@ from lilgym.envs.utils_image import (
     convert_action_to_img_coordinates,
 )
 
-from lilgym.envs.logical_forms import *
 from lilgym.envs.structured_rep import Image as NLVRImage
-from lilgym.envs.structured_rep import ALMOST_TOUCHING_MARGIN
-from lilgym.envs.structured_rep_enums import (
-    Size,
-    Color,
-    Shape,
-    Location,
-    Relation,
-    Side,
-)
 
 from lilgym.envs.action_space import (
     TowerActionSpace,
     ScatterActionSpace,
+    FlatActionSpace,
+    TOWER_DEFAULT_ACTION_ARRAYS,
+    SCATTER_DEFAULT_ACTION_ARRAYS,
     TOWER_MULTI,
     SCATTER_MULTI,
 )
 from lilgym.envs.utils_action import is_stop, is_add, is_remove
+from lilgym.envs.action_spaces import TOWER_DEFAULT_ACTIONS, SCATTER_DEFAULT_ACTIONS
+from lilgym.envs.utils_state import ContextState
+from lilgym.envs.structured_rep_compact import CompactImage
+from lilgym.envs.binary_data import BinaryData
+from lilgym.envs.lf_compiler import LF_NAMESPACE, Unsupported, compile_lf
+from lilgym.envs.lf_dependencies import IncrementalEvaluator
+from lilgym.data.utils import get_data
 
 
 def bool_from_string(tf_str):
     return tf_str == "true"
 
 
-def compute_prediction(img_struct: List, expression: str):
+@lru_cache(maxsize=None)
+def compile_logical_form(expression: str):
+    """
+    Compile a logical form to a function of (all_boxes, all_items), as a tree of
+    specialized closures (cf. `lilgym.envs.lf_compiler`), or with `eval` if the compiler
+    does not support its syntax. The compiled logical forms are cached by their text, so
+    that each logical form is only parsed and compiled once, and shared by all the
+    samples and environments of the process.
+
+    :param expression: a logical form (string)
+    :return: the compiled logical form
+    """
+    try:
+        return compile_lf(expression)
+    except Unsupported:
+        return compile_logical_form_with_eval(expression)
+
+
+def compile_logical_form_with_eval(expression: str):
+    """
+    Compile a logical form to a function of (all_boxes, all_items) with `eval`.
+    """
+    code = compile(
+        "lambda all_boxes, all_items: (\n" + expression + "\n)",
+        "<logical form>",
+        "eval",
+    )
+    return eval(code, LF_NAMESPACE)
+
+
+@lru_cache(maxsize=None)
+def get_incremental_evaluator(expression: str):
+    """
+    The incremental evaluator of a logical form (cf. `lilgym.envs.lf_dependencies`),
+    shared by all the environments of the process, or None if the logical form reads the
+    image as a whole.
+    """
+    try:
+        return IncrementalEvaluator(expression)
+    except Unsupported:
+        return None
+
+
+def compute_prediction(img_struct, expression: str):
     """
     Based on the code of Weakly Supervised Semantic Parsing with Abstract Examples, Goldman et al., 2019.
 
+    :param img_struct: the structured representation of an image (CompactImage, or in
+    the JSON format)
     :param expression: a logical form (string)
-    :param image: an object of type Image (a strutured representation of an image)
     :return: the result of executing the logical form on the structured representation
     """
-    result = False
-    # create constants
-    img_struct = NLVRImage(img_struct)
+    evaluator = None
+    if isinstance(img_struct, CompactImage):
+        # Only the boxes which changed since the last evaluation are evaluated
+        evaluator = get_incremental_evaluator(expression)
 
-    all_boxes = img_struct.get_all_boxes()
-    all_items = img_struct.get_all_items()
-    result = eval(
-        expression, globals().update({"all_boxes": all_boxes, "all_items": all_items})
-    )
+    if evaluator is not None:
+        result = evaluator(img_struct)
+    else:
+        if isinstance(img_struct, CompactImage):
+            img_struct = img_struct.to_nlvr_image()
+        else:
+            img_struct = NLVRImage(img_struct)
+
+        all_boxes = img_struct.get_all_boxes()
+        all_items = img_struct.get_all_items()
+        result = compile_logical_form(expression)(all_boxes, all_items)
 
     if type(result) is not bool:
         raise TypeError("parsing returned a non boolean type")
     return result
 
 
+def build_samples(starting_condition: str, data: dict):
+    """
+    Build the initial states of the environment from the data.
+
+    Args:
+        starting_condition: The starting condition: "scratch" or "flipit"
+        data: Dictionary of the context and initial states (cf.
+        `lilgym.data.utils.get_data`), or the data in the binary format (cf.
+        `lilgym.envs.binary_data.BinaryData`)
+
+    Returns:
+        samples (Dict[str, ContextState]): the initial state of each sample
+    """
+    if isinstance(data, BinaryData):
+        # The initial states are built when they are drawn
+        assert (
+            data.starting_condition == starting_condition
+        ), f"The data are for the starting condition {data.starting_condition}"
+        return data
+
+    # The samples of a logical form share the same string. The logical forms are
+    # compiled at their first execution (cf. `compile_logical_form`), so that building
+    # the environments does not pay for the logical forms which are never drawn
+    lfs = {}
+    for k in data.keys():
+        lfs.setdefault(data[k]["lf"], data[k]["lf"])
+
+    samples = {}
+    for k in data.keys():
+        lf = lfs[data[k]["lf"]]
+        if starting_condition == "scratch":
+            samples[k] = ContextState(
+                data[k]["sentence"], lf, CompactImage.empty(), True
+            )
+        elif starting_condition == "flipit":
+            # The target bool will be converted to the inverse
+            samples[k] = ContextState(
+                data[k]["sentence"],
+                lf,
+                CompactImage.from_dicts(data[k]["structured_rep"]),
+                not bool_from_string(data[k]["label"]),
+            )
+    return samples
+
+
+class SharedSamples(Mapping):
+    """
+    Read-only initial states of a split, shared by all the environments of the process
+    (cf. `load_samples`). The states are immutable, so copies (including deep copies of
+    the environments) return the same object.
+    """
+
+    def __init__(self, samples):
+        self._samples = samples
+        self._max_items = None
+
+    def __getitem__(self, key):
+        return self._samples[key]
+
+    def __iter__(self):
+        return iter(self._samples)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get_max_items(self):
+        if self._max_items is None:
+            self._max_items = max(
+                [len(items) for s in self._samples.values() for items in s.img_struct]
+                + [0]
+            )
+        return self._max_items
+
+
+@lru_cache(maxsize=None)
+def load_samples(appearance: str, starting_condition: str, split: str):
+    """
+    Initial states of a data split, loaded and built once per process: all the
+    environments created with the same (appearance, starting_condition, split) share
+    them.
+
+    Returns:
+        samples (SharedSamples): the initial state of each sample
+    """
+    data = get_data(appearance, starting_condition, split)
+    return SharedSamples(build_samples(starting_condition, data))
+
+
+def get_max_items(samples):
+    """
+    Maximum number of items in a box of the initial states.
+    """
+    if isinstance(samples, (BinaryData, SharedSamples)):
+        return samples.get_max_items()
+    return max([len(items) for s in samples.values() for items in s.img_struct] + [0])
+
+
 def get_action_space(appearance: str, seed: int = 1):
     if appearance == "tower":
         return TowerActionSpace(seed=seed)
@@ -66,6 +220,17 @@ def get_action_space(appearance: str, seed: int = 1):
         return ScatterActionSpace(seed=seed)
 
 
+def get_flat_action_space(appearance: str, seed: int = 1):
+    if appearance == "tower":
+        return FlatActionSpace(
+            TOWER_DEFAULT_ACTIONS, TOWER_DEFAULT_ACTION_ARRAYS, seed=seed
+        )
+    elif appearance == "scatter":
+        return FlatActionSpace(
+            SCATTER_DEFAULT_ACTIONS, SCATTER_DEFAULT_ACTION_ARRAYS, seed=seed
+        )
+
+
 def is_terminal(action, force_stop: bool = False):
     """
     Check whether the rollout is reaching an end state, i.e. if:
@@ -91,13 +256,13 @@ def can_force_stop(last_action, prediction: bool, target_bool: bool = True):
     return not is_stop(last_action) and (prediction == target_bool)
 
 
-def is_action_valid(appearance: str, img_struct: List, action):
+def is_action_valid(appearance: str, img_struct: CompactImage, action):
     """
     Check whether an action is valid.
     Returns:
         True for valid, False for invalid, -1 for irrelevant.
     """
-    if img_struct == None:
+    if img_struct is None:
         return -1
 
     # Special case: stop action is always valid
@@ -142,6 +307,8 @@ def is_action_valid(appearance: str, img_struct: List, action):
 
 
 def set_seeds(random_seed):
+    import torch
+
     torch.manual_seed(random_seed)
     torch.cuda.manual_seed_all(random_seed)
     np.random.seed(random_seed)
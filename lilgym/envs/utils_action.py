@@ -1,5 +1,5 @@
+import sys
 from abc import ABC, abstractmethod
-import torch
 import numpy as np
 
 from lilgym.envs.utils_image import (
@@ -88,8 +88,8 @@ class TowerAdd(Action):
         return np.array([1, self._box, self._color])
 
     def apply(self, state: ContextState) -> ContextState:
-        state.img_struct, state.img = draw_item_tower(self, state.img, state.img_struct)
-        return state
+        img_struct, img = draw_item_tower(self, state.img, state.img_struct)
+        return state.replace(img_struct=img_struct, img=img)
 
     def __repr__(self) -> str:
         return f'TowerAdd("{self._box_str}", {self._color_str}")'
@@ -112,10 +112,8 @@ class TowerRemove(Action):
         return np.array([2, self._box, -1])
 
     def apply(self, state: ContextState) -> ContextState:
-        state.img_struct, state.img = delete_item_tower(
-            self, state.img, state.img_struct
-        )
-        return state
+        img_struct, img = delete_item_tower(self, state.img, state.img_struct)
+        return state.replace(img_struct=img_struct, img=img)
 
     def __repr__(self) -> str:
         return f'TowerRemove("{self._box_str}")'
@@ -180,10 +178,8 @@ class ScatterAdd(Action):
         return np.array([1, self._x, self._y, self._shape, self._color, self._size])
 
     def apply(self, state: ContextState) -> ContextState:
-        state.img_struct, state.img = draw_item_scatter(
-            self, state.img, state.img_struct
-        )
-        return state
+        img_struct, img = draw_item_scatter(self, state.img, state.img_struct)
+        return state.replace(img_struct=img_struct, img=img)
 
     def __repr__(self) -> str:
         return f'ScatterAdd({self._x}, {self._y}, "{self._shape_str}", "{self._color_str}", "{self._size_str}")'
@@ -204,10 +200,8 @@ class ScatterRemove(Action):
         return np.array([2, self._x, self._y, -1, -1, -1])
 
     def apply(self, state: ContextState) -> ContextState:
-        state.img_struct, state.img = delete_item_scatter(
-            self, state.img, state.img_struct
-        )
-        return state
+        img_struct, img = delete_item_scatter(self, state.img, state.img_struct)
+        return state.replace(img_struct=img_struct, img=img)
 
     def __repr__(self) -> str:
         return f"ScatterRemove({self._x}, {self._y})"
@@ -225,13 +219,22 @@ def is_remove(action):
     return type(action) == TowerRemove or type(action) == ScatterRemove
 
 
+def is_tensor(obj):
+    """
+    Whether obj is a torch.Tensor, without importing torch: a tensor can only exist if
+    torch has already been imported.
+    """
+    torch = sys.modules.get("torch")
+    return torch is not None and isinstance(obj, torch.Tensor)
+
+
 def to_tower_action(raw_action):
     """
     For the Tower configuration.
     Takes a raw_action (iterable) and convert to a Type[Action] object
     (Stop, TowerAdd, or TowerRemove).
     """
-    if isinstance(raw_action, torch.Tensor):
+    if is_tensor(raw_action):
         action = raw_action.cpu().detach().numpy()
     action_type = raw_action[0]
     if action_type == 0:
@@ -252,7 +255,7 @@ def to_scatter_action(raw_action):
     Takes a raw_action (iterable) and convert to a Type[Action] object
     (Stop, TowerAdd, or TowerRemove).
     """
-    if isinstance(raw_action, torch.Tensor):
+    if is_tensor(raw_action):
         action = raw_action.cpu().detach().numpy()
     else:
         action = raw_action
@@ -278,13 +281,13 @@ def pad_action(action, appearance):
     if appearance == "tower":  # pad to length 3
         if len(action) == 3:
             return action
-        if isinstance(action, torch.Tensor):
+        if is_tensor(action):
             action = action.cpu().detach().numpy()
         return np.pad(action, (0, 3 - len(action)), constant_values=(-1,))
     elif appearance == "scatter":  # pad to length 6
         if len(action) == 6:
             return action
-        if isinstance(action, torch.Tensor):
+        if is_tensor(action):
             action = action.cpu().detach().numpy()
         return np.pad(action, (0, 6 - len(action)), constant_values=(-1,))
     else:
@@ -1,12 +1,12 @@
-from copy import deepcopy
+from functools import lru_cache
 
 from PIL import Image as PILImage
 from PIL import ImageDraw
-from shapely.geometry import Point, Polygon
-from shapely.ops import nearest_points
 
 from lilgym.envs.structured_rep import ALMOST_TOUCHING_MARGIN
 from lilgym.envs.structured_rep_enums import Shape, Color, Size
+from lilgym.envs.structured_rep_compact import Y_LOC
+from lilgym.envs import utils_occupancy
 
 
 NUM_BOXES = 3
@@ -19,11 +19,72 @@ SEP_WIDTH = 40
 
 OVERLAP_THRES = 0.5
 
+# Note: shapely is only used by the Scatter functions, so it is imported in them (at the
+# first use) rather than at the import of the module. The collisions between items are
+# checked with the occupancy masks of `utils_occupancy`, and shapely only computes the
+# decisions they leave undecided (and the "sticky" heuristic).
+
 # Size of 1 cell within the Scatter grid approximation
 # 380px is the width of the original image, divided into 19 cells (number of choices for action x)
 # 100px is the height of the original RGB image, divided into 5 cells (number of choices for action y)
 CELL_SIZE = 20  # = 380 / 19 or 100 / 5
 
+# Number of shapely geometries kept by `get_shape`
+SHAPE_CACHE_SIZE = 4096
+
+
+def get_item_bounds(obj, x_offset):
+    """
+    Get the pixel bounds of an item on the RGB image.
+
+    Args:
+        obj (Dict): structured representation of the item
+        x_offset (int): offset from the leftmost pixel of the image to
+        the box of the item
+
+    Returns:
+        x_start, y_start, x_end, y_end: the bounds of the item (included)
+    """
+    x_start = x_offset + obj["x_loc"]
+    y_start = obj["y_loc"]
+
+    # -1 because the methods in draw all include the second coordinate
+    x_end = int(x_start + obj["size"] / 10 * BOX_SIZE / BOX_OBJECT_RATIO) - 1
+    y_end = int(y_start + obj["size"] / 10 * BOX_SIZE / BOX_OBJECT_RATIO) - 1
+    return x_start, y_start, x_end, y_end
+
+
+def draw_item(draw, obj, x_offset):
+    """
+    Draw a single item on the PIL image.
+
+    Args:
+        draw (ImageDraw): drawing context of the image to be modified
+        obj (Dict): structured representation of the item
+        x_offset (int): offset from the leftmost pixel of the image to
+        the box of the item
+    """
+    x_start, y_start, x_end, y_end = get_item_bounds(obj, x_offset)
+
+    if obj["type"] == Shape.CIRCLE.value:
+        draw.ellipse(
+            [x_start, y_start, x_end, y_end],
+            fill=Color[Color(obj["color"]).name].as_rgb(),
+        )
+    elif obj["type"] == Shape.SQUARE.value:
+        draw.rectangle(
+            [x_start, y_start, x_end, y_end],
+            fill=Color[Color(obj["color"]).name].as_rgb(),
+        )
+    elif obj["type"] == Shape.TRIANGLE.value:
+        bottom_left = (x_start, y_end)
+        bottom_right = (x_end, y_end)
+        top = (x_end - int((x_end - x_start) / 2), y_start)
+        draw.polygon(
+            [bottom_left, bottom_right, top],
+            fill=Color[Color(obj["color"]).name].as_rgb(),
+        )
+
 
 def draw_on_img(img, img_struct):
     """
@@ -31,48 +92,77 @@ def draw_on_img(img, img_struct):
 
     Args:
         img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img_struct (CompactImage): structured representation of img
     
     Returns:
         img (PIL Image): modified image
     """
-    boxes = []
-    for box in img_struct:
-        new_box = []
-        for obj in box:
-            new_box.append(obj)
-        boxes.append(new_box)
-
     draw = ImageDraw.Draw(img)
 
-    for i, box in enumerate(boxes):
+    for i, box in enumerate(img_struct.to_dicts()):
         x_offset = int(BOX_SIZE * i + SEP_WIDTH * i)
         for obj in box:
-            x_start = x_offset + obj["x_loc"]
-            y_start = obj["y_loc"]
+            draw_item(draw, obj, x_offset)
+    return img
 
-            # -1 because the methods in draw all include the second coordinate
-            x_end = int(x_start + obj["size"] / 10 * BOX_SIZE / BOX_OBJECT_RATIO) - 1
-            y_end = int(y_start + obj["size"] / 10 * BOX_SIZE / BOX_OBJECT_RATIO) - 1
 
-            if obj["type"] == Shape.CIRCLE.value:
-                draw.ellipse(
-                    [x_start, y_start, x_end, y_end],
-                    fill=Color[Color(obj["color"]).name].as_rgb(),
-                )
-            elif obj["type"] == Shape.SQUARE.value:
-                draw.rectangle(
-                    [x_start, y_start, x_end, y_end],
-                    fill=Color[Color(obj["color"]).name].as_rgb(),
-                )
-            elif obj["type"] == Shape.TRIANGLE.value:
-                bottom_left = (x_start, y_end)
-                bottom_right = (x_end, y_end)
-                top = (x_end - int((x_end - x_start) / 2), y_start)
-                draw.polygon(
-                    [bottom_left, bottom_right, top],
-                    fill=Color[Color(obj["color"]).name].as_rgb(),
-                )
+def draw_added_item(img, obj, box):
+    """
+    Incremental rendering after an item is added: only the new item is drawn,
+    since it is the last one of its box and is drawn on top of the others.
+
+    Args:
+        img (PIL Image): image of the current state (not modified), or None if
+        only the structured representation is kept
+        obj (Dict): structured representation of the added item
+        box (int): the box the item is added to
+
+    Returns:
+        img (PIL Image): modified copy of the image (or None)
+    """
+    if img is None:
+        return None
+    img = img.copy()
+    x_offset = int(BOX_SIZE * box + SEP_WIDTH * box)
+    draw_item(ImageDraw.Draw(img), obj, x_offset)
+    return img
+
+
+def redraw_box(img, img_struct, box, removed_obj):
+    """
+    Incremental rendering after an item is removed: the affected box is cleared
+    (restored from the base image) and its remaining items are drawn again.
+    The other boxes are left untouched.
+
+    Args:
+        img (PIL Image): image of the current state (not modified), or None if
+        only the structured representation is kept
+        img_struct (CompactImage): structured representation of img, after the removal
+        box (int): the box the item is removed from
+        removed_obj (Dict): structured representation of the removed item
+
+    Returns:
+        img (PIL Image): modified copy of the image (or None)
+    """
+    if img is None:
+        return None
+    img = img.copy()
+    x_offset = int(BOX_SIZE * box + SEP_WIDTH * box)
+    x_start, y_start, x_end, y_end = get_item_bounds(removed_obj, x_offset)
+
+    # The region covers the removed item as well, in case it was drawn over the box
+    # limits (the boxes start at the top of the image)
+    region = (
+        max(0, int(min(x_offset, x_start))),
+        0,
+        min(img.width, int(max(x_offset + BOX_SIZE, x_end + 1))),
+        min(img.height, int(max(BOX_SIZE, y_end + 1))),
+    )
+    img.paste(BASE_IMAGE.crop(region), region[:2])
+
+    draw = ImageDraw.Draw(img)
+    for obj in img_struct.get_items(box):
+        draw_item(draw, obj, x_offset)
     return img
 
 
@@ -80,14 +170,16 @@ def draw_item_tower(action, img, img_struct):
     """
     Add an item according to a TowerAdd action to the PIL image,
     and to the structured representation of the image.
+    Neither img nor img_struct are modified in place: the modified copies are returned.
 
     Args:
         action (Type[Action])
-        img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img (PIL Image): image of the current state, or None if only the structured
+        representation is kept
+        img_struct (CompactImage): structured representation of img
     
     Returns:
-        img_struct (Dict[Dict[Dict]]): img_struct with item drawn (added)
+        img_struct (CompactImage): img_struct with item drawn (added)
         img (PIL Image)
     """
     box = action.box()
@@ -103,9 +195,9 @@ def draw_item_tower(action, img, img_struct):
 
     # Check if there's element and get the last element
     if len(box_to_modify) != 0:
-        prev_y_loc = box_to_modify[-1]["y_loc"]
+        prev_y_loc = int(box_to_modify[-1, Y_LOC])
         if prev_y_loc == 17:  # Cannot add anymore
-            return img_struct, draw_on_img(img, img_struct)
+            return img_struct, img
     else:
         prev_y_loc = 101  # 101-21 = 80
 
@@ -117,60 +209,41 @@ def draw_item_tower(action, img, img_struct):
         "size": curr_size,
     }
 
-    img_struct[box].append(curr_obj)
-    return img_struct, draw_on_img(img, img_struct)
+    img_struct = img_struct.add_item(box, curr_obj)
+    return img_struct, draw_added_item(img, curr_obj, box)
 
 
 def delete_item_tower(action, img, img_struct):
     """
     Remove an item according to a TowerRemove action from the PIL image,
     and from the structured representation of the image.
+    Neither img nor img_struct are modified in place: the modified copies are returned.
 
     Args:
         action (Type[Action])
-        img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img (PIL Image): image of the current state, or None if only the structured
+        representation is kept
+        img_struct (CompactImage): structured representation of img
     
     Returns:
-        img_struct (Dict[Dict[Dict]]): img_struct with item deleted
+        img_struct (CompactImage): img_struct with item deleted
         img (PIL Image)
     """
     box = action.box()
 
-    curr_size = 20
-    curr_x_loc = 40
-    curr_type = "square"
-    curr_color = "Gray"
-
-    # Find the box
-    box_to_modify = img_struct[box]
-
     # Check if there's element / get the last element
-    if len(box_to_modify) == 0:
-        return img_struct, draw_on_img(img, img_struct)
-
-    img_struct_for_delete = deepcopy(img_struct)
-
-    # Get the position of the latest block
-    prev_y_loc = box_to_modify[-1]["y_loc"]
+    if len(img_struct[box]) == 0:
+        return img_struct, img
 
-    item_to_modify = {
-        "size": curr_size,
-        "x_loc": curr_x_loc,
-        "type": curr_type,
-        "y_loc": prev_y_loc,
-        "color": curr_color,
-    }
-
-    img_struct[box].pop()
-    img_struct_for_delete[box].append(item_to_modify)
+    removed_obj = img_struct.get_items(box)[-1]
+    img_struct = img_struct.remove_item(box, -1)
 
-    return img_struct, draw_on_img(img, img_struct_for_delete)
+    return img_struct, redraw_box(img, img_struct, box, removed_obj)
 
 
-def get_base_image():
+def draw_base_image():
     """
-    At reset time, get the base image with gray background and the 2 box delimiters.
+    Draw the base image with gray background and the 2 box delimiters.
     """
     img = PILImage.new(
         "RGB", (int(BOX_SIZE * NUM_BOXES + SEP_WIDTH * (NUM_BOXES - 1)), BOX_SIZE)
@@ -190,7 +263,19 @@ def get_base_image():
         x_start = int(BOX_SIZE * (i + 1) + SEP_WIDTH * i)
         x_end = int(x_start + SEP_WIDTH) - 1
         draw.rectangle([x_start, 0, x_end, BOX_SIZE], fill=(128, 128, 128, 255))
-    return img, draw
+    return img
+
+
+BASE_IMAGE = draw_base_image()
+
+
+def get_base_image():
+    """
+    At reset time, get (a copy of) the base image with gray background and the 2 box
+    delimiters.
+    """
+    img = BASE_IMAGE.copy()
+    return img, ImageDraw.Draw(img)
 
 
 # Below are the functions used for Scatter only
@@ -215,7 +300,7 @@ def get_item_for_delete_scatter(action, img, img_struct):
     Args:
         action (Type[Action])
         img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img_struct (CompactImage): structured representation of img
     
     Returns:
         img_x (int): x-coordinate (in terms of pixels) on the RGB image
@@ -223,7 +308,7 @@ def get_item_for_delete_scatter(action, img, img_struct):
         x_offset (int): offset from the leftmost pixel of the image to 
         the current box
         box (int): the box the item is in
-        box_to_modify (List[Dict]): structured representation of the box
+        box_to_modify (List[Dict]): items of the box
         to modify
     """
     x, y = action.x(), action.y()
@@ -233,7 +318,7 @@ def get_item_for_delete_scatter(action, img, img_struct):
     x_offset = int(BOX_SIZE * box) + SEP_WIDTH * box
 
     # Find the box
-    box_to_modify = img_struct[box]
+    box_to_modify = img_struct.get_items(box)
     return img_x, img_y, x_offset, box, box_to_modify
 
 
@@ -245,7 +330,7 @@ def can_delete_item_scatter(action, img, img_struct, cell_size=CELL_SIZE):
     Args:
         action (Type[Action])
         img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img_struct (CompactImage): structured representation of img
         cell_size (int)
     
     Returns:
@@ -273,15 +358,17 @@ def delete_item_scatter(action, img, img_struct, cell_size=CELL_SIZE):
     (Try to) Delete an item specified by the action, on both
     the structured representation and the PILImage representation of
     the image.
+    Neither img nor img_struct are modified in place: the modified copies are returned.
 
     Args:
         action (Type[Action])
-        img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img (PIL Image): image of the current state, or None if only the structured
+        representation is kept
+        img_struct (CompactImage): structured representation of img
         cell_size (int)
     
     Returns:
-        img_struct (Dict[Dict[Dict]]): modified structured representation
+        img_struct (CompactImage): modified structured representation
         img (PIL Image)
     """
     x, y, x_offset, box, box_to_modify = get_item_for_delete_scatter(
@@ -290,23 +377,18 @@ def delete_item_scatter(action, img, img_struct, cell_size=CELL_SIZE):
 
     # Check if there's element / get the last element
     if len(box_to_modify) == 0:  # Cannot delete anymore
-        return img_struct, draw_on_img(img, img_struct)
-
-    img_struct_for_delete = deepcopy(img_struct)
-    curr_color = "Gray"
+        return img_struct, img
 
     # Find the maximum overlapping shape
     item_to_modify_idx = find_largest_item(x, y, cell_size, x_offset, box_to_modify)
 
-    # There is at least one item to be removed
-    if item_to_modify_idx != -1:
-        item_to_modify = deepcopy(box_to_modify[item_to_modify_idx])
+    # No item to be removed
+    if item_to_modify_idx == -1:
+        return img_struct, img
 
-        # Remove the element from the struct, but adding it for deletion
-        item_to_modify["color"] = curr_color
-        del img_struct[box][item_to_modify_idx]
-        img_struct_for_delete[box].append(item_to_modify)
-    return img_struct, draw_on_img(img, img_struct_for_delete)
+    removed_obj = box_to_modify[item_to_modify_idx]
+    img_struct = img_struct.remove_item(box, item_to_modify_idx)
+    return img_struct, redraw_box(img, img_struct, box, removed_obj)
 
 
 def get_item_for_draw_scatter(action, img, img_struct):
@@ -317,14 +399,14 @@ def get_item_for_draw_scatter(action, img, img_struct):
     Args:
         action (Type[Action])
         img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img_struct (CompactImage): structured representation of img
     
     Returns:
         curr_obj (Dict): structured representation of the item
         x_offset (int): offset from the leftmost pixel of the image to 
         the current box
         box (int): the box the item is in
-        shapes_in_box (List[shapely.geometry.BaseGeometry]): list of shapes in the current box
+        items_in_box (List[Dict]): list of items in the current box
     """
     x, y, shape, color, size = (
         action.x(),
@@ -351,11 +433,8 @@ def get_item_for_draw_scatter(action, img, img_struct):
     x_offset = int(BOX_SIZE * box) + SEP_WIDTH * box
 
     # Find the box
-    box_to_modify = img_struct[box]
-
-    # shapes_in_box has same order than box_to_modify (items in the box)
-    shapes_in_box = get_shapes_in_box(x_offset, box_to_modify)
-    return curr_obj, x_offset, box, shapes_in_box
+    items_in_box = img_struct.get_items(box)
+    return curr_obj, x_offset, box, items_in_box
 
 
 def can_draw_item_scatter(action, img, img_struct, cell_size=CELL_SIZE):
@@ -366,17 +445,17 @@ def can_draw_item_scatter(action, img, img_struct, cell_size=CELL_SIZE):
     Args:
         action (Type[Action])
         img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img_struct (CompactImage): structured representation of img
         cell_size (int)
     
     Returns:
         (bool)
     """
-    curr_obj, x_offset, box, shapes_in_box = get_item_for_draw_scatter(
+    curr_obj, x_offset, box, items_in_box = get_item_for_draw_scatter(
         action, img, img_struct
     )
 
-    valid, conflict_items = check_intersect(shapes_in_box, curr_obj, x_offset)
+    valid, conflict_items = check_intersect(items_in_box, curr_obj, x_offset)
 
     if not valid:
         return False
@@ -384,7 +463,7 @@ def can_draw_item_scatter(action, img, img_struct, cell_size=CELL_SIZE):
     # Otherwise, try to find a starting point in the cell where the shape can fit
     if conflict_items:
         curr_obj, possible_starting_coordinates = get_drawing_coordinates(
-            cell_size, box, shapes_in_box, curr_obj, x_offset
+            cell_size, box, items_in_box, curr_obj, x_offset
         )
         if not possible_starting_coordinates:
             return False
@@ -396,46 +475,48 @@ def draw_item_scatter(action, img, img_struct, cell_size=CELL_SIZE):
     (Try to) Draw an item specified by the action, on both
     the structured representation and the PILImage representation of
     the image.
+    Neither img nor img_struct are modified in place: the modified copies are returned.
 
     Args:
         action (Type[Action])
-        img (PIL Image): image to be modified
-        img_struct (Dict[Dict[Dict]]): structured representation of img
+        img (PIL Image): image of the current state, or None if only the structured
+        representation is kept
+        img_struct (CompactImage): structured representation of img
         cell_size (int)
     
     Returns:
-        img_struct (Dict[Dict[Dict]]): modified structured representation
+        img_struct (CompactImage): modified structured representation
         img (PIL Image)
     """
-    curr_obj, x_offset, box, shapes_in_box = get_item_for_draw_scatter(
+    curr_obj, x_offset, box, items_in_box = get_item_for_draw_scatter(
         action, img, img_struct
     )
 
     # If the shape can be drew without affecting other existing shapes, just draw it
-    valid, conflict_items = check_intersect(shapes_in_box, curr_obj, x_offset)
+    valid, conflict_items = check_intersect(items_in_box, curr_obj, x_offset)
 
     # Ex: drawing a shape over the box
     if not valid:
         # OK, since it means that it's not valid and the curr_obj has not been added
-        return img_struct, draw_on_img(img, img_struct)
+        return img_struct, img
 
     # Otherwise, try to find a starting point in the cell where the shape can fit
     if conflict_items:
         curr_obj, possible_starting_coordinates = get_drawing_coordinates(
-            cell_size, box, shapes_in_box, curr_obj, x_offset
+            cell_size, box, items_in_box, curr_obj, x_offset
         )
         if not possible_starting_coordinates:
-            return img_struct, draw_on_img(img, img_struct)
+            return img_struct, img
 
     # "Sticky": If the shape is very close to an existing one, stick both
     curr_shape, closest_shape, closest_i, closest_distance = check_closeness(
-        box, shapes_in_box, curr_obj, x_offset
+        box, items_in_box, curr_obj, x_offset
     )
     if closest_shape:
         curr_obj = make_sticky(curr_obj, curr_shape, closest_shape, x_offset)
 
-    img_struct[box].append(curr_obj)
-    return img_struct, draw_on_img(img, img_struct)
+    img_struct = img_struct.add_item(box, curr_obj)
+    return img_struct, draw_added_item(img, curr_obj, box)
 
 
 def get_box(x, cell_size=CELL_SIZE):
@@ -460,7 +541,7 @@ def get_box(x, cell_size=CELL_SIZE):
     return -1
 
 
-def get_drawing_coordinates(cell_size, box_nb, shapes_in_box, curr_obj, x_offset):
+def get_drawing_coordinates(cell_size, box_nb, items_in_box, curr_obj, x_offset):
     """
     If there are conflicting items in the cell, try to find a place in the cell 
     where the shape can fit.
@@ -468,7 +549,7 @@ def get_drawing_coordinates(cell_size, box_nb, shapes_in_box, curr_obj, x_offset
     Args:
         cell_size (int)
         box_nb (int)
-        shapes_in_box (List[shapely.geometry.BaseGeometry]): list of shapes in the current box
+        items_in_box (List[Dict]): list of items in the current box
         curr_obj (Dict)
         x_offset (int): offset from the leftmost pixel of the image to 
         the current box
@@ -491,31 +572,30 @@ def get_drawing_coordinates(cell_size, box_nb, shapes_in_box, curr_obj, x_offset
     x_start_limit, x_end_limit = x_start, x_start + cell_size
     y_start_limit, y_end_limit = y_start, y_start + cell_size
 
-    cell_shape = get_shape(
-        x_start_limit, y_start_limit, Shape.SQUARE.value, cell_size, x_offset
-    )
-
     x_limit = width - x_offset - curr_obj["size"]
     y_limit = height - curr_obj["size"]
 
-    for x in range(int(x_start_limit), min(int(x_limit), int(x_end_limit))):
-        for y in range(int(y_start_limit), min(int(y_limit), int(y_end_limit))):
-            curr_shape = get_shape(x, y, curr_obj["type"], curr_obj["size"], x_offset)
-
-            if all(
-                not curr_shape.intersection(shape).area > 0.0 for shape in shapes_in_box
-            ):
-                # Otherwise there can be float rounding error, ex. 0.499999999
-                percentage_current_shape = round(
-                    curr_shape.intersection(cell_shape).area / curr_shape.area, 2
-                )
-                percentage_cell = round(
-                    curr_shape.intersection(cell_shape).area / cell_shape.area, 2
+    # Note: width is not the width of the box (box_nb is the index of the box), so
+    # width - x_offset is -SEP_WIDTH for every box: x_limit is negative, and there is no
+    # position to try. This is the behavior of the original environment, which is kept.
+    xs = range(int(x_start_limit), min(int(x_limit), int(x_end_limit)))
+    ys = range(int(y_start_limit), min(int(y_limit), int(y_end_limit)))
+    if len(xs) == 0 or len(ys) == 0:
+        return curr_obj, possible_starting_coordinates
+
+    for x in xs:
+        for y in ys:
+            candidate = dict(curr_obj, x_loc=x, y_loc=y)
+
+            if all(not check_overlap(obj, candidate, x_offset) for obj in items_in_box):
+                in_cell = utils_occupancy.check_cell_overlap(
+                    candidate, x_start_limit, y_start_limit, cell_size
                 )
-                if (
-                    percentage_current_shape >= OVERLAP_THRES
-                    or percentage_cell >= OVERLAP_THRES
-                ):
+                if in_cell is None:
+                    in_cell = check_cell_overlap(
+                        candidate, x_start_limit, y_start_limit, cell_size, x_offset
+                    )
+                if in_cell:
                     # Use the first available starting position
                     curr_obj["x_loc"], curr_obj["y_loc"] = x, y
                     possible_starting_coordinates = True
@@ -524,9 +604,42 @@ def get_drawing_coordinates(cell_size, box_nb, shapes_in_box, curr_obj, x_offset
     return curr_obj, possible_starting_coordinates
 
 
+def check_cell_overlap(curr_obj, cell_x, cell_y, cell_size, x_offset):
+    """
+    Check (with shapely) if curr_obj is mostly in the cell starting at (cell_x, cell_y).
+
+    Args:
+        curr_obj (Dict)
+        cell_x (int): x-coordinate of the cell in the box
+        cell_y (int): y-coordinate of the cell
+        cell_size (int)
+        x_offset (int): offset from the leftmost pixel of the image to
+        the current box
+
+    Returns:
+        (bool)
+    """
+    cell_shape = get_shape(cell_x, cell_y, Shape.SQUARE.value, cell_size, x_offset)
+    curr_shape = get_shape(
+        curr_obj["x_loc"],
+        curr_obj["y_loc"],
+        curr_obj["type"],
+        curr_obj["size"],
+        x_offset,
+    )
+    # Otherwise there can be float rounding error, ex. 0.499999999
+    percentage_current_shape = round(
+        curr_shape.intersection(cell_shape).area / curr_shape.area, 2
+    )
+    percentage_cell = round(
+        curr_shape.intersection(cell_shape).area / cell_shape.area, 2
+    )
+    return percentage_current_shape >= OVERLAP_THRES or percentage_cell >= OVERLAP_THRES
+
+
 def check_closeness(
     box_nb,
-    shapes_in_box,
+    items_in_box,
     curr_obj,
     x_offset,
     up_thres=ALMOST_TOUCHING_MARGIN,
@@ -534,10 +647,11 @@ def check_closeness(
 ):
     """
     Check if curr_obj is close enough (given a threshold) to any other objects.
+    Only the items whose bounding box is close enough are compared with shapely.
 
     Args:
         box_nb (int)
-        shapes_in_box (List[shapely.geometry.BaseGeometry]): list of shapes in the current box
+        items_in_box (List[Dict]): list of items in the current box
         curr_obj (Dict)
         x_offset (int): offset from the leftmost pixel of the image to 
         the current box
@@ -546,15 +660,26 @@ def check_closeness(
     
     Returns:
         curr_shape (shapely.geometry.BaseGeometry): curr_obj under the shapely representation
+        (None if no item is close enough)
         closest_shape (shapely.geometry.BaseGeometry): closest item to curr_obj
-        closest_i (int): position of closest_shape in shapes_in_box
+        closest_i (int): position of closest_shape in items_in_box
         closest_distance (int)
     """
     closest_shape = None
     closest_distance = 200
-    if not shapes_in_box:
+    if not items_in_box:
         return None, closest_shape, -1, closest_distance
 
+    # The distance is at least the distance between the bounding boxes
+    max_bounds_distance = (up_thres + 1) ** 2
+    close_items = [
+        i
+        for i, obj in enumerate(items_in_box)
+        if utils_occupancy.get_bounds_distance(curr_obj, obj) <= max_bounds_distance
+    ]
+    if not close_items:
+        return None, closest_shape, -1, BOX_SIZE
+
     curr_shape = get_shape(
         curr_obj["x_loc"],
         curr_obj["y_loc"],
@@ -565,7 +690,11 @@ def check_closeness(
 
     closest_i = -1
     closest_distance = BOX_SIZE
-    for i, shape in enumerate(shapes_in_box):
+    for i in close_items:
+        obj = items_in_box[i]
+        shape = get_shape(
+            obj["x_loc"], obj["y_loc"], obj["type"], obj["size"], x_offset
+        )
         _d = int(curr_shape.distance(shape))  # int to avoid diagonal distances
         if low_thres <= _d <= up_thres and _d < closest_distance:
             closest_distance = _d
@@ -607,6 +736,8 @@ def make_sticky(curr_obj, curr_shape, closest_shape, x_offset):
     Returns:
         curr_obj (Dict): modified curr_obj
     """
+    from shapely.ops import nearest_points
+
     # Find where should be touching and where to start drawing the current shape.
     nearest = [o for o in nearest_points(curr_shape, closest_shape)]
 
@@ -623,9 +754,12 @@ def make_sticky(curr_obj, curr_shape, closest_shape, x_offset):
     return curr_obj
 
 
+@lru_cache(maxsize=SHAPE_CACHE_SIZE)
 def get_shape(x_loc, y_loc, obj_type, obj_size, x_offset):
     """
-    Get the shape under a shapely representation.
+    Get the shape under a shapely representation. The geometries are cached (the same
+    item is usually queried several times per step, and again at the next steps), so
+    they should not be modified.
 
     Args:
         x_loc: x_start in the box
@@ -638,6 +772,8 @@ def get_shape(x_loc, y_loc, obj_type, obj_size, x_offset):
     Returns
         shape (shapely.geometry.BaseGeometry): shapely representation of the object
     """
+    from shapely.geometry import Point, Polygon
+
     x_start = x_offset + x_loc
     y_start = y_loc
     # There's no -1 here, because shapely takes the limits in an inclusive way
@@ -658,34 +794,42 @@ def get_shape(x_loc, y_loc, obj_type, obj_size, x_offset):
     return shape
 
 
-def get_shapes_in_box(x_offset, items_in_box):
+def check_overlap(obj, curr_obj, x_offset):
     """
-    Get all the shapes within a box.
+    Check if the intersection of an item of the box and the current item has a positive
+    area, with the occupancy masks or, if they cannot decide, with shapely.
 
     Args:
-        x_offset (int): offset from the leftmost pixel of the image to 
+        obj (Dict): item of the box
+        curr_obj (Dict): current item
+        x_offset (int): offset from the leftmost pixel of the image to
         the current box
-        items_in_box (List[Dict]): list of items in the box
 
     Returns:
-        shapes_in_box (List[shapely.geometry.BaseGeometry]): list of items in the box
-        with the shapely representation
+        (bool)
     """
-    shapes_in_box = []
-    for obj_idx, obj in enumerate(items_in_box):
-        shapes_in_box.append(
-            get_shape(obj["x_loc"], obj["y_loc"], obj["type"], obj["size"], x_offset)
+    overlap = utils_occupancy.check_overlap(obj, curr_obj)
+    if overlap is None:
+        shape = get_shape(
+            obj["x_loc"], obj["y_loc"], obj["type"], obj["size"], x_offset
+        )
+        curr_shape = get_shape(
+            curr_obj["x_loc"],
+            curr_obj["y_loc"],
+            curr_obj["type"],
+            curr_obj["size"],
+            x_offset,
         )
-    return shapes_in_box
+        overlap = shape.intersection(curr_shape).area > 0
+    return overlap
 
 
-def check_intersect(shapes_in_box, curr_obj, x_offset):
+def check_intersect(items_in_box, curr_obj, x_offset):
     """
     Check if there's an intersection between the current item and the items already in the box.
     
     Args:
-        shapes_in_box (List[shapely.geometry.BaseGeometry]): list of items in the box
-        with the shapely representation
+        items_in_box (List[Dict]): list of items in the box
         curr_obj (Dict): item to be added
         x_offset (int): offset from the leftmost pixel of the image to 
         the current box
@@ -707,18 +851,9 @@ def check_intersect(shapes_in_box, curr_obj, x_offset):
         valid = False
         return valid, conflict_items
 
-    curr_shape = get_shape(
-        curr_obj["x_loc"],
-        curr_obj["y_loc"],
-        curr_obj["type"],
-        curr_obj["size"],
-        x_offset,
-    )
-
     # Check intersections
-    for obj_idx, shape in enumerate(shapes_in_box):
-        inter_area = shape.intersection(curr_shape).area
-        if inter_area > 0:
+    for obj_idx, obj in enumerate(items_in_box):
+        if check_overlap(obj, curr_obj, x_offset):
             conflict_items.append(obj_idx)
     return valid, conflict_items
 
@@ -739,6 +874,13 @@ def find_largest_item(x, y, cell_size, x_offset, items_in_box):
     Returns:
         max_shape_idx (int): index of the largest item overlapping with the cell
     """
+    max_shape_idx = utils_occupancy.find_largest_overlap(
+        items_in_box, x, y, min(x + cell_size, BOX_SIZE), min(y + cell_size, BOX_SIZE)
+    )
+    if max_shape_idx is not None:
+        return max_shape_idx
+
+    from shapely.geometry import Polygon
 
     # Create the cell object
     b_coord = {
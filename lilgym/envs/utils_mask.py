@@ -0,0 +1,175 @@
+"""
+Masks of the valid actions: for a state, the validity (as checked by `is_action_valid`)
+of each default action (`TOWER_DEFAULT_ACTIONS` or `SCATTER_DEFAULT_ACTIONS`), as a
+boolean vector indexed by the flat action IDs.
+
+The masks are computed in one vectorized pass over the default actions:
+- Tower: from the number of items in each box.
+- Scatter: the parts of the validity that only depend on the action (cell on a
+separator, large item at the right or bottom of a box, item outside of its box) are
+precomputed. The remaining checks only depend on the items of the box: an item can
+always be added in a cell when its bounding box does not overlap any item of the box,
+and an item can never be removed from a cell which does not overlap any item. The
+geometric checks (`can_draw_item_scatter` and `can_delete_item_scatter`) are only run
+for the other actions, once per cell, shape and size (the color of an item does not
+change where it can be drawn).
+"""
+
+import numpy as np
+
+from lilgym.envs.action_space import (
+    TOWER_DEFAULT_ACTION_ARRAYS,
+    SCATTER_DEFAULT_ACTION_ARRAYS,
+)
+from lilgym.envs.action_spaces import SCATTER_DEFAULT_ACTIONS
+from lilgym.envs.structured_rep_compact import CompactImage, X_LOC, Y_LOC, SIZE
+from lilgym.envs.structured_rep_enums import Size
+from lilgym.envs.utils_image import (
+    BOX_SIZE,
+    CELL_SIZE,
+    NUM_BOXES,
+    get_box,
+    convert_action_to_img_coordinates,
+    can_draw_item_scatter,
+    can_delete_item_scatter,
+)
+
+
+def get_tower_action_masks(counts):
+    """
+    Masks of the valid Tower actions.
+
+    Args:
+        counts (np.array): (N, 3) number of items in each box of N states
+
+    Returns:
+        (np.array): (N, len(TOWER_DEFAULT_ACTIONS)) boolean masks
+    """
+    types = TOWER_DEFAULT_ACTION_ARRAYS[:, 0]
+    boxes = np.maximum(TOWER_DEFAULT_ACTION_ARRAYS[:, 1], 0)
+    counts = np.asarray(counts)[:, boxes]
+    return (
+        (types == 0) | ((types == 1) & (counts != 4)) | ((types == 2) & (counts != 0))
+    )
+
+
+def get_scatter_action_tables():
+    """
+    Static tables of the Scatter default actions: type, box, and bounds (in the box) of
+    the item to add or of the cell to remove from, and whether the action can be valid
+    at all.
+    """
+    types = SCATTER_DEFAULT_ACTION_ARRAYS[:, 0]
+    n = len(types)
+    boxes = np.full(n, -1)
+    bounds = np.zeros((n, 4), dtype=np.int64)  # x1, y1, x2, y2
+    possible = types == 0
+    for i, action in enumerate(SCATTER_DEFAULT_ACTION_ARRAYS.tolist()):
+        action_type, x, y, shape, color, size = action
+        if action_type == 0:
+            continue
+        box = get_box(x)
+        boxes[i] = box
+        if box == -1:
+            continue
+        img_x, img_y = convert_action_to_img_coordinates(x, y, box)
+        img_x, img_y = int(img_x), int(img_y)
+        if action_type == 1:
+            size_px = Size.int_to_size(size)
+            bounds[i] = (img_x, img_y, img_x + size_px, img_y + size_px)
+            # Large items at the right or bottom of a box, and items outside of the box
+            possible[i] = not (size == 2 and (img_x == 80 or img_y == 80)) and (
+                img_x + size_px - 1 < BOX_SIZE and img_y + size_px - 1 < BOX_SIZE
+            )
+        else:
+            bounds[i] = (
+                img_x,
+                img_y,
+                min(img_x + CELL_SIZE, BOX_SIZE),
+                min(img_y + CELL_SIZE, BOX_SIZE),
+            )
+            possible[i] = True
+    return types, boxes, bounds, possible
+
+
+def get_scatter_action_groups():
+    """
+    For each Scatter default action, the first action with the same validity in every
+    state:
+    the first ADD action with the same cell, shape and size (any color), or itself.
+    """
+    first = {}
+    groups = []
+    for i, action in enumerate(SCATTER_DEFAULT_ACTION_ARRAYS.tolist()):
+        action_type, x, y, shape, color, size = action
+        key = (x, y, shape, size) if action_type == 1 else i
+        groups.append(first.setdefault(key, i))
+    return np.array(groups)
+
+
+(
+    SCATTER_TYPES,
+    SCATTER_BOXES,
+    SCATTER_BOUNDS,
+    SCATTER_POSSIBLE,
+) = get_scatter_action_tables()
+SCATTER_GROUPS = get_scatter_action_groups()
+
+
+def get_scatter_action_mask(img_struct: CompactImage):
+    """
+    Mask of the valid Scatter actions in a state.
+
+    Returns:
+        (np.array): (len(SCATTER_DEFAULT_ACTIONS),) boolean mask
+    """
+    mask = SCATTER_POSSIBLE.copy()
+    for box in range(NUM_BOXES):
+        items = img_struct[box]
+        in_box = SCATTER_BOXES == box
+        if len(items) == 0:
+            # Nothing to remove
+            mask[in_box & (SCATTER_TYPES == 2)] = False
+            continue
+
+        # Overlaps between the bounding boxes of the actions and of the items of the box
+        x1, y1 = items[:, X_LOC].astype(np.int64), items[:, Y_LOC].astype(np.int64)
+        x2, y2 = x1 + items[:, SIZE], y1 + items[:, SIZE]
+        candidates = np.flatnonzero(in_box & mask)
+        bounds = SCATTER_BOUNDS[candidates]
+        overlap = (
+            (bounds[:, 0:1] < x2)
+            & (bounds[:, 2:3] > x1)
+            & (bounds[:, 1:2] < y2)
+            & (bounds[:, 3:4] > y1)
+        ).any(axis=1)
+
+        # Removing from a cell without any item is invalid
+        removes = SCATTER_TYPES[candidates] == 2
+        mask[candidates[removes & ~overlap]] = False
+
+        # The other actions are checked geometrically, once per group
+        checked = {}
+        for i in candidates[overlap].tolist():
+            group = SCATTER_GROUPS[i]
+            if group not in checked:
+                action = SCATTER_DEFAULT_ACTIONS[group]
+                if SCATTER_TYPES[i] == 1:
+                    checked[group] = can_draw_item_scatter(action, None, img_struct)
+                else:
+                    checked[group] = can_delete_item_scatter(action, None, img_struct)
+            mask[i] = checked[group]
+    return mask
+
+
+def get_action_mask(appearance: str, img_struct: CompactImage):
+    """
+    Mask of the valid default actions in a state, indexed by the flat action IDs.
+    """
+    if appearance == "tower":
+        return get_tower_action_masks([[len(box) for box in img_struct]])[0]
+    elif appearance == "scatter":
+        return get_scatter_action_mask(img_struct)
+    raise ValueError(
+        f"Invalid appearance: {appearance}, should be 'tower' or 'scatter'"
+    )
@@ -0,0 +1,303 @@
+"""
+Occupancy masks of the Scatter items, to check the collisions between items with numpy
+slices instead of intersecting shapely geometries at each action.
+
+The items are at integer coordinates, so the geometry of an item (`get_shape`) only
+depends on its shape and size, up to a translation. It is rasterized once per (shape,
+size), on a grid of RESOLUTION x RESOLUTION sub-pixels per pixel (with a margin of PAD
+pixels), into:
+- touch: the sub-pixels whose interior intersects the interior of the item
+- inner: the sub-pixels inside the item
+- coverage: the area of the item in each pixel
+
+Two items overlap (intersection of positive area) if their inner masks intersect, and do
+not overlap if their touch masks are disjoint. The area of an item in a rectangle
+aligned on the pixels (e.g. a cell of the grid) is a sum of its coverage.
+
+The squares and triangles have their vertices on the pixels (or half pixels), so these
+decisions and areas are exactly those of shapely. The circles are polygons with
+floating-point vertices: their touch masks include a tolerance, and the decisions which
+depend on it (e.g. for a circle exactly touching another item, or ties between areas)
+are left undecided (None), for the caller to compute them with shapely.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from lilgym.envs.structured_rep_enums import Shape
+
+
+RESOLUTION = 4  # Sub-pixels per pixel, in each dimension
+PAD = 1  # Margin (in pixels) around the items in the masks
+
+# Tolerance on the floating-point geometry of the circles
+TOLERANCE = 1e-6
+
+# Threshold of the rounded overlap ratios in `get_drawing_coordinates`
+# (round(ratio, 2) >= 0.5 only depends on the side of 0.495 the ratio is on)
+ROUNDING_THRES = 0.495
+
+
+class ItemMasks:
+    """
+    Masks of an item of a given shape and size, placed at (0, 0).
+
+    The masks of sub-pixels cover [-PAD, size + PAD] pixels in both dimensions, and are
+    indexed [y, x]. The coverage is indexed by pixel, over [0, size].
+    """
+
+    __slots__ = ("touch", "inner", "coverage", "area", "exact")
+
+    def __init__(self, touch, inner, coverage, area, exact):
+        self.touch = touch
+        self.inner = inner
+        self.coverage = coverage
+        self.area = area
+        # Whether the decisions computed from the masks are those of shapely
+        self.exact = exact
+
+
+def get_half_planes(vertices):
+    """
+    Outward normals and offsets of the edges of a convex polygon: the polygon is the set
+    of points p such that normals @ p <= offsets.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    if np.allclose(vertices[0], vertices[-1]):
+        vertices = vertices[:-1]
+    edges = np.roll(vertices, -1, axis=0) - vertices
+    normals = np.stack([edges[:, 1], -edges[:, 0]], axis=1)
+    offsets = (normals * vertices).sum(axis=1)
+    # Orient the normals away from the centroid
+    flip = normals @ vertices.mean(axis=0) > offsets
+    normals[flip] *= -1
+    offsets[flip] *= -1
+    keep = (normals != 0).any(axis=1)  # Repeated vertices
+    return vertices, normals[keep], offsets[keep]
+
+
+def classify_cells(vertices, start, step, n, tolerance):
+    """
+    Classify the n x n square cells of side `step` starting at (start, start) against a
+    convex polygon, with the separating axis theorem.
+
+    Returns:
+        touch (np.array): whether the interior of each cell intersects the interior of
+        the polygon (or comes within `tolerance` of it)
+        inner (np.array): whether each cell is inside the polygon (by at least
+        `tolerance`)
+    """
+    vertices, normals, offsets = get_half_planes(vertices)
+    x0 = start + step * np.arange(n, dtype=np.float64)
+    y0, x0 = np.meshgrid(x0, x0, indexing="ij")
+    x1, y1 = x0 + step, y0 + step
+
+    # Projections of the cells on the normals of the polygon
+    nx, ny = normals[:, 0], normals[:, 1]
+    cell_min = np.where(nx >= 0, x0[..., None] * nx, x1[..., None] * nx) + np.where(
+        ny >= 0, y0[..., None] * ny, y1[..., None] * ny
+    )
+    cell_max = np.where(nx >= 0, x1[..., None] * nx, x0[..., None] * nx) + np.where(
+        ny >= 0, y1[..., None] * ny, y0[..., None] * ny
+    )
+    lengths = np.linalg.norm(normals, axis=1)
+    vertex_min = (vertices @ normals.T).min(axis=0)
+
+    inner = (cell_max <= offsets - tolerance * lengths).all(axis=-1)
+    touch = (
+        (cell_min < offsets + tolerance * lengths).all(axis=-1)
+        & (cell_max > vertex_min - tolerance * lengths).all(axis=-1)
+        & (x1 > vertices[:, 0].min() - tolerance)
+        & (x0 < vertices[:, 0].max() + tolerance)
+        & (y1 > vertices[:, 1].min() - tolerance)
+        & (y0 < vertices[:, 1].max() + tolerance)
+    )
+    return touch, inner
+
+
+@lru_cache(maxsize=None)
+def get_item_masks(obj_type: str, obj_size: int):
+    """
+    Masks of an item (cf. `ItemMasks`), computed once per shape and size.
+    """
+    # Imported here since utils_image depends on this module
+    from shapely.geometry import box as rectangle
+    from lilgym.envs.utils_image import get_shape
+
+    shape = get_shape(0, 0, obj_type, obj_size, 0)
+    vertices = list(shape.exterior.coords)
+    exact = obj_type != Shape.CIRCLE.value
+    tolerance = 0.0 if exact else TOLERANCE
+
+    n = (obj_size + 2 * PAD) * RESOLUTION
+    touch, inner = classify_cells(vertices, -PAD, 1 / RESOLUTION, n, tolerance)
+
+    # Area of the item in each pixel: only the pixels on its border need shapely
+    pixel_touch, pixel_inner = classify_cells(vertices, 0, 1, obj_size, 0.0)
+    coverage = pixel_inner.astype(np.float64)
+    for y, x in zip(*np.nonzero(pixel_touch & ~pixel_inner)):
+        coverage[y, x] = shape.intersection(rectangle(x, y, x + 1, y + 1)).area
+
+    for mask in (touch, inner, coverage):
+        mask.flags.writeable = False
+    return ItemMasks(touch, inner, coverage, shape.area, exact)
+
+
+def get_position(obj):
+    """
+    Integer position of an item (dict), or None if it is not on the pixels.
+    """
+    x, y = obj["x_loc"], obj["y_loc"]
+    if x != int(x) or y != int(y):
+        return None
+    return int(x), int(y)
+
+
+def check_overlap(obj_a, obj_b):
+    """
+    Whether two items (dicts) of a box overlap, i.e. the area of their intersection is
+    positive.
+
+    Returns:
+        (bool): the decision, or None if it has to be computed with shapely
+    """
+    pos_a, pos_b = get_position(obj_a), get_position(obj_b)
+    if pos_a is None or pos_b is None:
+        return None
+    (xa, ya), (xb, yb) = pos_a, pos_b
+    size_a, size_b = obj_a["size"], obj_b["size"]
+
+    # Intersection of the masks, in pixels relative to the mask of a
+    x1, x2 = max(-PAD, xb - xa - PAD), min(size_a, xb - xa + size_b) + PAD
+    y1, y2 = max(-PAD, yb - ya - PAD), min(size_a, yb - ya + size_b) + PAD
+    if x1 >= x2 or y1 >= y2:
+        return False
+
+    masks_a = get_item_masks(obj_a["type"], size_a)
+    masks_b = get_item_masks(obj_b["type"], size_b)
+    window_a = (
+        slice((y1 + PAD) * RESOLUTION, (y2 + PAD) * RESOLUTION),
+        slice((x1 + PAD) * RESOLUTION, (x2 + PAD) * RESOLUTION),
+    )
+    dx, dy = (xa - xb) * RESOLUTION, (ya - yb) * RESOLUTION
+    window_b = (
+        slice(window_a[0].start + dy, window_a[0].stop + dy),
+        slice(window_a[1].start + dx, window_a[1].stop + dx),
+    )
+    if (masks_a.inner[window_a] & masks_b.inner[window_b]).any():
+        return True
+    if not (masks_a.touch[window_a] & masks_b.touch[window_b]).any():
+        return False
+    return None
+
+
+def get_rect_area(obj, x1, y1, x2, y2):
+    """
+    Area of the intersection of an item (dict) with the rectangle [x1, x2] x [y1, y2]
+    (integer bounds).
+
+    Returns:
+        area (float): the area, or None if the item or the rectangle is not on the
+        pixels
+        near (bool): whether the item comes (within the tolerance) into the rectangle
+    """
+    pos = get_position(obj)
+    if pos is None or any(bound != int(bound) for bound in (x1, y1, x2, y2)):
+        return None, True
+    x, y = pos
+    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+    size = obj["size"]
+    masks = get_item_masks(obj["type"], size)
+
+    # Rectangle relative to the item, clipped to its mask
+    rx1, rx2 = max(x1 - x, -PAD), min(x2 - x, size + PAD)
+    ry1, ry2 = max(y1 - y, -PAD), min(y2 - y, size + PAD)
+    if rx1 >= rx2 or ry1 >= ry2:
+        return 0.0, False
+    near = masks.touch[
+        (ry1 + PAD) * RESOLUTION : (ry2 + PAD) * RESOLUTION,
+        (rx1 + PAD) * RESOLUTION : (rx2 + PAD) * RESOLUTION,
+    ].any()
+    area = masks.coverage[max(ry1, 0) : max(ry2, 0), max(rx1, 0) : max(rx2, 0)].sum()
+    return float(area), bool(near)
+
+
+def find_largest_overlap(items, x1, y1, x2, y2):
+    """
+    Index of the first item with the largest (positive) area in the rectangle
+    [x1, x2] x [y1, y2], as in `find_largest_item`.
+
+    Returns:
+        (int): the index (-1 if no item is in the rectangle), or None if it has to be
+        computed with shapely
+    """
+    areas = []
+    for obj in items:
+        area, near = get_rect_area(obj, x1, y1, x2, y2)
+        if area is None:
+            return None
+        exact = get_item_masks(obj["type"], obj["size"]).exact
+        if not exact and near and area <= TOLERANCE:
+            return None
+        areas.append((area, exact))
+
+    max_shape_idx, max_intersection = -1, 0.0
+    for obj_idx, (area, exact) in enumerate(areas):
+        if area > max_intersection:
+            max_intersection = area
+            max_shape_idx = obj_idx
+    if max_shape_idx == -1:
+        return -1
+
+    # Ties with a circle depend on the floating-point errors of shapely
+    max_exact = areas[max_shape_idx][1]
+    for obj_idx, (area, exact) in enumerate(areas):
+        if (
+            obj_idx != max_shape_idx
+            and not (exact and max_exact)
+            and abs(area - max_intersection) <= TOLERANCE
+        ):
+            return None
+    return max_shape_idx
+
+
+def check_cell_overlap(obj, cell_x, cell_y, cell_size):
+    """
+    Whether an item (dict) is mostly in a cell, as in `get_drawing_coordinates`: the
+    rounded share of the item in the cell, or of the cell covered by the item, is at
+    least 0.5.
+
+    Returns:
+        (bool): the decision, or None if it has to be computed with shapely
+    """
+    area, near = get_rect_area(
+        obj, cell_x, cell_y, cell_x + cell_size, cell_y + cell_size
+    )
+    if area is None:
+        return None
+    masks = get_item_masks(obj["type"], obj["size"])
+    ratios = (area / masks.area, area / (cell_size * cell_size))
+    if masks.exact:
+        return any(round(ratio, 2) >= 0.5 for ratio in ratios)
+    if any(abs(ratio - ROUNDING_THRES) <= TOLERANCE for ratio in ratios):
+        return None
+    return any(ratio > ROUNDING_THRES for ratio in ratios)
+
+
+def get_bounds_distance(obj_a, obj_b):
+    """
+    Squared distance between the bounding boxes of two items (dicts), a lower bound of
+    the squared distance between the items.
+    """
+    gap_x = max(
+        0,
+        obj_b["x_loc"] - (obj_a["x_loc"] + obj_a["size"]),
+        obj_a["x_loc"] - (obj_b["x_loc"] + obj_b["size"]),
+    )
+    gap_y = max(
+        0,
+        obj_b["y_loc"] - (obj_a["y_loc"] + obj_a["size"]),
+        obj_a["y_loc"] - (obj_b["y_loc"] + obj_b["size"]),
+    )
+    return gap_x * gap_x + gap_y * gap_y
@@ -0,0 +1,188 @@
+"""
+Rasterization of the structured representation directly at the resolution of the
+observations, i.e. the 380x100px RGB image downsampled by averaging 2x2 blocks of
+pixels.
+
+Each 2x2 block of an observation is the mean of its 4 pixels. Since the items are drawn
+over a uniform gray box, the sum of a block is the sum of the base image, plus, for each
+item, the number of pixels of the block covered by the item times the difference between
+the item color and the gray background. These (pre-downsampled) differences are computed
+once for every (shape, size, color) and parity of the item coordinates, so that an
+observation is obtained by adding a few small arrays, without drawing the
+full-resolution image. The result is identical to downsampling the PIL image drawn by
+`draw_on_img`.
+"""
+
+import numpy as np
+from PIL import Image as PILImage
+from PIL import ImageDraw
+
+from lilgym.envs.structured_rep_enums import Color, Size
+from lilgym.envs.structured_rep_compact import SHAPES, COLORS
+from lilgym.envs.utils_image import (
+    BASE_IMAGE,
+    BOX_SIZE,
+    SEP_WIDTH,
+    draw_item,
+    draw_on_img,
+    get_base_image,
+)
+
+
+DOWNSAMPLING = 2
+
+OBS_HEIGHT = BASE_IMAGE.height // DOWNSAMPLING  # 50
+OBS_WIDTH = BASE_IMAGE.width // DOWNSAMPLING  # 190
+
+# Margin (in blocks) added to the right and bottom of the observation buffer, so that
+# the masks of the items never need to be clipped
+MARGIN = max(s.value for s in Size) // DOWNSAMPLING + 1
+
+
+def downsample(img):
+    """
+    Downsample a full-resolution image by averaging the 2x2 blocks of pixels.
+
+    Args:
+        img (np.array): (100, 380, 3) RGB image
+
+    Returns:
+        (np.array): (50, 190, 3) uint8 observation
+    """
+    h, w, c = img.shape
+    sums = img.reshape(
+        h // DOWNSAMPLING, DOWNSAMPLING, w // DOWNSAMPLING, DOWNSAMPLING, c
+    ).sum(axis=(1, 3), dtype=np.int32)
+    return (sums // DOWNSAMPLING**2).astype(np.uint8)
+
+
+def get_item_mask(shape: str, size: int, x: int = 0, y: int = 0):
+    """
+    Draw a single item with PIL and get its full-resolution mask.
+
+    Args:
+        shape: "circle", "square" or "triangle"
+        size: size of the item
+        x, y: coordinates of the item on a (size + 2)x(size + 2) canvas
+
+    Returns:
+        (np.array): boolean mask of the canvas
+    """
+    img = PILImage.new("RGB", (size + DOWNSAMPLING, size + DOWNSAMPLING))
+    obj = {
+        "x_loc": x,
+        "y_loc": y,
+        "type": shape,
+        "size": size,
+        "color": Color.YELLOW.value,
+    }
+    draw_item(ImageDraw.Draw(img), obj, 0)
+    return np.array(img)[:, :, 1] > 0
+
+
+def get_block_counts(mask):
+    """
+    Number of pixels covered in each 2x2 block of a mask.
+    """
+    h, w = mask.shape
+    return mask.reshape(
+        h // DOWNSAMPLING, DOWNSAMPLING, w // DOWNSAMPLING, DOWNSAMPLING
+    ).sum(axis=(1, 3), dtype=np.int32)
+
+
+# Full-resolution masks of the items, for (shape, size) (the shape as in the item
+# arrays)
+ITEM_MASKS = {}
+# Differences with the background, summed on 2x2 blocks,
+# for (shape, size, color, x % 2, y % 2)
+BLOCK_DELTAS = {}
+
+_gray = np.array(Color.GRAY.as_rgb()[:3], dtype=np.int32)
+for _shape, _shape_name in enumerate(SHAPES):
+    for _size in Size:
+        ITEM_MASKS[(_shape, _size.value)] = get_item_mask(_shape_name, _size.value)[
+            : _size.value, : _size.value
+        ]
+        for _px in range(DOWNSAMPLING):
+            for _py in range(DOWNSAMPLING):
+                _counts = get_block_counts(
+                    get_item_mask(_shape_name, _size.value, _px, _py)
+                )
+                for _color, _color_name in enumerate(COLORS):
+                    _delta = (
+                        np.array(Color(_color_name).as_rgb()[:3], dtype=np.int32)
+                        - _gray
+                    )
+                    BLOCK_DELTAS[(_shape, _size.value, _color, _px, _py)] = (
+                        _counts[:, :, None] * _delta
+                    )
+
+# Sums of the 2x2 blocks of the base image (with the margin)
+BASE_SUMS = np.zeros((OBS_HEIGHT + MARGIN, OBS_WIDTH + MARGIN, 3), dtype=np.int32)
+BASE_SUMS[:OBS_HEIGHT, :OBS_WIDTH] = (
+    np.array(BASE_IMAGE, dtype=np.int32)
+    .reshape(OBS_HEIGHT, DOWNSAMPLING, OBS_WIDTH, DOWNSAMPLING, 3)
+    .sum(axis=(1, 3))
+)
+
+
+def is_inside_box(x_loc, y_loc, size):
+    """
+    Whether an item is inside its box (otherwise it is not rasterized directly).
+    """
+    return 0 <= x_loc <= BOX_SIZE - size and 0 <= y_loc <= BOX_SIZE - size
+
+
+def has_overlapping_pixels(a, b):
+    """
+    Whether two items, given as (x, y, shape, size) in pixels, have a pixel in common.
+    """
+    xa, ya, shape_a, size_a = a
+    xb, yb, shape_b, size_b = b
+    x1, y1 = max(xa, xb), max(ya, yb)
+    x2, y2 = min(xa + size_a, xb + size_b), min(ya + size_a, yb + size_b)
+    if x1 >= x2 or y1 >= y2:
+        return False
+    mask_a = ITEM_MASKS[(shape_a, size_a)][y1 - ya : y2 - ya, x1 - xa : x2 - xa]
+    mask_b = ITEM_MASKS[(shape_b, size_b)][y1 - yb : y2 - yb, x1 - xb : x2 - xb]
+    return bool((mask_a & mask_b).any())
+
+
+def rasterize(img_struct):
+    """
+    Get the observation (the downsampled RGB image) of a structured representation.
+
+    Args:
+        img_struct (CompactImage): structured representation of the image
+
+    Returns:
+        (np.array): (50, 190, 3) uint8 observation
+    """
+    sums = BASE_SUMS.copy()
+    for box, items in enumerate(img_struct):
+        x_offset = BOX_SIZE * box + SEP_WIDTH * box
+        drawn = []
+        for x_loc, y_loc, shape, color, size in items.tolist():
+            if not is_inside_box(x_loc, y_loc, size):
+                return rasterize_full_res(img_struct)
+            x, y = x_offset + x_loc, y_loc
+            item = (x, y, shape, size)
+            # The order in which overlapping items are drawn matters
+            if any(has_overlapping_pixels(item, other) for other in drawn):
+                return rasterize_full_res(img_struct)
+            drawn.append(item)
+
+            delta = BLOCK_DELTAS[
+                (shape, size, color, x % DOWNSAMPLING, y % DOWNSAMPLING)
+            ]
+            bx, by = x // DOWNSAMPLING, y // DOWNSAMPLING
+            sums[by : by + delta.shape[0], bx : bx + delta.shape[1]] += delta
+    return (sums[:OBS_HEIGHT, :OBS_WIDTH] // DOWNSAMPLING**2).astype(np.uint8)
+
+
+def rasterize_full_res(img_struct):
+    """
+    Fallback of `rasterize`, drawing the full-resolution PIL image and downsampling it.
+    """
+    img, _ = get_base_image()
+    return downsample(np.array(draw_on_img(img, img_struct), dtype=np.uint8))
@@ -1,9 +1,11 @@
-from dataclasses import dataclass
-from typing import List, Dict
+from dataclasses import dataclass, replace
+from typing import Dict
 from PIL.Image import Image
 
+from lilgym.envs.structured_rep_compact import CompactImage
 
-@dataclass
+
+@dataclass(frozen=True)
 class ContextState:
     """
     A sample in the dataset, composed of: 
@@ -15,10 +17,26 @@ class ContextState:
     - [[{"y_loc": 58, "x_loc": 41, "size": 20, "type": "square", "color": "Yellow"}], [], []] 
     is a structured representation of an image with a yellow square of medium size in the 
     first box (the left box), where the upper-left coordinate is at (41, 58)
+
+    In the states, img_struct is held as a `CompactImage` (one item array per box),
+    which is converted from and to the format above with `CompactImage.from_dicts` and
+    `to_dicts`.
+
+    States are copy-on-write snapshots: actions never modify a state in place, but
+    return a new state that shares every unchanged structure (sentence, logical form,
+    untouched boxes and items) with the previous one. A state can therefore be kept
+    around without copying it. The states are frozen, so that the initial states can be
+    shared by all the environments of a process (cf. `lilgym.envs.utils.load_samples`).
     """
 
     sentence: str
     lf: str
-    img_struct: List[List]
+    img_struct: CompactImage
     target_bool: bool = True
     img: Image = None
+
+    def replace(self, **changes):
+        """
+        Returns a new state with the given fields replaced, sharing the other fields.
+        """
+        return replace(self, **changes)
@@ -0,0 +1,481 @@
+from typing import Optional
+
+import numpy as np
+
+from gymnasium import spaces
+from gymnasium.utils import seeding
+from gymnasium.vector import VectorEnv
+
+from lilgym.envs.utils import (
+    is_action_valid,
+    get_action_space,
+    get_flat_action_space,
+    compute_prediction,
+    build_samples,
+    load_samples,
+    get_max_items,
+)
+from lilgym.envs.utils_image import draw_item_scatter, delete_item_scatter
+from lilgym.envs.utils_raster import rasterize, OBS_HEIGHT, OBS_WIDTH
+from lilgym.envs.utils_action import to_scatter_action
+from lilgym.envs.structured_rep_enums import Shape
+from lilgym.envs.structured_rep_compact import (
+    CompactImage,
+    to_box_array,
+    X_LOC,
+    Y_LOC,
+    TYPE,
+    COLOR,
+    SIZE,
+)
+from lilgym.envs.truth_tables import (
+    TruthTables,
+    TOWER_MAX_ITEMS,
+    TOWER_X_LOC,
+    TOWER_Y_LOCS,
+    TOWER_SIZE,
+    BOX_STATES,
+    BOX_OFFSETS,
+    NUM_COLORS,
+)
+from lilgym.envs.sampler import Sampler
+from lilgym.envs.utils_mask import get_tower_action_masks, get_scatter_action_mask
+from lilgym.envs.vars import MAX_TIME_STEPS, EPS
+
+
+NUM_BOXES = 3
+
+
+class LilGymVectorEnv(VectorEnv):
+    """
+    A vectorized version of NaturalLanguageVisualReasoningEnv: N environments stepped
+    in-process, with their states held in batched numpy arrays (item tables, target
+    booleans, time steps and observations).
+
+    The actions are given as an (N, 3) array for Tower and an (N, 6) array for Scatter.
+    As for the other Gymnasium vector environments, the sub-environments are reset
+    automatically when they terminate or are truncated: the observation and info of
+    their last step are then found in `info["final_observation"]` and
+    `info["final_info"]`, and the example number of their new sample in
+    `info["example_number"]`.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        appearance: str,
+        starting_condition: str,
+        stop_forcing: bool,
+        split: str = None,
+        data: dict = None,
+        horizon: int = MAX_TIME_STEPS,
+        seed: Optional[int] = None,
+        truth_tables: str = None,
+        sampling: str = "uniform",
+        sample_weights: dict = None,
+        flat_actions: bool = False,
+        return_action_mask: bool = False,
+    ):
+        """
+        Args:
+            num_envs: Number of environments
+            appearance: Environment appearance option: "tower" or "scatter"
+            starting_condition: The starting condition: "scratch" or "flipit"
+
+            data: Dictionary of the context and initial states, or the data in the
+            binary format (cf. `lilgym.envs.binary_data.BinaryData`)
+            split: The data split ("train", "dev", or "test").
+            Note: split and data are mutually exclusive, and split is considered in
+            priority.
+
+            stop_forcing: Whether stop forcing (SF) is used or not
+            horizon: Maximum number of steps of an episode
+            seed: Seed of the sampling of the initial states. The environments share a
+            single random generator and sampler (e.g. one epoch over the samples for all
+            of them), so there is a single seed, not one per environment
+            truth_tables: Directory of the truth tables of the logical forms (Tower
+            only)
+            sampling: How the initial states are drawn: "uniform", "epoch" or "weighted"
+            sample_weights: Weight of each example number, for the weighted sampling
+            flat_actions: Whether the actions are given as an (N,) array of flat action
+            IDs (indices of the default actions), instead of an array of array actions
+            return_action_mask: Whether the masks of the valid actions (cf.
+            `action_mask`) are returned in the infos of `reset` and `step`
+        """
+        self._appearance = appearance
+        self._starting_condition = starting_condition
+        self._stop_forcing = stop_forcing
+        self._horizon = horizon
+        self._return_action_mask = return_action_mask
+
+        assert (
+            truth_tables is None or appearance == "tower"
+        ), "The truth tables are only available for the Tower environments"
+        self._truth_tables = TruthTables(truth_tables) if truth_tables else None
+
+        assert data or split, (
+            "No data error: Either the split of the data needs to be specified, "
+            "or the data needs to be given"
+        )
+        if split:
+            # Loaded once per process, and shared by all the environments of the split
+            self._samples = load_samples(
+                self._appearance, self._starting_condition, split
+            )
+        else:
+            assert data is not None, "Must provide environment initial states."
+            self._samples = build_samples(self._starting_condition, data)
+        self._sampler = Sampler(list(self._samples.keys()), sampling, sample_weights)
+
+        self._flat_actions = flat_actions
+        self._actions_dim = get_action_space(self._appearance).get_actions_dim()
+        if flat_actions:
+            single_action_space = get_flat_action_space(self._appearance)
+        else:
+            single_action_space = get_action_space(self._appearance)
+        single_observation_space = spaces.Dict(
+            {
+                "image": spaces.Box(
+                    low=0,
+                    high=255,
+                    shape=(OBS_HEIGHT, OBS_WIDTH, 3),
+                    dtype=np.uint8,
+                ),
+                "sentence": spaces.Text(max_length=320),
+                "target": spaces.Discrete(2),
+            }
+        )
+        super().__init__(num_envs, single_observation_space, single_action_space)
+        if flat_actions:
+            self.action_space = spaces.MultiDiscrete(
+                np.full(num_envs, single_action_space.n)
+            )
+        else:
+            self.action_space = spaces.MultiDiscrete(
+                np.tile(self._actions_dim, (num_envs, 1))
+            )
+
+        # Each step adds at most one item
+        capacity = horizon + get_max_items(self._samples)
+        if self._truth_tables is not None:
+            capacity = max(capacity, TOWER_MAX_ITEMS)
+
+        # States of the environments
+        self._items = np.zeros((num_envs, NUM_BOXES, capacity, 5), dtype=np.int16)
+        self._counts = np.zeros((num_envs, NUM_BOXES), dtype=np.int64)
+        self._targets = np.zeros(num_envs, dtype=bool)
+        self._time_steps = np.zeros(num_envs, dtype=np.int64)
+        self._images = np.zeros((num_envs, OBS_HEIGHT, OBS_WIDTH, 3), dtype=np.uint8)
+        self._sentences = [None] * num_envs
+        self._lfs = [None] * num_envs
+        self._current_ids = [None] * num_envs
+        self._action_ids = None
+
+        self.np_random, _ = seeding.np_random(seed)
+
+    def get_img_struct(self, i: int):
+        """
+        Structured representation of the current state of the i-th environment.
+        """
+        return CompactImage(
+            to_box_array(self._items[i, box, : self._counts[i, box]])
+            for box in range(NUM_BOXES)
+        )
+
+    def _set_box(self, i: int, box: int, items):
+        self._counts[i, box] = len(items)
+        self._items[i, box, : len(items)] = items
+
+    def _reset_env(self, i: int, example_number=None):
+        if example_number is None:
+            example_number = self._sampler.sample(self.np_random)
+        sample = self._samples[str(example_number)]
+
+        self._current_ids[i] = str(example_number)
+        self._sentences[i] = sample.sentence
+        self._lfs[i] = sample.lf
+        self._targets[i] = sample.target_bool
+        self._time_steps[i] = 0
+        for box, items in enumerate(sample.img_struct):
+            self._set_box(i, box, items)
+        self._images[i] = rasterize(sample.img_struct)
+
+    def _get_obs(self):
+        if self._starting_condition == "scratch":
+            targets = np.ones(self.num_envs, dtype=np.int64)
+        else:
+            targets = self._targets.astype(np.int64)
+        return {
+            "sentence": tuple(self._sentences),
+            "image": self._images.copy(),
+            "target": targets,
+        }
+
+    def _get_single_obs(self, i: int):
+        return {
+            "sentence": self._sentences[i],
+            "image": self._images[i].copy(),
+            "target": 1
+            if self._starting_condition == "scratch"
+            else int(self._targets[i]),
+        }
+
+    def reset(
+        self,
+        *,
+        seed: Optional[int] = None,
+        options: Optional[dict] = None,
+    ):
+        """
+        Resets all the environments.
+
+        Args:
+            seed: Seed of the sampling of the initial states
+            options: {"example_numbers": [...]} to start the environments from the
+            given samples
+        """
+        if seed is not None:
+            self.np_random, _ = seeding.np_random(seed)
+            self._sampler.reset()
+        example_numbers = [None] * self.num_envs
+        if options:
+            example_numbers = options["example_numbers"]
+        for i in range(self.num_envs):
+            self._reset_env(i, example_numbers[i])
+        infos = {
+            "example_number": np.array(self._current_ids, dtype=object),
+            "_example_number": np.ones(self.num_envs, dtype=bool),
+        }
+        self._add_action_mask(infos)
+        return self._get_obs(), infos
+
+    def step(self, actions):
+        """
+        Takes a step in each environment with the given (N, 3) or (N, 6) array of
+        actions, or (N,) array of flat action IDs.
+        """
+        self._action_ids = None
+        if self._flat_actions:
+            self._action_ids = np.asarray(actions, dtype=np.int64)
+            actions = self.single_action_space.to_arrays(self._action_ids)
+        actions = np.asarray(actions, dtype=np.int64)
+        width = len(self._actions_dim)
+        if actions.shape[1] < width:
+            actions = np.pad(
+                actions, ((0, 0), (0, width - actions.shape[1])), constant_values=-1
+            )
+        types = actions[:, 0]
+        envs = np.arange(self.num_envs)
+
+        self._time_steps += 1
+
+        # Compute rewards
+        img_structs = (
+            [self.get_img_struct(i) for i in envs]
+            if self._truth_tables is None
+            else None
+        )
+        predictions = self._predict(img_structs)
+        stop = types == 0
+        rewards = np.where(
+            stop, np.where(predictions == self._targets, 1.0, -1.0), -EPS
+        )
+
+        # Stop forcing
+        force_stop = np.zeros(self.num_envs, dtype=bool)
+        if self._stop_forcing:
+            force_stop = ~stop & (predictions == self._targets)
+            rewards[force_stop] = 1.0
+        stop |= force_stop
+
+        # Check if the timelimit (truncation condition) is met
+        truncated = self._time_steps == self._horizon
+
+        # Check if an action is invalid
+        invalid = ~stop & ~self._is_valid(actions, img_structs)
+        truncated |= invalid
+        rewards[invalid] = -1.0
+
+        terminated = stop
+        applied = ~terminated & ~truncated
+        self._apply(actions, applied, img_structs)
+
+        infos = {
+            "sentence": np.array(self._sentences, dtype=object),
+            "target": self._targets.copy(),
+            "force_stop": force_stop,
+        }
+        done = terminated | truncated
+        infos["accuracy"] = np.where(done, (rewards > 0.0) * 1.0, 0.0)
+        infos["accuracy_nosf"] = np.where(
+            done, ((rewards > 0.0) & ~force_stop) * 1.0, 0.0
+        )
+        for k in ["sentence", "target", "force_stop"]:
+            infos[f"_{k}"] = np.ones(self.num_envs, dtype=bool)
+        infos["_accuracy"] = infos["_accuracy_nosf"] = done
+
+        # Autoreset
+        if done.any():
+            final_observations = np.full(self.num_envs, None, dtype=object)
+            final_infos = np.full(self.num_envs, None, dtype=object)
+            for i in np.flatnonzero(done):
+                final_observations[i] = self._get_single_obs(i)
+                final_infos[i] = {
+                    "sentence": self._sentences[i],
+                    "target": bool(self._targets[i]),
+                    "force_stop": bool(force_stop[i]),
+                    "accuracy": infos["accuracy"][i],
+                    "accuracy_nosf": infos["accuracy_nosf"][i],
+                }
+                self._reset_env(i)
+            infos["final_observation"] = final_observations
+            infos["final_info"] = final_infos
+            infos["_final_observation"] = infos["_final_info"] = done
+            # As in the infos of `reset`, for the environments which are reset
+            infos["example_number"] = np.array(self._current_ids, dtype=object)
+            infos["_example_number"] = done
+
+        self._add_action_mask(infos)
+        return self._get_obs(), rewards, terminated, truncated, infos
+
+    def action_mask(self):
+        """
+        Masks of the valid actions in the current states, as an (N, number of default
+        actions) boolean array (indexed by the flat action IDs).
+        """
+        if self._appearance == "tower":
+            return get_tower_action_masks(self._counts)
+        return np.stack(
+            [
+                get_scatter_action_mask(self.get_img_struct(i))
+                for i in range(self.num_envs)
+            ]
+        )
+
+    def _add_action_mask(self, infos):
+        if self._return_action_mask:
+            infos["action_mask"] = self.action_mask()
+            infos["_action_mask"] = np.ones(self.num_envs, dtype=bool)
+
+    def _get_state_indices(self):
+        """
+        Indices of the Tower states in the truth tables, computed on the item tables (-1
+        for the states which are not made of towers of blocks at the standard
+        positions).
+        """
+        items = self._items[:, :, :TOWER_MAX_ITEMS]
+        present = np.arange(TOWER_MAX_ITEMS) < self._counts[:, :, None]
+        standard = (
+            (items[..., X_LOC] == TOWER_X_LOC)
+            & (items[..., Y_LOC] == np.array(TOWER_Y_LOCS))
+            & (items[..., TYPE] == Shape.SQUARE.as_int())
+            & (items[..., SIZE] == TOWER_SIZE)
+        )
+        valid = (standard | ~present).all(axis=2) & (self._counts <= TOWER_MAX_ITEMS)
+        counts = np.minimum(self._counts, TOWER_MAX_ITEMS)
+        box_indices = np.array(BOX_OFFSETS)[counts] + (
+            np.where(present, items[..., COLOR], 0)
+            * NUM_COLORS ** np.arange(TOWER_MAX_ITEMS)
+        ).sum(axis=2)
+        indices = (box_indices * BOX_STATES ** np.arange(NUM_BOXES - 1, -1, -1)).sum(
+            axis=1
+        )
+        return np.where(valid.all(axis=1), indices, -1)
+
+    def _predict(self, img_structs=None):
+        """
+        Results of the logical forms on the current states: looked up in the truth
+        tables when possible, and computed on the structured representations otherwise.
+        """
+        predictions = np.zeros(self.num_envs, dtype=bool)
+        indices = self._get_state_indices() if self._truth_tables is not None else None
+        for i, lf in enumerate(self._lfs):
+            prediction = None
+            if indices is not None and indices[i] >= 0:
+                prediction = self._truth_tables.lookup(lf, int(indices[i]))
+            if prediction is None:
+                img_struct = (
+                    img_structs[i]
+                    if img_structs is not None
+                    else self.get_img_struct(i)
+                )
+                prediction = compute_prediction(img_struct, lf)
+            predictions[i] = prediction
+        return predictions
+
+    def _to_action(self, actions, i: int):
+        """
+        The Type[Action] object of the action of the i-th environment (the prebuilt
+        default action for flat action IDs).
+        """
+        if self._action_ids is not None:
+            return self.single_action_space.get_action(self._action_ids[i])
+        return to_scatter_action(actions[i])
+
+    def _is_valid(self, actions, img_structs):
+        """
+        Validity of the (non-stop) actions: checked on the item tables for Tower,
+        and with `is_action_valid` for Scatter.
+        """
+        types = actions[:, 0]
+        if self._appearance == "tower":
+            counts = self._counts[np.arange(self.num_envs), actions[:, 1]]
+            return ~(((types == 2) & (counts == 0)) | ((types == 1) & (counts == 4)))
+        valid = np.ones(self.num_envs, dtype=bool)
+        for i in np.flatnonzero(types != 0):
+            action = self._to_action(actions, i)
+            valid[i] = bool(is_action_valid(self._appearance, img_structs[i], action))
+        return valid
+
+    def _apply(self, actions, applied, img_structs):
+        """
+        Applies the actions to the environments in `applied`, and updates their
+        observations.
+        """
+        types = actions[:, 0]
+        if self._appearance == "tower":
+            boxes = actions[:, 1]
+            envs = np.flatnonzero(applied & (types == 1))
+            counts = self._counts[envs, boxes[envs]]
+            # New blocks are put on top of the last block of the box
+            last_y_locs = self._items[
+                envs, boxes[envs], np.maximum(counts - 1, 0), Y_LOC
+            ]
+            # Cannot add anymore if the last block is at the top of the box
+            possible = (counts == 0) | (last_y_locs != 17)
+            envs, counts, last_y_locs = (
+                envs[possible],
+                counts[possible],
+                last_y_locs[possible],
+            )
+            y_locs = np.where(counts > 0, last_y_locs - 21, 80)
+            rows = np.zeros((len(envs), 5), dtype=np.int16)
+            rows[:, X_LOC] = 40
+            rows[:, Y_LOC] = y_locs
+            rows[:, TYPE] = Shape.SQUARE.as_int()
+            rows[:, COLOR] = actions[envs, 2]
+            rows[:, SIZE] = 20
+            self._items[envs, boxes[envs], counts] = rows
+            self._counts[envs, boxes[envs]] += 1
+            changed = envs
+
+            envs = np.flatnonzero(applied & (types == 2))
+            self._counts[envs, boxes[envs]] -= 1
+            changed = np.concatenate([changed, envs])
+        else:
+            changed = np.flatnonzero(applied)
+            for i in changed:
+                action = self._to_action(actions, i)
+                if types[i] == 1:
+                    img_struct, _ = draw_item_scatter(action, None, img_structs[i])
+                else:
+                    img_struct, _ = delete_item_scatter(action, None, img_structs[i])
+                for box in range(NUM_BOXES):
+                    if img_struct[box] is not img_structs[i][box]:
+                        self._set_box(i, box, img_struct[box])
+
+        for i in changed:
+            self._images[i] = rasterize(self.get_img_struct(i))
+
+    def get_samples(self):
+        return self._samples
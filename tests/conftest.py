@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from lilgym.data.utils import get_data, data_files, data_path
+
+
+EDGE_LFS_PATH = os.path.join(os.path.dirname(__file__), "edge_lfs.txt")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--runslow", action="store_true", help="Run the slow tests (on all the data)"
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: slow test, run with --runslow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip_slow = pytest.mark.skip(reason="Slow test, run with --runslow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+
+@pytest.fixture(scope="session")
+def data_pairs():
+    """
+    The (logical form, structured representation) pairs of all the samples of the data
+    (the scratch samples start from an empty image).
+    """
+    pairs = []
+    for env_name, files in data_files.items():
+        appearance, starting_condition = env_name.split("-")
+        for split, file in files.items():
+            if not os.path.exists(os.path.join(data_path, file)):
+                continue
+            for sample in get_data(appearance, starting_condition, split).values():
+                pairs.append((sample["lf"], sample.get("structured_rep", [[], [], []])))
+    return pairs
+
+
+@pytest.fixture(scope="session")
+def edge_lfs():
+    """
+    Logical forms which are not in the data, for the edge cases of the semantics of
+    `eval`:
+    exceptions, short-circuits, set operations on the results of the relations...
+    """
+    with open(EDGE_LFS_PATH) as f:
+        return [line.strip() for line in f if line.strip()]
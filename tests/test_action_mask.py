@@ -0,0 +1,44 @@
+"""
+The masks of the valid actions (`lilgym.envs.utils_mask`) against the validity checked
+by `step` (`is_action_valid`), for every default action, on states of random rollouts of
+the dev data.
+"""
+
+import pytest
+
+from lilgym.envs.natural_language_visual_reasoning_env import (
+    NaturalLanguageVisualReasoningEnv,
+)
+from lilgym.envs.utils import is_action_valid
+
+NUM_STATES = {"tower": 100, "scatter": 40}
+
+
+@pytest.mark.parametrize("appearance", ["tower", "scatter"])
+def test_action_mask(appearance):
+    env = NaturalLanguageVisualReasoningEnv(
+        appearance, "flipit", stop_forcing=False, split="dev", flat_actions=True
+    )
+    env.seed(0)
+    env.action_space.seed(0)
+    default_actions = env.action_space.default_actions
+    env.reset()
+    for _ in range(NUM_STATES[appearance]):
+        img_struct = env.get_state().img_struct
+        mask = env.action_mask()
+        expected = [
+            is_action_valid(appearance, img_struct, action)
+            for action in default_actions
+        ]
+        assert mask.dtype == bool
+        assert mask.tolist() == expected
+
+        for _ in range(20):
+            assert mask[env.action_space.sample(mask=mask)]
+
+        # A valid action other than stop, so that the rollout goes on
+        mask[[i for i, a in enumerate(default_actions) if a.to_array()[0] == 0]] = False
+        action_id = env.action_space.sample(mask=mask) if mask.any() else 0
+        _, _, terminated, truncated, _ = env.step(action_id)
+        if terminated or truncated:
+            env.reset()
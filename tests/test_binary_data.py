@@ -0,0 +1,97 @@
+"""
+The binary format of the data (`lilgym.envs.binary_data`): the converted samples are the
+samples of `get_data`, the data are pickled as their path, and the shared data are
+removed when the publishing process exits.
+"""
+
+import os
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+from lilgym.data.utils import get_data
+from lilgym.envs.binary_data import BinaryData, convert_data
+from lilgym.envs.utils import build_samples
+
+NUM_SAMPLES = 50
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SHARE_SCRIPT = """
+import os
+import sys
+from lilgym.envs.binary_data import share_data
+
+data = share_data("tower", "flipit", "dev")
+root = os.path.dirname(data._path)
+pid = os.fork()
+if pid == 0:
+    # A forked child does not remove the data of its parent when it exits
+    sys.exit(0)
+os.waitpid(pid, 0)
+print(root, os.path.isdir(root), len(data))
+"""
+
+
+def convert_split(appearance, starting_condition, path):
+    data = get_data(appearance, starting_condition, "dev")
+    data = {k: data[k] for k in list(data)[:NUM_SAMPLES]}
+    convert_data(data, starting_condition, str(path))
+    return data
+
+
+@pytest.mark.parametrize("appearance", ["tower", "scatter"])
+@pytest.mark.parametrize("starting_condition", ["scratch", "flipit"])
+def test_round_trip(tmp_path, appearance, starting_condition):
+    data = convert_split(appearance, starting_condition, tmp_path)
+    samples = build_samples(starting_condition, data)
+    binary_data = BinaryData(str(tmp_path))
+
+    assert binary_data.starting_condition == starting_condition
+    assert len(binary_data) == len(data)
+    assert list(binary_data) == list(data)
+    assert "missing" not in binary_data
+    for k, sample in samples.items():
+        state = binary_data[k]
+        assert state.sentence == sample.sentence == data[k]["sentence"]
+        assert state.lf == sample.lf == data[k]["lf"]
+        assert state.img_struct.to_dicts() == sample.img_struct.to_dicts()
+        assert state.target_bool == sample.target_bool
+
+
+def test_pickle(tmp_path):
+    data = convert_split("tower", "flipit", tmp_path)
+    binary_data = BinaryData(str(tmp_path))
+
+    assert binary_data.__reduce__() == (BinaryData, (str(tmp_path),))
+    dumped = pickle.dumps(binary_data)
+    # Only the path is pickled, not the samples
+    sentence = next(iter(data.values()))["sentence"]
+    assert sentence.encode("utf-8") not in dumped
+    assert len(dumped) < 200 + len(str(tmp_path))
+
+    loaded = pickle.loads(dumped)
+    assert list(loaded) == list(binary_data)
+    for k in data:
+        assert loaded[k].sentence == binary_data[k].sentence
+        assert loaded[k].img_struct == binary_data[k].img_struct
+
+
+def test_shared_data_removed():
+    """
+    The shared data are kept while the publishing process runs (including after the exit
+    of its forked children), and removed when it exits.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", SHARE_SCRIPT],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    root, exists, num_samples = output
+    assert exists == "True"
+    assert int(num_samples) == len(get_data("tower", "flipit", "dev"))
+    assert not os.path.exists(root)
@@ -0,0 +1,66 @@
+"""
+The sharded evaluation (`lilgym.envs.evaluation`): the shards partition the samples, and
+the merged results of the shards are the results of a single process.
+"""
+
+from lilgym.envs.evaluation import evaluate_shard, merge_results, random_policy
+from lilgym.envs.natural_language_visual_reasoning_env import (
+    NaturalLanguageVisualReasoningEnv,
+)
+from lilgym.envs.sampler import get_shard
+from lilgym.data.utils import get_data
+
+NUM_SAMPLES = 20
+
+
+def test_get_shard():
+    sample_ids = [str(i) for i in range(103, 0, -1)]
+    assert get_shard(sample_ids, 1, 0) == sample_ids
+    for num_shards in [2, 3, 7]:
+        shards = [get_shard(sample_ids, num_shards, k) for k in range(num_shards)]
+        assert sorted(sum(shards, [])) == sorted(sample_ids)
+        for shard in shards:
+            # Each shard keeps the order of the samples
+            assert shard == [k for k in sample_ids if k in set(shard)]
+
+
+def test_evaluation_mode_order():
+    """
+    The evaluation mode goes through the samples from the last one, as the baseline.
+    """
+    env = NaturalLanguageVisualReasoningEnv(
+        "tower", "flipit", stop_forcing=False, split="dev", evaluate=True
+    )
+    samples = list(env.get_samples().values())
+    for sample in reversed(samples[-10:]):
+        env.reset()
+        state = env.get_state()
+        assert (state.sentence, state.lf, state.target_bool) == (
+            sample.sentence,
+            sample.lf,
+            sample.target_bool,
+        )
+        assert state.img_struct.to_dicts() == sample.img_struct.to_dicts()
+
+
+def test_merge_results():
+    data = get_data("scatter", "flipit", "dev")
+    data = {k: data[k] for k in list(data)[:NUM_SAMPLES]}
+    expected = merge_results(
+        [evaluate_shard(random_policy, "scatter", "flipit", data=data)]
+    )
+    assert expected["num_samples"] == NUM_SAMPLES
+    for num_shards in [2, 3]:
+        shard_results = [
+            evaluate_shard(
+                random_policy,
+                "scatter",
+                "flipit",
+                data=data,
+                num_shards=num_shards,
+                shard=shard,
+            )
+            for shard in range(num_shards)
+        ]
+        assert sum(len(results) for results in shard_results) == NUM_SAMPLES
+        assert merge_results(shard_results) == expected
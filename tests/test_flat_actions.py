@@ -0,0 +1,55 @@
+"""
+The flat action IDs (`lilgym.envs.action_space.FlatActionSpace`): the batched array
+representations are the ones of the actions, and the integers, NumPy integers and 0-d
+arrays are the same actions in `step`.
+"""
+
+import numpy as np
+import pytest
+
+from lilgym.envs.natural_language_visual_reasoning_env import (
+    NaturalLanguageVisualReasoningEnv,
+)
+from lilgym.envs.utils import get_flat_action_space
+
+
+@pytest.mark.parametrize("appearance", ["tower", "scatter"])
+def test_to_arrays(appearance):
+    action_space = get_flat_action_space(appearance)
+    action_ids = np.arange(action_space.n)
+    np.random.default_rng(0).shuffle(action_ids)
+    arrays = action_space.to_arrays(action_ids)
+    assert arrays.shape[0] == action_space.n
+    for action_id, array in zip(action_ids, arrays):
+        np.testing.assert_array_equal(
+            array, action_space.get_action(action_id).to_array()
+        )
+    # Repeated IDs
+    np.testing.assert_array_equal(
+        action_space.to_arrays([1, 1, 0]),
+        [action_space.get_action(i).to_array() for i in [1, 1, 0]],
+    )
+
+
+@pytest.mark.parametrize("appearance", ["tower", "scatter"])
+def test_step_action_ids(appearance):
+    """
+    The same episode with the flat action IDs given as int, np.int64 and 0-d arrays.
+    """
+    action_space = get_flat_action_space(appearance, seed=0)
+    action_ids = [int(action_space.sample()) for _ in range(10)]
+    results = []
+    for convert in [int, np.int64, np.array]:
+        env = NaturalLanguageVisualReasoningEnv(
+            appearance, "scratch", stop_forcing=False, split="dev", flat_actions=True
+        )
+        env.reset(seed=0)
+        episode = []
+        for action_id in action_ids:
+            obs, reward, terminated, truncated, info = env.step(convert(action_id))
+            episode.append((reward, terminated, truncated))
+            if terminated or truncated:
+                break
+        episode.append(env.get_state().img_struct.to_dicts())
+        results.append(episode)
+    assert results[0] == results[1] == results[2]
@@ -0,0 +1,64 @@
+"""
+The incremental evaluation of the logical forms (`lilgym.envs.lf_dependencies`) against
+`eval` on the whole image: the results, or the types of the exceptions raised, should be
+the same, including when the evaluators reuse the results cached for a box.
+"""
+
+import random
+
+from lilgym.envs.lf_compiler import Unsupported
+from lilgym.envs.lf_dependencies import IncrementalEvaluator
+from lilgym.envs.structured_rep_compact import CompactImage
+from lilgym.envs.utils import compile_logical_form_with_eval
+
+
+NUM_IMAGES = 10
+
+
+def run_with_result(function, *args):
+    try:
+        return function(*args)
+    except Exception as e:
+        return type(e)
+
+
+def get_images(data_pairs):
+    """
+    Images of the data, and images made of their boxes (boxes shared between images, and
+    boxes with an item removed), as the states of the rollouts.
+    """
+    rng = random.Random(0)
+    structured_reps = [r for _, r in data_pairs if any(r)]
+    images = [
+        CompactImage.from_dicts(r) for r in rng.sample(structured_reps, NUM_IMAGES)
+    ]
+    for _ in range(NUM_IMAGES):
+        a, b = rng.sample(images[:NUM_IMAGES], 2)
+        image = a.replace_box(1, b[1])
+        if len(image[2]):
+            image = image.remove_item(2, rng.randrange(len(image[2])))
+        images.append(image)
+    return images + [CompactImage.empty()]
+
+
+def test_incremental_evaluation(data_pairs, edge_lfs):
+    images = get_images(data_pairs)
+    lfs = sorted({lf for lf, _ in data_pairs}) + edge_lfs
+    mismatches = []
+    for lf in lfs:
+        try:
+            evaluator = IncrementalEvaluator(lf)
+        except Unsupported:
+            continue
+        function = compile_logical_form_with_eval(lf)
+        # The second pass reuses the results cached for the boxes
+        for _ in range(2):
+            for image in images:
+                nlvr_image = image.to_nlvr_image()
+                expected = run_with_result(
+                    function, nlvr_image.get_all_boxes(), nlvr_image.get_all_items()
+                )
+                result = run_with_result(evaluator, image)
+                if result != expected or type(result) is not type(expected):
+                    mismatches.append((lf, image.to_dicts(), expected, result))
+    assert mismatches == []
@@ -0,0 +1,40 @@
+"""
+The compiled logical forms (`lilgym.envs.lf_compiler`) against `eval`: the results, or
+the types of the exceptions raised, should be the same.
+"""
+
+from lilgym.envs.lf_compiler import Unsupported, compile_lf
+from lilgym.envs.structured_rep import Image
+from lilgym.envs.utils import compile_logical_form_with_eval
+
+
+def run_with_result(function, structured_rep):
+    image = Image(structured_rep)
+    try:
+        return function(image.get_all_boxes(), image.get_all_items())
+    except Exception as e:
+        return type(e)
+
+
+def check_compiler(pairs):
+    mismatches = []
+    for lf, structured_rep in pairs:
+        try:
+            compiled = compile_lf(lf)
+        except Unsupported:
+            continue
+        expected = run_with_result(compile_logical_form_with_eval(lf), structured_rep)
+        result = run_with_result(compiled, structured_rep)
+        if result != expected or type(result) is not type(expected):
+            mismatches.append((lf, structured_rep, expected, result))
+    return mismatches
+
+
+def test_data(data_pairs):
+    assert check_compiler(data_pairs) == []
+
+
+def test_edge_cases(data_pairs, edge_lfs):
+    structured_reps = [[[], [], []]] + [r for _, r in data_pairs if any(r)][::100]
+    pairs = [(lf, r) for lf in edge_lfs for r in structured_reps]
+    assert check_compiler(pairs) == []
@@ -0,0 +1,76 @@
+"""
+The Scatter actions decided with the occupancy masks of the items
+(`lilgym.envs.utils_occupancy`) against the same actions decided with shapely only: the
+validity and the resulting states should be the same.
+"""
+
+import pytest
+
+from lilgym.envs import utils_image, utils_occupancy
+from lilgym.envs.action_spaces import SCATTER_DEFAULT_ACTIONS
+from lilgym.envs.structured_rep_compact import CompactImage
+from lilgym.data.utils import get_data
+
+pytest.importorskip("shapely")
+
+# Initial states of each split in the default run (cf. `test_scatter_actions_all`)
+NUM_STATES = 8
+
+
+def apply_actions(img_struct):
+    results = []
+    for action in SCATTER_DEFAULT_ACTIONS:
+        if action.to_array()[0] == 0:
+            continue
+        if utils_image.get_box(action.x()) == -1:
+            continue
+        if action.to_array()[0] == 1:
+            valid = utils_image.can_draw_item_scatter(action, None, img_struct)
+            result = utils_image.draw_item_scatter(action, None, img_struct)[0]
+        else:
+            valid = utils_image.can_delete_item_scatter(action, None, img_struct)
+            result = utils_image.delete_item_scatter(action, None, img_struct)[0]
+        results.append((action, valid, result))
+    return results
+
+
+def get_states(num_states=None):
+    """
+    The empty image and the initial states of the Scatter dev and test data (num_states
+    of each split, evenly spaced, or all of them).
+    """
+    states = [CompactImage.empty()]
+    for split in ["dev", "test"]:
+        samples = list(get_data("scatter", "flipit", split).values())
+        if num_states is not None:
+            samples = samples[:: len(samples) // num_states]
+        states.extend(
+            CompactImage.from_dicts(sample["structured_rep"]) for sample in samples
+        )
+    return states
+
+
+def check_scatter_actions(monkeypatch, states):
+    results = [apply_actions(img_struct) for img_struct in states]
+
+    # Without the masks: every decision is left to shapely, and no item is pruned by its
+    # bounding box
+    monkeypatch.setattr(utils_occupancy, "check_overlap", lambda obj_a, obj_b: None)
+    monkeypatch.setattr(utils_occupancy, "check_cell_overlap", lambda *args: None)
+    monkeypatch.setattr(utils_occupancy, "find_largest_overlap", lambda *args: None)
+    monkeypatch.setattr(utils_occupancy, "get_bounds_distance", lambda obj_a, obj_b: 0)
+    for img_struct, state_results in zip(states, results):
+        assert apply_actions(img_struct) == state_results
+
+
+def test_scatter_actions(monkeypatch):
+    check_scatter_actions(monkeypatch, get_states(NUM_STATES))
+
+
+@pytest.mark.slow
+def test_scatter_actions_all(monkeypatch):
+    """
+    Every initial state of the Scatter dev and test data (the scratch samples start from
+    the empty image).
+    """
+    check_scatter_actions(monkeypatch, get_states())
@@ -0,0 +1,117 @@
+"""
+The observations rasterized from the structured representation
+(`lilgym.envs.utils_raster`) against the full-resolution image drawn by `draw_on_img`,
+downsampled by averaging its 2x2 blocks of pixels: they should be identical.
+"""
+
+import numpy as np
+import pytest
+
+from lilgym.envs.natural_language_visual_reasoning_env import (
+    NaturalLanguageVisualReasoningEnv,
+)
+from lilgym.envs.utils_image import (
+    BOX_SIZE,
+    SEP_WIDTH,
+    draw_on_img,
+    get_base_image,
+    redraw_box,
+)
+from lilgym.envs.utils_raster import OBS_HEIGHT, OBS_WIDTH, rasterize
+from lilgym.envs.structured_rep_compact import CompactImage
+from lilgym.data.utils import get_data
+
+skimage_measure = pytest.importorskip("skimage.measure")
+
+
+def downsample_drawn_image(img_struct):
+    img = np.array(draw_on_img(get_base_image()[0], img_struct), dtype=np.uint8)
+    observation = np.zeros((OBS_HEIGHT, OBS_WIDTH, 3), dtype=np.uint8)
+    observation[:, :, :] = skimage_measure.block_reduce(img, (2, 2, 1), np.mean)
+    return observation
+
+
+@pytest.mark.parametrize("appearance", ["tower", "scatter"])
+def test_data(appearance):
+    for sample in get_data(appearance, "flipit", "dev").values():
+        img_struct = CompactImage.from_dicts(sample["structured_rep"])
+        assert (rasterize(img_struct) == downsample_drawn_image(img_struct)).all()
+
+
+@pytest.mark.parametrize("appearance", ["tower", "scatter"])
+@pytest.mark.parametrize("starting_condition", ["scratch", "flipit"])
+def test_rollouts(appearance, starting_condition):
+    """
+    The observations of the states of random rollouts, and the full-resolution image
+    kept in the states (keep_image=True) against a full redraw.
+    """
+    env = NaturalLanguageVisualReasoningEnv(
+        appearance, starting_condition, stop_forcing=False, split="dev", keep_image=True
+    )
+    env.seed(0)
+    for _ in range(30):
+        env.reset()
+        for _ in range(10):
+            action = env.action_space.sample()
+            if action.to_array()[0] == 0:
+                continue
+            observation, _, terminated, truncated, _ = env.step(action)
+            state = env.get_state()
+            assert (
+                observation["image"] == downsample_drawn_image(state.img_struct)
+            ).all()
+            redrawn = draw_on_img(get_base_image()[0], state.img_struct)
+            assert (np.array(env.render()) == np.array(redrawn)).all()
+            if terminated or truncated:
+                break
+
+
+def test_state_image():
+    """
+    Without keep_image, the image of the state is drawn when the state is queried.
+    """
+    env = NaturalLanguageVisualReasoningEnv(
+        "scatter", "flipit", stop_forcing=False, split="dev"
+    )
+    env.seed(0)
+    env.reset()
+    for _ in range(10):
+        action = env.action_space.sample()
+        if action.to_array()[0] == 0:
+            continue
+        _, _, terminated, truncated, _ = env.step(action)
+        state = env.get_state()
+        redrawn = draw_on_img(get_base_image()[0], state.img_struct)
+        assert (np.array(state.img) == np.array(redrawn)).all()
+        if terminated or truncated:
+            break
+
+
+def test_scatter_removal():
+    """
+    Removing a Scatter item redraws its box from the base image and the remaining items,
+    as a full redraw. Earlier versions painted the removed item gray, including the part
+    of the separator it was drawn over.
+    """
+    for sample in list(get_data("scatter", "flipit", "dev").values())[:100]:
+        img_struct = CompactImage.from_dicts(sample["structured_rep"])
+        img = draw_on_img(get_base_image()[0], img_struct)
+        for box in range(len(img_struct)):
+            for index, removed_obj in enumerate(img_struct.get_items(box)):
+                removed = img_struct.remove_item(box, index)
+                result = redraw_box(img, removed, box, removed_obj)
+                redrawn = draw_on_img(get_base_image()[0], removed)
+                assert (np.array(result) == np.array(redrawn)).all()
+
+    # A square drawn over the right limit of the first box, next to another item
+    items = [
+        {"x_loc": 40, "y_loc": 40, "type": "square", "size": 30, "color": "Yellow"},
+        {"x_loc": 71, "y_loc": 14, "type": "square", "size": 30, "color": "Black"},
+    ]
+    img_struct = CompactImage.from_dicts([items, [], []])
+    img = draw_on_img(get_base_image()[0], img_struct)
+    removed = img_struct.remove_item(0, 1)
+    result = np.array(redraw_box(img, removed, 0, items[1]))
+    assert (result == np.array(draw_on_img(get_base_image()[0], removed))).all()
+    separator = np.array(get_base_image()[0])[:, BOX_SIZE : BOX_SIZE + SEP_WIDTH]
+    assert (result[:, BOX_SIZE : BOX_SIZE + SEP_WIDTH] == separator).all()
@@ -0,0 +1,123 @@
+"""
+The sampling of the initial states (`lilgym.envs.sampler.Sampler`): each sample is drawn
+once per epoch in the "epoch" mode, and the same seed gives the same stream of samples.
+"""
+
+import numpy as np
+import pytest
+
+from lilgym.envs.natural_language_visual_reasoning_env import (
+    NaturalLanguageVisualReasoningEnv,
+)
+from lilgym.envs.sampler import Sampler
+from lilgym.data.utils import get_data
+
+SAMPLE_IDS = [f"{i}-0" for i in range(37)]
+
+# Weights of the weighted sampling: a third of the samples are never drawn
+WEIGHTS = {k: float(i % 3) for i, k in enumerate(SAMPLE_IDS)}
+
+NUM_DRAWS = 200
+
+
+def draw(sampler, np_random, num_draws=NUM_DRAWS):
+    return [sampler.sample(np_random) for _ in range(num_draws)]
+
+
+def test_epoch():
+    sampler = Sampler(SAMPLE_IDS, "epoch")
+    np_random = np.random.default_rng(0)
+    num_epochs = 4
+    ids = draw(sampler, np_random, num_epochs * len(SAMPLE_IDS))
+    epochs = [
+        ids[i * len(SAMPLE_IDS) : (i + 1) * len(SAMPLE_IDS)] for i in range(num_epochs)
+    ]
+    for epoch in epochs:
+        assert sorted(epoch) == sorted(SAMPLE_IDS)
+    # The epochs are shuffled
+    assert len({tuple(epoch) for epoch in epochs}) == num_epochs
+
+    # Restarting the epoch
+    sampler.reset()
+    epoch = draw(sampler, np_random, len(SAMPLE_IDS) - 1)
+    sampler.reset()
+    assert sorted(draw(sampler, np_random, len(SAMPLE_IDS))) == sorted(SAMPLE_IDS)
+    assert len(set(epoch)) == len(SAMPLE_IDS) - 1
+
+
+def test_env_epoch():
+    """
+    An epoch of the environment goes through the initial states of all the samples.
+    """
+    env = NaturalLanguageVisualReasoningEnv(
+        "tower", "flipit", stop_forcing=False, split="dev", sampling="epoch"
+    )
+    env.reset(seed=0)
+    states = []
+    for _ in range(len(env.get_samples())):
+        state = env.get_state()
+        states.append((state.sentence, state.lf, repr(state.img_struct)))
+        env.reset()
+    assert sorted(states) == sorted(
+        (state.sentence, state.lf, repr(state.img_struct))
+        for state in env.get_samples().values()
+    )
+
+
+def test_weighted():
+    sampler = Sampler(SAMPLE_IDS, "weighted", WEIGHTS)
+    counts = {k: 0 for k in SAMPLE_IDS}
+    for k in draw(sampler, np.random.default_rng(0), 10000):
+        counts[k] += 1
+    for k, weight in WEIGHTS.items():
+        if weight == 0:
+            assert counts[k] == 0
+    # Drawn with probabilities proportional to the weights
+    assert counts[SAMPLE_IDS[2]] > 1.5 * counts[SAMPLE_IDS[1]]
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        Sampler(SAMPLE_IDS, "sequential")
+
+
+@pytest.mark.parametrize("mode", ["uniform", "epoch", "weighted"])
+def test_same_seed(mode):
+    weights = WEIGHTS if mode == "weighted" else None
+    streams = [
+        draw(Sampler(SAMPLE_IDS, mode, weights), np.random.default_rng(seed))
+        for seed in [0, 0, 1]
+    ]
+    assert streams[0] == streams[1]
+    assert streams[0] != streams[2]
+
+
+@pytest.mark.parametrize("mode", ["uniform", "epoch", "weighted"])
+def test_env_same_seed(mode):
+    """
+    Environments reset with the same seed draw the same initial states.
+    """
+    sample_weights = None
+    if mode == "weighted":
+        sample_ids = list(get_data("tower", "flipit", "dev"))
+        sample_weights = {k: 1.0 + i for i, k in enumerate(sample_ids[:10])}
+
+    streams = []
+    for seed in [0, 0, 1]:
+        env = NaturalLanguageVisualReasoningEnv(
+            "tower",
+            "flipit",
+            stop_forcing=False,
+            split="dev",
+            sampling=mode,
+            sample_weights=sample_weights,
+        )
+        env.reset(seed=seed)
+        stream = []
+        for _ in range(20):
+            state = env.get_state()
+            stream.append((state.sentence, state.lf, repr(state.img_struct)))
+            env.reset()
+        streams.append(stream)
+    assert streams[0] == streams[1]
+    assert streams[0] != streams[2]
@@ -0,0 +1,161 @@
+"""
+The relations between the items, looked up in the tables of their box (`BoxRelations`),
+and the geometry computed when the items and boxes are built, against their pairwise
+definitions on random images.
+"""
+
+import pickle
+import random
+
+import pytest
+
+from lilgym.envs import logical_forms
+from lilgym.envs.structured_rep import ALMOST_TOUCHING_MARGIN, Box, Image, Item
+from lilgym.envs.structured_rep_enums import Shape
+
+
+NUM_IMAGES = 3000
+
+
+def get_random_image(rng):
+    boxes = []
+    tower = rng.random() < 0.3
+    for _ in range(3):
+        n = rng.randint(0, 9)
+        if tower:
+            # Towers, with some blocks slightly apart or overlapping
+            items = [
+                {
+                    "x_loc": 40,
+                    "y_loc": 80 - 21 * i + rng.choice([0, 0, 0, 1, -1]),
+                    "type": "square",
+                    "color": "Black",
+                    "size": 20,
+                }
+                for i in range(min(n, 4))
+            ]
+        else:
+            items = [
+                {
+                    "x_loc": rng.randint(0, 90),
+                    "y_loc": rng.randint(0, 90),
+                    "type": rng.choice(["square", "circle", "triangle"]),
+                    "color": rng.choice(["Black", "Yellow"]),
+                    "size": rng.choice([10, 20, 30]),
+                }
+                for _ in range(n)
+            ]
+        boxes.append(items)
+    return Image(boxes)
+
+
+def is_tower(box):
+    return (
+        len(box.items) > 0
+        and all(s.shape == Shape.SQUARE for s in box.items)
+        and all(s.right == box.items[0].right for s in box.items)
+    )
+
+
+def is_touching(a, b, use_margin=False):
+    margin = ALMOST_TOUCHING_MARGIN if use_margin else 1
+    distance = max(
+        a.left - b.right, b.left - a.right, a.bottom - b.top, b.bottom - a.top
+    )
+    return a is not b and a.box is b.box and distance <= margin
+
+
+def is_above(x, item, tower_sense=True):
+    # x is above item
+    return item.top <= x.bottom and (
+        is_touching(item, x) if tower_sense and is_tower(item.box) else True
+    )
+
+
+RELATIONS = {
+    "get_above": lambda x, item: is_above(x, item),
+    "get_below": lambda x, item: is_above(item, x),
+    "get_touching": lambda x, item: is_touching(item, x),
+    "get_closely_touching": lambda x, item: is_touching(item, x, use_margin=True),
+    "get_box_all_above": lambda x, item: is_above(x, item, tower_sense=False),
+    "get_box_all_below": lambda x, item: is_above(item, x, tower_sense=False),
+}
+
+WALLS = {
+    "touching_right": lambda item, margin: item.right >= 100 - margin,
+    "touching_left": lambda item, margin: item.left <= margin,
+    "touching_bottom": lambda item, margin: item.bottom <= margin,
+    "touching_top": lambda item, margin: item.top >= 100 - margin,
+}
+
+
+@pytest.fixture(scope="module")
+def images():
+    rng = random.Random(0)
+    return [get_random_image(rng) for _ in range(NUM_IMAGES)]
+
+
+def test_relations(images):
+    for image in images:
+        items = image.get_all_items()
+        for item in items:
+            related = [x for x in item.box if x is not item]
+            for name, relation in RELATIONS.items():
+                expected = {id(x) for x in related if relation(x, item)}
+                assert {
+                    id(x) for x in getattr(logical_forms, name)(item)
+                } == expected, name
+            tops = [x.top for x in item.box]
+            assert item.is_top() == (item.top == max(tops))
+            assert item.is_bottom() == (item.top == min(tops))
+            for other in items:
+                for use_margin in (False, True):
+                    assert item.is_touching(other, use_margin) == is_touching(
+                        item, other, use_margin
+                    )
+
+
+def test_geometry(images):
+    for image in images:
+        for box in image.get_all_boxes():
+            assert box.is_tower() == is_tower(box)
+            for index, item in enumerate(box):
+                assert item.box is box and item.index == index
+                assert item.right == item.left + item.size.value
+                assert item.bottom == item.top - item.size.value
+                for use_margin in (False, True):
+                    margin = ALMOST_TOUCHING_MARGIN if use_margin else 0
+                    walls = [wall(item, margin) for wall in WALLS.values()]
+                    for name, touching in zip(WALLS, walls):
+                        assert getattr(item, name)(use_margin) == touching
+                    assert item.touching_wall(use_margin) == any(walls)
+                    assert item.touching_corner(use_margin) == (sum(walls) == 2)
+
+
+def test_immutable(images):
+    box = next(box for image in images for box in image.get_all_boxes() if len(box) > 1)
+    with pytest.raises(AttributeError):
+        box.items[0].left = 0
+    with pytest.raises(AttributeError):
+        box.items = []
+
+
+def test_items_belong_to_one_box(images):
+    box = next(box for image in images for box in image.get_all_boxes() if len(box) > 1)
+    with pytest.raises(AssertionError):
+        Box.from_items(box.items[:1])
+    item = Item.from_values(
+        0, 20, box.items[0].color, box.items[0].size, box.items[0].shape
+    )
+    assert Box.from_items([item]).items[0] is item
+
+
+def test_pickle(images):
+    image = images[1]
+    copy = pickle.loads(pickle.dumps(image))
+    assert repr(copy.get_all_items()) == repr(image.get_all_items())
+    assert [box.is_tower() for box in copy.get_all_boxes()] == [
+        box.is_tower() for box in image.get_all_boxes()
+    ]
+    for box in copy.get_all_boxes():
+        assert all(item.box is box for item in box)
@@ -0,0 +1,90 @@
+"""
+The truth tables of the Tower logical forms (`lilgym.envs.truth_tables`): the indices of
+the states, and the tabulated results against the execution of the logical forms, with
+a fallback to the execution for the logical forms which cannot be tabulated.
+"""
+
+import numpy as np
+import pytest
+
+from lilgym.envs.natural_language_visual_reasoning_env import (
+    NaturalLanguageVisualReasoningEnv,
+)
+from lilgym.envs.truth_tables import (
+    NUM_STATES,
+    TruthTables,
+    build_truth_tables,
+    get_img_struct,
+    get_state_index,
+)
+from lilgym.envs.utils import compute_prediction
+from lilgym.data.utils import get_data
+
+LFS = [
+    "exist(filter_obj(all_items, lambda x: is_yellow(x) and is_top(x)))",
+    "count(filter_obj(all_boxes, lambda x: x.is_tower())) == 2",
+]
+# Raises on the empty image, so it cannot be tabulated
+FAILING_LF = "1 / count(all_items) > 0"
+
+
+@pytest.fixture(scope="module")
+def truth_tables(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("truth_tables"))
+    index = build_truth_tables(LFS + [FAILING_LF], path)
+    assert [entry["tabulated"] for entry in index.values()] == [True, True, False]
+    return path
+
+
+def test_state_index():
+    rng = np.random.default_rng(0)
+    for index in [0, NUM_STATES - 1] + rng.integers(NUM_STATES, size=1000).tolist():
+        assert get_state_index(get_img_struct(index)) == index
+    # Not a tower at the standard positions
+    img_struct = get_img_struct(NUM_STATES - 1)
+    box = np.array(img_struct[0])
+    box[0, 0] += 1
+    assert get_state_index(img_struct.replace_box(0, box)) is None
+
+
+def test_predict(truth_tables):
+    tables = TruthTables(truth_tables)
+    rng = np.random.default_rng(0)
+    for index in rng.integers(NUM_STATES, size=300).tolist():
+        img_struct = get_img_struct(index)
+        for lf in LFS:
+            assert tables.predict(img_struct, lf) == compute_prediction(img_struct, lf)
+        assert tables.predict(img_struct, FAILING_LF) is None
+
+
+def test_fallback(truth_tables):
+    """
+    Rollouts with and without the truth tables, over samples whose logical forms are
+    tabulated or not, give the same rewards.
+    """
+    data = get_data("tower", "flipit", "dev")
+    lfs = LFS + [FAILING_LF]
+    data = {
+        k: {**data[k], "lf": lfs[i % len(lfs)]} for i, k in enumerate(list(data)[:30])
+    }
+    envs = [
+        NaturalLanguageVisualReasoningEnv(
+            "tower",
+            "flipit",
+            stop_forcing=False,
+            data=data,
+            flat_actions=True,
+            truth_tables=tables,
+        )
+        for tables in [truth_tables, None]
+    ]
+    envs[0].action_space.seed(0)
+    for example_number in data:
+        for env in envs:
+            env.reset(options={"example_number": example_number})
+        done = False
+        while not done:
+            action = envs[0].action_space.sample(mask=envs[0].action_mask())
+            steps = [env.step(action) for env in envs]
+            assert steps[0][1:4] == steps[1][1:4]
+            done = steps[0][2] or steps[0][3]
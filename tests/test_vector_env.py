@@ -0,0 +1,94 @@
+"""
+The vectorized environment (`lilgym.envs.vector_env`) against N single environments
+given the same samples and actions: the observations, rewards, flags and infos, including
+the final ones of the automatically reset environments, should be the same.
+"""
+
+import numpy as np
+import pytest
+
+from lilgym.envs import LilGymVectorEnv
+from lilgym.envs.natural_language_visual_reasoning_env import (
+    NaturalLanguageVisualReasoningEnv,
+)
+
+NUM_ENVS = 8
+NUM_STEPS = 60
+HORIZON = 8
+
+
+def assert_same_step(vector_step, single_step, i):
+    observations, rewards, terminated, truncated, infos = vector_step
+    observation, reward, single_terminated, single_truncated, info = single_step
+    assert (rewards[i], terminated[i], truncated[i]) == (
+        reward,
+        single_terminated,
+        single_truncated,
+    )
+    if single_terminated or single_truncated:
+        observations, infos = infos["final_observation"][i], infos["final_info"][i]
+        for key in ["accuracy", "accuracy_nosf"]:
+            assert infos[key] == info[key]
+    else:
+        observations = {key: value[i] for key, value in observations.items()}
+        infos = {key: value[i] for key, value in infos.items()}
+    assert (observations["image"] == observation["image"]).all()
+    assert observations["sentence"] == observation["sentence"]
+    assert observations["target"] == observation["target"]
+    for key in ["sentence", "target", "force_stop"]:
+        assert infos[key] == info[key]
+
+
+@pytest.mark.parametrize("appearance", ["tower", "scatter"])
+@pytest.mark.parametrize("starting_condition", ["scratch", "flipit"])
+@pytest.mark.parametrize("stop_forcing", [False, True])
+def test_vector_env(appearance, starting_condition, stop_forcing):
+    vector_env = LilGymVectorEnv(
+        NUM_ENVS,
+        appearance,
+        starting_condition,
+        stop_forcing,
+        split="dev",
+        horizon=HORIZON,
+        seed=0,
+    )
+    envs = [
+        NaturalLanguageVisualReasoningEnv(
+            appearance,
+            starting_condition,
+            stop_forcing,
+            split="dev",
+            horizon=HORIZON,
+        )
+        for _ in range(NUM_ENVS)
+    ]
+    observations, infos = vector_env.reset(seed=0)
+    for i, env in enumerate(envs):
+        observation, _ = env.reset(
+            options={"example_number": infos["example_number"][i]}
+        )
+        assert (observations["image"][i] == observation["image"]).all()
+
+    vector_env.action_space.seed(0)
+    rng = np.random.default_rng(0)
+    num_done = 0
+    for _ in range(NUM_STEPS):
+        actions = np.array(vector_env.action_space.sample())
+        # Mostly adds and removes, so that the episodes are not all stopped at once
+        actions[:, 0] = np.where(
+            rng.random(NUM_ENVS) < 0.1, 0, rng.integers(1, 3, NUM_ENVS)
+        )
+        vector_step = vector_env.step(actions)
+        infos = vector_step[4]
+        for i, env in enumerate(envs):
+            single_step = env.step(actions[i])
+            assert_same_step(vector_step, single_step, i)
+            if single_step[2] or single_step[3]:
+                num_done += 1
+                # The new observation of a reset environment is in the observations
+                observation, _ = env.reset(
+                    options={"example_number": infos["example_number"][i]}
+                )
+                assert (vector_step[0]["image"][i] == observation["image"]).all()
+                assert vector_step[0]["sentence"][i] == observation["sentence"]
+    assert num_done > 0